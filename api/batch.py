@@ -0,0 +1,118 @@
+"""
+Fair scheduling for /simulate/batch.
+Batch items share a fixed number of Gemini slots. When a slot frees up it goes to
+the waiting batch with the fewest items in flight, taking turns between batches
+on ties, so a clinic's 500-photo upload cannot starve a small batch that arrives
+after it. BATCH_CONCURRENCY stays below GEMINI_MAX_CONCURRENCY by default, which
+leaves headroom for interactive requests.
+"""
+
+import os
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional, Tuple
+
+from engine.gemini_client import GEMINI_MAX_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", str(max(1, GEMINI_MAX_CONCURRENCY - 2))))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+# Request body cap; larger batches upload their photos to /images first and send image_id
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+class FairScheduler:
+    """
+    Slot scheduler bound to one event loop, with one FIFO of waiters per batch.
+    Use `async with scheduler.slot(batch_id):` around each item.
+    """
+
+    def __init__(self, slots: int = BATCH_CONCURRENCY):
+        self.slots = slots
+        self._in_flight: Dict[str, int] = {}
+        self._waiters: Dict[str, Deque[Tuple[int, asyncio.Future]]] = {}
+        self._last_grant: Dict[str, int] = {}
+        self._running = 0
+        self._seq = 0
+        self._grants = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._in_flight, self._waiters, self._last_grant, self._running = {}, {}, {}, 0
+        return loop
+
+    @asynccontextmanager
+    async def slot(self, batch_id: str) -> AsyncIterator[None]:
+        await self._acquire(batch_id)
+        try:
+            yield
+        finally:
+            self._release(batch_id)
+
+    async def _acquire(self, batch_id: str) -> None:
+        loop = self._bind_loop()
+        if self._running < self.slots and not self._waiters:
+            self._grant(batch_id)
+            return
+        future = loop.create_future()
+        self._seq += 1
+        self._waiters.setdefault(batch_id, deque()).append((self._seq, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was granted just before the cancellation arrived
+                self._release(batch_id)
+            raise
+
+    def _grant(self, batch_id: str) -> None:
+        self._running += 1
+        self._grants += 1
+        self._in_flight[batch_id] = self._in_flight.get(batch_id, 0) + 1
+        self._last_grant[batch_id] = self._grants
+
+    def _release(self, batch_id: str) -> None:
+        self._running -= 1
+        self._in_flight[batch_id] -= 1
+        if not self._in_flight[batch_id]:
+            del self._in_flight[batch_id]
+        self._dispatch()
+        if batch_id not in self._in_flight and batch_id not in self._waiters:
+            self._last_grant.pop(batch_id, None)
+
+    def _dispatch(self) -> None:
+        """
+        Hand free slots to waiting batches: fewest in-flight items first, then the batch
+        served longest ago, then the oldest waiter.
+        """
+        while self._running < self.slots and self._waiters:
+            batch_id = min(self._waiters, key=lambda b: (
+                self._in_flight.get(b, 0), self._last_grant.get(b, 0), self._waiters[b][0][0]
+            ))
+            waiters = self._waiters[batch_id]
+            _, future = waiters.popleft()
+            if not waiters:
+                del self._waiters[batch_id]
+            if future.cancelled():
+                continue
+            self._grant(batch_id)
+            future.set_result(None)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "slots": self.slots,
+            "running": self._running,
+            "waiting": sum(len(waiters) for waiters in self._waiters.values()),
+            "batches": len(set(self._in_flight) | set(self._waiters)),
+        }
+
+
+# Global scheduler instance
+batch_scheduler = FairScheduler()
@@ -0,0 +1,72 @@
+"""
+Output codec selection for simulation images.
+Photographic results can be returned as WebP or JPEG instead of PNG, chosen
+explicitly on the request or negotiated from the Accept header. Masks are not
+handled here and always stay lossless PNG.
+"""
+
+from typing import Optional
+
+from PIL import Image
+
+from engine.utils import EncodedImage
+from .schemas import OutputFormat
+
+DEFAULT_QUALITY = 85
+
+MIME_TYPES = {
+    OutputFormat.PNG: "image/png",
+    OutputFormat.JPEG: "image/jpeg",
+    OutputFormat.WEBP: "image/webp",
+}
+
+
+def negotiate_output_format(requested: Optional[OutputFormat], accept: Optional[str]) -> OutputFormat:
+    """
+    Pick the output format for result and original images.
+    An explicit request field wins; otherwise the highest-q image type named in the
+    Accept header is used. Wildcards and non-image types fall back to PNG.
+    """
+    if requested is not None:
+        return requested
+    if not accept:
+        return OutputFormat.PNG
+
+    by_mime = {mime: fmt for fmt, mime in MIME_TYPES.items()}
+    candidates = []
+    for position, entry in enumerate(accept.split(",")):
+        parts = [part.strip() for part in entry.split(";")]
+        mime = parts[0].lower()
+        if mime not in by_mime:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            candidates.append((-q, position, by_mime[mime]))
+
+    return min(candidates)[2] if candidates else OutputFormat.PNG
+
+
+def _flatten(image: EncodedImage) -> EncodedImage:
+    """RGB version for lossy formats; transparency (RGBA, LA, P with alpha) is composited onto white."""
+    if image.image.mode in ("RGB", "L"):
+        return image
+    rgba = image.image.convert("RGBA")
+    flat = Image.new("RGB", rgba.size, (255, 255, 255))
+    flat.paste(rgba, mask=rgba.getchannel("A"))
+    return EncodedImage.from_image(flat)
+
+
+def encode_output(image: EncodedImage, output_format: OutputFormat, quality: int = DEFAULT_QUALITY) -> bytes:
+    """Encode an image in the negotiated format (PNG stays lossless and ignores quality)."""
+    if output_format == OutputFormat.PNG:
+        return image.encode('PNG')
+    image = _flatten(image)
+    if output_format == OutputFormat.JPEG:
+        return image.encode('JPEG', quality=quality)
+    return image.encode('WEBP', quality=quality, method=4)
@@ -0,0 +1,123 @@
+"""
+Upload-once image handles for the NuvaFace API.
+A consultation runs several simulations on the same photo; the photo is uploaded
+and decoded once, kept here with its Gemini JPEG payload, and referenced by id.
+"""
+
+import os
+import time
+import uuid
+import threading
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any
+
+from engine.utils import EncodedImage
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+IMAGE_STORE_MAX_MB = int(os.getenv("IMAGE_STORE_MAX_MB", "512"))
+IMAGE_STORE_MAX_ITEMS = int(os.getenv("IMAGE_STORE_MAX_ITEMS", "256"))
+IMAGE_STORE_TTL_S = float(os.getenv("IMAGE_STORE_TTL_S", "1800"))
+
+
+@dataclass
+class StoredImage:
+    """A decoded upload plus the derived payloads reused across simulations."""
+    image_id: str
+    encoded: EncodedImage
+    gemini_bytes: Optional[bytes] = None
+    # Small per-image derived data (e.g. face landmarks), not counted in nbytes
+    derived: Dict[str, Any] = field(default_factory=dict)
+    nbytes: int = 0
+    created_at: float = field(default_factory=time.time)
+    last_access: float = field(default_factory=time.time)
+
+
+class ImageStore:
+    """
+    Bounded LRU of uploaded images.
+    Entries expire TTL seconds after their last use and the least recently used
+    entries are evicted once the item count or the memory budget is exceeded.
+    """
+
+    def __init__(self, max_bytes: int = IMAGE_STORE_MAX_MB * 1024 * 1024,
+                 max_items: int = IMAGE_STORE_MAX_ITEMS, ttl_s: float = IMAGE_STORE_TTL_S):
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, StoredImage]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _estimate_bytes(encoded: EncodedImage, gemini_bytes: Optional[bytes]) -> int:
+        """Approximate memory held by an entry: decoded pixels plus encoded buffers."""
+        width, height = encoded.size
+        pixels = width * height * len(encoded.image.getbands())
+        return pixels + len(encoded.data or b"") + len(gemini_bytes or b"")
+
+    def put(self, encoded: EncodedImage, gemini_bytes: Optional[bytes] = None) -> StoredImage:
+        """Store an image and return its entry (with a fresh image_id)."""
+        nbytes = self._estimate_bytes(encoded, gemini_bytes)
+        if nbytes > self.max_bytes:
+            raise ValueError(f"Image needs {nbytes} bytes, store budget is {self.max_bytes} bytes")
+
+        entry = StoredImage(image_id=uuid.uuid4().hex, encoded=encoded,
+                            gemini_bytes=gemini_bytes, nbytes=nbytes)
+        with self._lock:
+            self._purge_expired(time.time())
+            self._entries[entry.image_id] = entry
+            self._total_bytes += nbytes
+            while len(self._entries) > self.max_items or self._total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted.nbytes
+                logger.info(f"Image store evicted {evicted.image_id} (LRU)")
+        return entry
+
+    def get(self, image_id: str) -> Optional[StoredImage]:
+        """Get an entry and mark it as recently used; None if unknown or expired."""
+        now = time.time()
+        with self._lock:
+            self._purge_expired(now)
+            entry = self._entries.get(image_id)
+            if entry is None:
+                return None
+            entry.last_access = now
+            self._entries.move_to_end(image_id)
+            return entry
+
+    def delete(self, image_id: str) -> bool:
+        """Remove an entry; returns False if it was not present."""
+        with self._lock:
+            entry = self._entries.pop(image_id, None)
+            if entry is None:
+                return False
+            self._total_bytes -= entry.nbytes
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Current usage of the store."""
+        with self._lock:
+            return {
+                "items": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_items": self.max_items,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl_s,
+            }
+
+    def _purge_expired(self, now: float) -> None:
+        # Entries are ordered by last access, so expired ones sit at the front
+        while self._entries:
+            image_id, entry = next(iter(self._entries.items()))
+            if now - entry.last_access < self.ttl_s:
+                break
+            self._entries.popitem(last=False)
+            self._total_bytes -= entry.nbytes
+
+
+# Global store instance
+image_store = ImageStore()
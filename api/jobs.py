@@ -0,0 +1,164 @@
+"""
+Asynchronous simulation jobs for the NuvaFace API.
+Jobs go into a bounded in-process queue served by a fixed pool of workers, so a
+burst of requests is admitted at the rate Gemini can serve it instead of all
+requests starting at once and timing out together. A full queue is reported
+to the caller (HTTP 429) with an estimate of when to retry.
+"""
+
+import os
+import math
+import time
+import uuid
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "32"))
+JOB_TTL_S = float(os.getenv("JOB_TTL_S", "900"))
+# Assumed job duration until real durations have been measured
+JOB_DEFAULT_DURATION_S = 20.0
+
+
+class QueueFullError(Exception):
+    """Raised by JobQueue.submit when no more jobs can be admitted."""
+
+    def __init__(self, retry_after_s: int, queue_length: int):
+        super().__init__(f"Job queue is full ({queue_length} jobs waiting)")
+        self.retry_after_s = retry_after_s
+        self.queue_length = queue_length
+
+
+@dataclass
+class Job:
+    """One queued simulation and, once finished, its outcome."""
+    job_id: str
+    run: Callable[[], Awaitable[Any]]
+    seq: int
+    status: str = "queued"  # queued | running | succeeded | failed
+    result: Any = None
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class JobQueue:
+    """
+    Bounded FIFO of jobs with a fixed number of worker tasks.
+    Finished jobs are kept for JOB_TTL_S seconds so clients can collect results.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_SIZE, ttl_s: float = JOB_TTL_S):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl_s = ttl_s
+        self._jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._submitted = 0
+        self._taken = 0
+        self._avg_duration_s = JOB_DEFAULT_DURATION_S
+
+    def start(self) -> None:
+        """Start the worker tasks on the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._tasks and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Job queue started ({self.workers} workers, {self.max_queued} slots)")
+
+    async def stop(self) -> None:
+        """Cancel the workers; queued jobs are dropped."""
+        if self._loop is not asyncio.get_running_loop():
+            return
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def submit(self, run: Callable[[], Awaitable[Any]]) -> Job:
+        """Enqueue a job; raises QueueFullError when all slots are taken."""
+        if self._queue is None or self._loop is not asyncio.get_running_loop():
+            self.start()
+        self._purge_finished(time.time())
+        job = Job(job_id=uuid.uuid4().hex, run=run, seq=self._submitted)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError(self.retry_after_s(), self._queue.qsize())
+        self._submitted += 1
+        self._jobs[job.job_id] = job
+        return job
+
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._purge_finished(time.time())
+        return self._jobs.get(job_id)
+
+    def position(self, job: Job) -> Optional[int]:
+        """1-based position in the queue, or None once the job has started."""
+        if job.status != "queued":
+            return None
+        return job.seq - self._taken + 1
+
+    def eta_s(self, job: Job) -> float:
+        """Estimated seconds until the job finishes."""
+        if job.status == "queued":
+            waves = math.ceil(self.position(job) / self.workers)
+            return round((waves + 1) * self._avg_duration_s, 1)
+        if job.status == "running":
+            return round(max(0.0, self._avg_duration_s - (time.time() - job.started_at)), 1)
+        return 0.0
+
+    def retry_after_s(self) -> int:
+        """Seconds until a queue slot is expected to free up."""
+        return max(1, math.ceil(self._avg_duration_s / self.workers))
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._queue.get()
+            self._taken += 1
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.result = await job.run()
+                job.status = "succeeded"
+            except HTTPException as e:
+                job.status, job.status_code, job.error = "failed", e.status_code, str(e.detail)
+            except Exception as e:
+                logger.error(f"Job {job.job_id} failed: {e}")
+                job.status, job.status_code, job.error = "failed", 500, str(e)
+            finally:
+                job.finished_at = time.time()
+                # Exponential moving average of job durations for ETAs
+                duration = job.finished_at - job.started_at
+                self._avg_duration_s = 0.8 * self._avg_duration_s + 0.2 * duration
+                job.done.set()
+                self._queue.task_done()
+
+    def _purge_finished(self, now: float) -> None:
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > self.ttl_s]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+# Global job queue instance
+job_queue = JobQueue()
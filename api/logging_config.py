@@ -0,0 +1,146 @@
+"""
+Logging pipeline for the NuvaFace API.
+Request handlers only put records on a bounded in-memory queue; a background
+listener thread formats them as JSON lines (Cloud Logging reads the severity
+field) and writes them out. Chatty debug records are sampled per logger and
+every message is capped in size before it is queued, so multi-megabyte payload
+dumps never reach the formatter or the output stream.
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# --- Configuration ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Share of debug chatter that is kept; per-logger overrides as "api.main=0.1,engine.edit_gemini=0"
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+# Much of the debug output is logged at INFO with one of these prefixes
+DEBUG_PREFIXES = ("DEBUG", "🔍 DEBUG")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse 'logger=rate,logger=rate' into a dict."""
+    rates = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rate = entry.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    Keeps only a sample of debug chatter: DEBUG-level records and INFO records
+    whose message starts with a DEBUG prefix. Warnings and errors always pass.
+    The most specific logger prefix in `rates` wins over the default rate.
+    """
+
+    def __init__(self, default_rate: float = LOG_DEBUG_SAMPLE_RATE, rates: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.default_rate = default_rate
+        self.rates = rates or {}
+
+    def rate_for(self, logger_name: str) -> float:
+        best, best_len = self.default_rate, -1
+        for name, rate in self.rates.items():
+            if (logger_name == name or logger_name.startswith(name + ".")) and len(name) > best_len:
+                best, best_len = rate, len(name)
+        return best
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        if record.levelno > logging.DEBUG and not (isinstance(record.msg, str) and record.msg.startswith(DEBUG_PREFIXES)):
+            return True
+        rate = self.rate_for(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+class TruncatingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that does as little as possible on the calling thread:
+    it caps the message size and never blocks (records are dropped when full).
+    Formatting happens in the listener thread.
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_chars: int = LOG_MAX_MESSAGE_CHARS):
+        super().__init__(log_queue)
+        self.max_chars = max_chars
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        message = record.getMessage()
+        if len(message) > self.max_chars:
+            message = f"{message[:self.max_chars]}... [truncated {len(message) - self.max_chars} chars]"
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg, record.args = message, None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with Cloud Logging's severity field."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "severity": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def configure_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT, stream=None) -> TruncatingQueueHandler:
+    """
+    Route the root logger through the queue and start the writer thread.
+    Safe to call again (e.g. on reload): the previous listener is stopped first.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if log_format == "json" else
+                        logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    handler = TruncatingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    handler.addFilter(DebugSamplingFilter(rates=parse_sample_rates(LOG_SAMPLE_RATES)))
+
+    root = logging.getLogger()
+    # Replace plain stream handlers (basicConfig) and earlier queue handlers; keep others such as pytest's
+    root.handlers = [h for h in root.handlers
+                     if type(h) is not logging.StreamHandler and not isinstance(h, TruncatingQueueHandler)]
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    return handler
+
+
+@atexit.register
+def _flush_logs() -> None:
+    if _listener is not None:
+        _listener.stop()
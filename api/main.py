@@ -11,6 +11,7 @@ load_dotenv()
 
 import time
 import random
+import asyncio
 import logging
 import io
 from io import BytesIO
@@ -18,9 +19,12 @@ import hashlib
 import secrets
 import uuid
 import base64
-from fastapi import FastAPI, HTTPException, status, Response
+import json
+from functools import lru_cache
+from typing import Optional, Callable, List, Tuple
+from fastapi import FastAPI, HTTPException, status, Response, UploadFile, File, Form, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 
@@ -28,9 +32,23 @@ import uvicorn
 from .schemas import (
     SegmentRequest, SegmentResponse, BoundingBox,
     SimulationRequest, SimulationResponse,
-    ProcessingParameters, QualityMetrics,
+    SweepRequest, SweepItemResult, ImageUploadResponse, JobResponse,
+    CombinedSimulationRequest, CombinedSimulationResponse,
+    BatchRequest, BatchItem, BatchItemResult,
+    ProcessingParameters, QualityMetrics, UploadEncoding,
     HealthResponse, ErrorResponse,
-    AreaType
+    AreaType, OutputFormat, CropMode
+)
+from .codecs import negotiate_output_format, encode_output, MIME_TYPES
+from .image_store import image_store, StoredImage
+from .uploads import UploadSizeLimitMiddleware, read_upload, METADATA_HEADER, MAX_UPLOAD_BYTES
+from .jobs import job_queue, Job, QueueFullError
+from .batch import batch_scheduler, BATCH_MAX_ITEMS, BATCH_MAX_BYTES
+from .logging_config import configure_logging
+from .warmup import Warmup, WarmupSkipped
+from .metrics import (
+    PrometheusMiddleware, LoopLagMonitor, metrics_response, observe_stage, observe_payload, record_error,
+    classify_error, GEMINI_IN_FLIGHT, JOB_QUEUE_DEPTH, DEGRADED_RESULTS
 )
 
 # Import engine modules
@@ -38,19 +56,35 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from engine.utils import load_image, image_to_base64, preprocess_image
-from engine.parsing import segment_area, validate_area
+from engine.utils import load_image, image_to_base64, preprocess_image, load_encoded_image, EncodedImage
 # from engine.edit_gemini import generate_gemini_simulation # Not needed - using inline implementation
 from models import get_device, get_cache_info
+from engine.gemini_client import (
+    generate_content, close_gemini_client, warm_up_gemini_client, gemini_api_key, GEMINI_IMAGE_MODEL
+)
+from engine.face_crop import FaceCrop, prepare_face_crop, detect_landmarks, composite_face_crop, face_size_px
+from engine.upload_encoder import encode_for_upload, UploadPayload
+from engine.perceptual_hash import ImageSignature, signature, near_identical, recent_results
+from engine.circuit_breaker import CircuitOpenError, OVERLOAD_MESSAGE
+from engine.gemini_usage import usage_ledger
+from engine.temp_artifacts import temp_artifacts
+
+# Heavy modules (engine.parsing with mediapipe/FaceMesh, google.genai) are imported
+# inside the endpoints that need them to keep cold starts short, see profile_imports.py
+
+# Configure logging (JSON records written by a background thread, see logging_config.py)
+configure_logging()
+logger = logging.getLogger(__name__)
 
-# Direct Gemini Test (inline to avoid import issues)
-import os
-from google import genai
-from google.genai import types
+# Default for requests that do not set crop_mode
+DEFAULT_CROP_MODE = CropMode(os.getenv("GEMINI_CROP_MODE", CropMode.NONE.value))
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+# Seconds between SSE keep-alive comments while a simulation is waiting on Gemini
+SSE_KEEPALIVE_S = float(os.getenv("SSE_KEEPALIVE_S", "15"))
+
+# Combined (multi-area) results whose aspect ratio drifts further than this from the input
+# fail the quality check and are redone as one Gemini call per area
+COMBINED_MAX_ASPECT_DRIFT = float(os.getenv("COMBINED_MAX_ASPECT_DRIFT", "0.02"))
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -61,15 +95,30 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
-# Add CORS middleware
+# Reject oversized binary uploads while they stream in
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_bytes=MAX_UPLOAD_BYTES,
+    paths=["/simulate/filler/binary", "/segment/binary", "/images"],
+)
+# Batches carry many base64 photos, so they get a cap of their own
+app.add_middleware(UploadSizeLimitMiddleware, max_bytes=BATCH_MAX_BYTES, paths=["/simulate/batch"])
+
+# Add CORS middleware (added after the size limits so it wraps them: browsers can read their 413)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[METADATA_HEADER],
 )
 
+# Request count, latency and in-flight requests for /metrics
+app.add_middleware(PrometheusMiddleware, app_name="nuvaface")
+JOB_QUEUE_DEPTH.set_function(lambda: job_queue.depth())
+loop_lag_monitor = LoopLagMonitor(app_name="nuvaface")
+
 # Anti-Cache Middleware for all responses
 @app.middleware("http")
 async def add_anti_cache_headers(request, call_next):
@@ -91,12 +140,51 @@ ui_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__)
 if os.path.exists(ui_path):
     app.mount("/ui", StaticFiles(directory=ui_path, html=True), name="ui")
 
+def _warm_up_segmentation():
+    """Initialize the FaceMesh graph with a dummy segmentation (no face, empty mask)."""
+    from PIL import Image as PILImage
+    from engine.parsing import segment_area
+
+    segment_area(PILImage.new("RGB", (256, 256), (200, 170, 150)), "lips")
+
+async def _warm_up_gemini():
+    try:
+        gemini_api_key()
+    except ValueError as e:
+        raise WarmupSkipped(str(e))
+    await warm_up_gemini_client()
+
+def _warm_up_prompts():
+    """Build each area's prompt once so the prompt code paths are loaded."""
+    for volume_ml in (1.0, 3.0):
+        get_prompt_for_lips(volume_ml)
+        get_prompt_for_chin(volume_ml)
+        get_prompt_for_cheeks(volume_ml)
+        get_prompt_for_botox_forehead(volume_ml)
+
+# Warm-up run in the background after startup; /health/ready reports 503 until it is done
+warmup = Warmup()
+warmup.add("segmentation", _warm_up_segmentation)
+warmup.add("gemini", _warm_up_gemini)
+warmup.add("prompts", _warm_up_prompts)
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting NuvaFace API with Gemini Engine...")
     device = get_device()
     logger.info(f"Local device for segmentation: {device}")
-    # No models to warm up locally for generation
+    job_queue.start()
+    temp_artifacts.start()
+    loop_lag_monitor.start()
+    warmup.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await warmup.stop()
+    await loop_lag_monitor.stop()
+    await job_queue.stop()
+    temp_artifacts.stop()
+    await close_gemini_client()
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
@@ -108,6 +196,24 @@ async def health_check():
         gpu_available=get_device() == "cuda"
     )
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is up and serving requests."""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: 503 until the warm-up has finished."""
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if warmup.ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=warmup.status(),
+    )
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage latency, in-flight calls, errors and payload sizes."""
+    return metrics_response()
+
 @app.post("/segment", response_model=SegmentResponse)
 async def segment_face(request: SegmentRequest):
     """
@@ -115,21 +221,10 @@ async def segment_face(request: SegmentRequest):
     SEGMENTATION POLICY: Only available for lips area.
     Chin, cheeks, forehead use direct calls without segmentation.
     """
+    source = _resolve_image(request.image, request.image_id, request.area.value)
     try:
-        # Only allow segmentation for lips
-        if request.area.value != "lips":
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Segmentation only available for 'lips'. Area '{request.area.value}' uses direct processing without masks."
-            )
-        
-        image = load_image(request.image)
-        processed_image, preprocess_meta = preprocess_image(image, target_size=768, align_face=False)
-        
-        if not validate_area(request.area):
-            raise HTTPException(status_code=400, detail=f"Unsupported area: {request.area}")
-        
-        mask_image, segment_metadata = segment_area(processed_image, request.area)
+        _check_segmentation_area(request.area)
+        mask_image, segment_metadata = _segment_image(source.encoded.image, request.area)
         
         return SegmentResponse(
             mask_png=image_to_base64(mask_image, format='PNG'),
@@ -141,17 +236,399 @@ async def segment_face(request: SegmentRequest):
         logger.error(f"Segmentation error: {e}")
         raise HTTPException(status_code=500, detail=f"Segmentation failed: {str(e)}")
 
+@app.post("/segment/binary")
+async def segment_face_binary(image: UploadFile = File(...), area: AreaType = Form(...)):
+    """
+    Multipart variant of /segment: takes the raw image file and returns the raw mask PNG.
+    bbox, confidence and metadata are sent as JSON in the X-NuvaFace-Metadata header.
+    """
+    _check_segmentation_area(area)
+    image_bytes = await read_upload(image)
+    source = _resolve_image(image_bytes, area=area.value)
+    try:
+        mask_image, segment_metadata = _segment_image(source.encoded.image, area)
+        
+        mask_buffer = BytesIO()
+        mask_image.save(mask_buffer, format='PNG')
+        metadata = {
+            "bbox": BoundingBox(**segment_metadata['bbox']).model_dump(),
+            "confidence": segment_metadata.get('confidence', 1.0),
+            "metadata": segment_metadata,
+        }
+        return Response(
+            content=mask_buffer.getvalue(),
+            media_type="image/png",
+            headers={METADATA_HEADER: json.dumps(metadata, default=str)},
+        )
+    except Exception as e:
+        logger.error(f"Segmentation error: {e}")
+        raise HTTPException(status_code=500, detail=f"Segmentation failed: {str(e)}")
+
+def _check_segmentation_area(area: AreaType):
+    """
+    SEGMENTATION POLICY: Only available for lips area.
+    Chin, cheeks, forehead use direct calls without segmentation.
+    """
+    if area.value != "lips":
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Segmentation only available for 'lips'. Area '{area.value}' uses direct processing without masks."
+        )
+    from engine.parsing import validate_area
+
+    if not validate_area(area):
+        raise HTTPException(status_code=400, detail=f"Unsupported area: {area}")
+
+def _segment_image(image, area: AreaType):
+    """Preprocess an already loaded image and segment the requested area."""
+    from engine.parsing import segment_area
+
+    processed_image, preprocess_meta = preprocess_image(image, target_size=768, align_face=False)
+    with observe_stage("segment", area.value):
+        return segment_area(processed_image, area)
+
+@app.post("/images", response_model=ImageUploadResponse)
+async def upload_image(image: UploadFile = File(...)):
+    """
+    Upload a photo once and get an image_id for repeated simulations and segmentation.
+    The decoded image and its Gemini JPEG payload are kept in a bounded LRU with an idle TTL.
+    """
+    image_bytes = await read_upload(image)
+    try:
+        encoded = load_encoded_image(image_bytes)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {str(e)}")
+    
+    upload = encode_for_upload(encoded.image)
+    try:
+        entry = image_store.put(encoded, gemini_bytes=upload.data)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    entry.derived["upload"] = upload.settings
+    
+    width, height = encoded.size
+    logger.info(f"Stored image {entry.image_id} ({width}x{height}, {entry.nbytes} bytes)")
+    return ImageUploadResponse(image_id=entry.image_id, width=width, height=height, expires_in_s=image_store.ttl_s)
+
+@app.delete("/images/{image_id}", status_code=204)
+async def delete_image(image_id: str):
+    """Release a stored image before its TTL expires."""
+    if not image_store.delete(image_id):
+        raise HTTPException(status_code=404, detail=f"Unknown image_id: {image_id}")
+    return Response(status_code=204)
+
+def _resolve_image(image, image_id: Optional[str] = None, area: Optional[str] = None) -> StoredImage:
+    """
+    Get the request image either from the image store or by decoding the inline data
+    (base64 string or raw upload bytes).
+    Inline images get a transient entry so both paths share the cached Gemini payload logic.
+    """
+    if image_id is not None:
+        entry = image_store.get(image_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail=f"Unknown or expired image_id: {image_id}")
+        return entry
+    try:
+        with observe_stage("decode", area):
+            encoded = load_encoded_image(image)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {str(e)}")
+    observe_payload("request_image", area, len(encoded.data or b""))
+    return StoredImage(image_id="", encoded=encoded)
+
+def _gemini_payload(source: StoredImage) -> UploadPayload:
+    """Gemini upload of the whole photo, encoded once per image."""
+    if source.gemini_bytes is None or "upload" not in source.derived:
+        landmarks = source.derived.get("landmarks")
+        upload = encode_for_upload(source.encoded.image,
+                                   face_px=face_size_px(landmarks) if landmarks is not None else None)
+        source.gemini_bytes = upload.data
+        source.derived["upload"] = upload.settings
+    return UploadPayload(data=source.gemini_bytes, settings=source.derived["upload"])
+
+def _prepare_gemini_input(source: StoredImage, area: str, crop_mode: Optional[CropMode]):
+    """
+    Decide what is sent to Gemini: the whole photo, or a face/area crop at working resolution.
+    Returns (face_crop or None, UploadPayload). Landmarks are detected once per stored image;
+    without a detectable face the whole photo is used.
+    """
+    crop_mode = crop_mode or DEFAULT_CROP_MODE
+    if crop_mode == CropMode.NONE:
+        return None, _observe_upload(_gemini_payload(source), area)
+    
+    image = source.encoded.image
+    if "landmarks" not in source.derived:
+        source.derived["landmarks"] = detect_landmarks(image)
+    landmarks = source.derived["landmarks"]
+    if landmarks is None:
+        logger.warning("No face detected for crop mode - sending the whole photo to Gemini")
+        return None, _observe_upload(_gemini_payload(source), area)
+    
+    face_crop = prepare_face_crop(image, area if crop_mode == CropMode.AREA else None, landmarks=landmarks)
+    upload = encode_for_upload(face_crop.image, face_px=face_size_px(landmarks, face_crop))
+    logger.info(f"Gemini crop ({crop_mode.value}): box {face_crop.box}, sent at {upload.settings.width}x{upload.settings.height}")
+    return face_crop, _observe_upload(upload, area)
+
+def _observe_upload(upload: UploadPayload, area: str) -> UploadPayload:
+    settings = upload.settings
+    observe_payload("gemini_upload", area, settings.bytes)
+    logger.info(f"Gemini upload {settings.width}x{settings.height} (from {settings.source_width}x{settings.source_height}) "
+                f"q{settings.quality}, {settings.bytes} bytes{'' if settings.budget_met else ' - OVER BUDGET'}")
+    return upload
+
+def _upload_encoding(upload: UploadPayload) -> UploadEncoding:
+    return UploadEncoding(**upload.settings.as_dict())
+
 @app.post("/simulate/filler", response_model=SimulationResponse)
-async def simulate_filler(request: SimulationRequest):
+async def simulate_filler(request: SimulationRequest, accept: Optional[str] = Header(default=None)):
     """
     Simulates a filler procedure by calling the Gemini API.
     The 'strength' parameter is interpreted as milliliters (ml).
+    Result and original are encoded as request.output_format, or negotiated from Accept.
+    """
+    output_format = negotiate_output_format(request.output_format, accept)
+    source = _resolve_image(request.image, request.image_id, request.area.value)
+    response = await _simulate_procedure(request, output_format, source)
+    with observe_stage("serialize", request.area.value):
+        body = response.model_dump_json()
+    observe_payload("response_body", request.area.value, len(body))
+    return Response(content=body, media_type="application/json")
+
+@app.post("/simulate/filler/sweep")
+async def simulate_filler_sweep(request: SweepRequest, accept: Optional[str] = Header(default=None)):
     """
-    return await _simulate_procedure(request)
+    Simulates a whole ladder of filler volumes for one image and area.
+    The image is decoded and JPEG-encoded once, all Gemini calls run concurrently
+    and each result is streamed as one NDJSON line (SweepItemResult) as soon as it is ready.
+    """
+    source = _resolve_image(request.image, request.image_id, request.area.value)
+    area = request.area.value
+    face_crop, upload = _prepare_gemini_input(source, area, request.crop_mode)
+    output_format = negotiate_output_format(request.output_format, accept)
+    start_time = time.time()
+    logger.info(f"Sweep request for {area}: {len(request.volumes)} volumes {request.volumes}")
+    
+    async def run_one(volume_ml: float) -> SweepItemResult:
+        try:
+            result = await _generate_result(source, area, volume_ml, face_crop, upload.data)
+            with observe_stage("encode", area):
+                result_data = encode_output(result, output_format, request.quality)
+            observe_payload("result_image", area, len(result_data))
+            return SweepItemResult(
+                volume_ml=volume_ml,
+                result_png=base64.b64encode(result_data).decode('utf-8'),
+                image_format=output_format,
+                request_id=str(uuid.uuid4()),
+                result_hash=hashlib.sha256(result_data).hexdigest(),
+                processing_time_ms=int((time.time() - start_time) * 1000),
+            )
+        except Exception as e:
+            logger.error(f"Sweep item {volume_ml}ml {area} failed: {e}")
+            record_error(e, area)
+            return SweepItemResult(
+                volume_ml=volume_ml,
+                processing_time_ms=int((time.time() - start_time) * 1000),
+                error=str(e),
+            )
+    
+    tasks = [asyncio.create_task(run_one(volume_ml)) for volume_ml in request.volumes]
+    
+    async def stream_results():
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                item = await next_result
+                yield item.model_dump_json() + "\n"
+        finally:
+            # Client went away: do not keep spending Gemini quota on abandoned volumes
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.post("/simulate/batch")
+async def simulate_batch(request: BatchRequest, accept: Optional[str] = Header(default=None)):
+    """
+    Simulates many photos, each with its own area and volume, in one call.
+    Items share the batch scheduler's Gemini slots fairly with other running batches;
+    each item is streamed as one NDJSON line (BatchItemResult) as soon as it is ready,
+    failed items included.
+    """
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch has {len(request.items)} items, at most {BATCH_MAX_ITEMS} are allowed per request",
+        )
+    output_format = negotiate_output_format(request.output_format, accept)
+    batch_id = uuid.uuid4().hex
+    start_time = time.time()
+    logger.info(f"📦 Batch {batch_id[:8]}: {len(request.items)} items")
+    
+    async def run_one(index: int, item: BatchItem) -> BatchItemResult:
+        area = item.area.value
+        outcome = dict(index=index, item_id=item.item_id, area=item.area, volume_ml=item.strength)
+        try:
+            async with batch_scheduler.slot(batch_id):
+                # Decoded in its turn and off the event loop, not all N items up front
+                source = await asyncio.to_thread(_resolve_image, item.image, item.image_id, area)
+                face_crop, upload = _prepare_gemini_input(source, area, item.crop_mode)
+                result = await _generate_result(source, area, item.strength, face_crop, upload.data)
+            with observe_stage("encode", area):
+                result_data = encode_output(result, output_format, request.quality)
+            observe_payload("result_image", area, len(result_data))
+            return BatchItemResult(
+                **outcome,
+                result_png=base64.b64encode(result_data).decode('utf-8'),
+                image_format=output_format,
+                request_id=str(uuid.uuid4()),
+                result_hash=hashlib.sha256(result_data).hexdigest(),
+                processing_time_ms=int((time.time() - start_time) * 1000),
+            )
+        except HTTPException as e:
+            error, status_code = str(e.detail), e.status_code
+        except CircuitOpenError as e:
+            record_error(e, area)
+            error, status_code = OVERLOAD_MESSAGE, 503
+        except Exception as e:
+            logger.error(f"Batch item {index} ({item.strength}ml {area}) failed: {e}")
+            record_error(e, area)
+            error, status_code = f"Simulation failed: {str(e)}", 500
+        return BatchItemResult(
+            **outcome, error=error, status_code=status_code,
+            processing_time_ms=int((time.time() - start_time) * 1000),
+        )
+    
+    tasks = [asyncio.create_task(run_one(index, item)) for index, item in enumerate(request.items)]
+    
+    async def stream_results():
+        failed = 0
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                item = await next_result
+                failed += item.error is not None
+                yield item.model_dump_json() + "\n"
+            logger.info(f"📦 Batch {batch_id[:8]} finished in {time.time() - start_time:.1f}s "
+                        f"({len(tasks) - failed} ok, {failed} failed)")
+        finally:
+            # Client went away: do not keep spending Gemini quota on abandoned items
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson", headers={"X-Batch-ID": batch_id})
+
+@app.post("/simulate/filler/stream")
+async def simulate_filler_stream(request: SimulationRequest, accept: Optional[str] = Header(default=None)):
+    """
+    Server-Sent Events variant of /simulate/filler.
+    Emits one 'stage' event per pipeline stage (decoded, prepared, submitted, received, encoded)
+    with timings, then a 'result' event carrying the SimulationResponse, or an 'error' event.
+    Keep-alive comments are sent while waiting, so proxies do not close the idle connection.
+    """
+    output_format = negotiate_output_format(request.output_format, accept)
+    source = _resolve_image(request.image, request.image_id, request.area.value)
+    start_time = time.time()
+    events: asyncio.Queue = asyncio.Queue()
+    last_stage = [start_time]
+    
+    def report(stage: str):
+        now = time.time()
+        events.put_nowait(("stage", {
+            "stage": stage,
+            "elapsed_ms": int((now - start_time) * 1000),
+            "stage_ms": int((now - last_stage[0]) * 1000),
+        }))
+        last_stage[0] = now
+    
+    async def run():
+        try:
+            response = await _simulate_procedure(request, output_format, source, progress=report)
+            events.put_nowait(("result", response.model_dump(mode="json")))
+        except HTTPException as e:
+            events.put_nowait(("error", {"status_code": e.status_code, "detail": e.detail}))
+    
+    task = asyncio.create_task(run())
+    
+    async def stream_events():
+        try:
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(events.get(), timeout=SSE_KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if event != "stage":
+                    break
+        finally:
+            # Client went away: stop the simulation instead of finishing it for nobody
+            task.cancel()
+    
+    return StreamingResponse(
+        stream_events(),
+        media_type="text/event-stream",
+        headers={"X-Accel-Buffering": "no"},
+    )
+
+@app.post("/jobs/simulate", response_model=JobResponse, status_code=202)
+async def submit_simulation_job(request: SimulationRequest, accept: Optional[str] = Header(default=None)):
+    """
+    Queues a /simulate/filler request and returns immediately with a job id.
+    Poll GET /jobs/{job_id} for the result. When the queue is full the request is
+    rejected with 429 and a Retry-After header instead of piling onto Gemini.
+    """
+    output_format = negotiate_output_format(request.output_format, accept)
+    source = _resolve_image(request.image, request.image_id, request.area.value)
+    try:
+        job = job_queue.submit(lambda: _simulate_procedure(request, output_format, source))
+    except QueueFullError as e:
+        logger.warning(f"🚦 Job queue full ({e.queue_length} waiting) - rejecting with Retry-After {e.retry_after_s}s")
+        raise HTTPException(
+            status_code=429,
+            detail={
+                "message": "Simulation queue is full, please retry later",
+                "queue_length": e.queue_length,
+                "eta_s": e.retry_after_s,
+            },
+            headers={"Retry-After": str(e.retry_after_s)},
+        )
+    logger.info(f"📥 Queued job {job.job_id} at position {job_queue.position(job)}")
+    return _job_response(job)
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_simulation_job(job_id: str, wait: float = Query(default=0, ge=0, le=30)):
+    """
+    Returns the state of a job. With wait > 0 the call long-polls: it returns as soon as
+    the job has finished, or after `wait` seconds with the current state.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job_id: {job_id}")
+    if wait > 0 and not job.done.is_set():
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout=wait)
+        except asyncio.TimeoutError:
+            pass
+    return _job_response(job)
+
+def _job_response(job: Job) -> JobResponse:
+    processing_time_ms = None
+    if job.started_at is not None and job.finished_at is not None:
+        processing_time_ms = int((job.finished_at - job.started_at) * 1000)
+    return JobResponse(
+        job_id=job.job_id,
+        status=job.status,
+        position=job_queue.position(job),
+        eta_s=job_queue.eta_s(job),
+        result=job.result,
+        error=job.error,
+        status_code=job.status_code,
+        processing_time_ms=processing_time_ms,
+    )
 
-async def _simulate_procedure(request: SimulationRequest):
+async def _simulate_procedure(request: SimulationRequest, output_format: OutputFormat, source: StoredImage,
+                              progress: Optional[Callable[[str], None]] = None):
     """
     Handles the simulation by calling the Gemini engine.
+    progress, if given, is called with the name of each finished pipeline stage.
     """
     try:
         start_time = time.time()
@@ -162,49 +639,33 @@ async def _simulate_procedure(request: SimulationRequest):
         logger.info(f"DEBUG: Received simulation request for {request.area} with {volume_ml}ml")
         logger.info(f"DEBUG: Request area value: {request.area.value}")
 
-        # Load original image - use directly like working test (NO preprocessing!)
-        original_image = load_image(request.image)
-        logger.info(f"DEBUG: Loaded original image: {original_image.size}")
-        
-        # Use the working direct Gemini call (same as test endpoint - NO masks, NO preprocessing!)
-        logger.info(f"DEBUG: Calling working direct Gemini with {volume_ml}ml {request.area.value}")
-        result_image = await _direct_gemini_call_working(original_image, float(volume_ml), request.area.value)
-        logger.info(f"DEBUG: Received result image from Gemini: {result_image.size}")
-        
-        # Check if result is identical to input (compare the same images we sent to Gemini)
-        original_bytes = io.BytesIO()
-        result_bytes = io.BytesIO()
-        original_image.save(original_bytes, format='PNG')  # Use original_image like working test!
-        result_image.save(result_bytes, format='PNG')
-        
-        original_data = original_bytes.getvalue()
-        result_data = result_bytes.getvalue()
-        
-        identical = original_data == result_data
-        logger.info(f"DEBUG: Result image is identical to original: {identical}")
-        logger.info(f"DEBUG: Original image bytes: {len(original_data)}")
-        logger.info(f"DEBUG: Result image bytes: {len(result_data)}")
-        # logger.info(f"DEBUG: First 50 bytes original: {original_data[:50]}")
-        # logger.info(f"DEBUG: First 50 bytes result: {result_data[:50]}")
-        
-        if identical:
-            logger.warning(f"WARNING: Gemini returned identical image! Volume was {volume_ml}ml for area {request.area.value}")
-            logger.warning(f"WARNING: This indicates quota/rate limiting or API degradation")
-        else:
-            logger.info(f"SUCCESS: Gemini returned different image (expected behavior)")
+        # Original image - used directly like working test (NO preprocessing!)
+        # The uploaded bytes are kept so a PNG upload can be echoed back without re-encoding
+        original = source.encoded
+        logger.info(f"DEBUG: Loaded original image: {original.size}")
+        with observe_stage("load_image", request.area.value):
+            original.image  # decode now so the stage timings cover it
+        if progress:
+            progress("decoded")
         
-        # --- End of New Gemini Call ---
-
-        # Convert images to base64 for the response
-        result_base64 = image_to_base64(result_image)
-        original_base64 = image_to_base64(original_image)
+        face_crop, upload = _prepare_gemini_input(source, request.area.value, request.crop_mode)
+        if progress:
+            progress("prepared")
+        result = await _generate_result(source, request.area.value, volume_ml, face_crop, upload.data, progress=progress)
+        
+        # Convert images to base64 for the response (each image encoded at most once)
+        with observe_stage("encode", request.area.value):
+            result_data = encode_output(result, output_format, request.quality)
+            result_base64 = base64.b64encode(result_data).decode('utf-8')
+            original_base64 = base64.b64encode(encode_output(original, output_format, request.quality)).decode('utf-8')
+        observe_payload("result_image", request.area.value, len(result_data))
+        if progress:
+            progress("encoded")
         
         # SEGMENTATION POLICY: Only lips have segmentation, all others use direct calls
         # Currently: ALL areas use direct Gemini calls without preprocessing/segmentation
         # This provides maximum natural results for chin/cheeks/forehead treatments
-        from PIL import Image as PILImage
-        empty_mask = PILImage.new('L', original_image.size, 0)  # No segmentation masks
-        mask_base64 = image_to_base64(empty_mask)
+        mask_base64 = _empty_mask_base64(original.size)  # No segmentation masks
         
         # Note: If lip-specific segmentation is needed later, implement here:
         # if request.area.value == "lips":
@@ -218,8 +679,7 @@ async def _simulate_procedure(request: SimulationRequest):
         request_id = str(uuid.uuid4())
         
         # Calculate SHA-256 hash of result image bytes for uniqueness verification
-        result_bytes = base64.b64decode(result_base64)
-        result_hash = hashlib.sha256(result_bytes).hexdigest()
+        result_hash = hashlib.sha256(result_data).hexdigest()
         
         # Log for anti-cache verification
         logger.info(f"🔍 ANTI-CACHE: Request ID: {request_id}")
@@ -230,9 +690,12 @@ async def _simulate_procedure(request: SimulationRequest):
             result_png=result_base64,
             original_png=original_base64,
             mask_png=mask_base64,
+            image_format=output_format,
             params=ProcessingParameters(
-                model="gemini-2.5-flash-image-preview",
-                strength_ml=volume_ml  # Fixed: use strength_ml instead of strength
+                model=GEMINI_IMAGE_MODEL,
+                strength_ml=volume_ml,  # Fixed: use strength_ml instead of strength
+                crop_box=list(face_crop.box) if face_crop else None,
+                upload=_upload_encoding(upload),
             ),
             qc=QualityMetrics(
                 quality_passed=True,
@@ -242,9 +705,269 @@ async def _simulate_procedure(request: SimulationRequest):
             warnings=[],
         )
         
+    except CircuitOpenError as e:
+        record_error(e, request.area.value)
+        raise _overload_error(e)
     except Exception as e:
         logger.error(f"Gemini simulation error: {e}")
+        record_error(e, request.area.value)
+        raise HTTPException(status_code=500, detail=f"Simulation failed: {str(e)}")
+
+@app.post("/simulate/combined", response_model=CombinedSimulationResponse)
+async def simulate_combined(request: CombinedSimulationRequest, accept: Optional[str] = Header(default=None)):
+    """
+    Simulates several areas (e.g. lips + chin) together.
+    All treatments go into one composite prompt and a single Gemini call. If that result fails
+    the quality checks (including a response without an image), the areas are applied one after
+    another, each call editing the previous result. Call errors (overload, rate limit, timeout)
+    are raised as for /simulate: retrying them as several sequential calls would only add load.
+    """
+    output_format = negotiate_output_format(request.output_format, accept)
+    treatments = [(treatment.area.value, treatment.volume_ml) for treatment in request.treatments]
+    label = _combined_label(treatments)
+    source = _resolve_image(request.image, request.image_id, label)
+    
+    # An area crop only covers one area, so combined requests crop to the whole face instead
+    crop_mode = request.crop_mode or DEFAULT_CROP_MODE
+    if crop_mode == CropMode.AREA:
+        crop_mode = CropMode.FACE
+    
+    try:
+        start_time = time.time()
+        original = source.encoded
+        with observe_stage("load_image", label):
+            original.image
+        face_crop, upload = _prepare_gemini_input(source, label, crop_mode)
+        gemini_input = face_crop.image if face_crop else original.image
+        
+        warnings = []
+        strategy = "combined"
+        gemini_calls = 1
+        result = None
+        logger.info(f"DEBUG: Combined simulation for {treatments} in one Gemini call")
+        try:
+            with GEMINI_IN_FLIGHT.track_inprogress(), observe_stage("gemini_call", label):
+                result = await _direct_gemini_call_combined(gemini_input, treatments, img_bytes=upload.data)
+            issues = _combined_quality_issues(gemini_input, result)
+        except Exception as e:
+            if classify_error(e) != "no_image":
+                raise
+            logger.error(f"Combined Gemini call returned no image: {e}")
+            record_error(e, label)
+            issues = [f"combined call returned no image: {e}"]
+        
+        if issues:
+            logger.warning(f"⚠️ Combined result failed quality checks ({'; '.join(issues)}) - falling back to sequential calls")
+            warnings.append(f"Combined result failed quality checks ({'; '.join(issues)}); areas were simulated one after another")
+            strategy = "sequential"
+            result = await _sequential_gemini_calls(gemini_input, treatments, upload.data)
+            gemini_calls += len(treatments)
+        
+        if face_crop is not None:
+            result = EncodedImage.from_image(composite_face_crop(original.image, result.image, face_crop))
+        
+        with observe_stage("encode", label):
+            result_data = encode_output(result, output_format, request.quality)
+            original_data = encode_output(original, output_format, request.quality)
+        observe_payload("result_image", label, len(result_data))
+        
+        request_id = str(uuid.uuid4())
+        result_hash = hashlib.sha256(result_data).hexdigest()
+        logger.info(f"🔍 ANTI-CACHE: Request ID: {request_id}, Result Hash: {result_hash[:16]}...")
+        logger.info(f"Combined simulation {label} finished in {time.time() - start_time:.1f}s "
+                    f"({strategy}, {gemini_calls} Gemini calls)")
+        
+        response = CombinedSimulationResponse(
+            result_png=base64.b64encode(result_data).decode('utf-8'),
+            original_png=base64.b64encode(original_data).decode('utf-8'),
+            mask_png=_empty_mask_base64(original.size),
+            image_format=output_format,
+            params=ProcessingParameters(
+                model=GEMINI_IMAGE_MODEL,
+                strength_ml=sum(volume_ml for _, volume_ml in treatments),
+                crop_box=list(face_crop.box) if face_crop else None,
+                upload=_upload_encoding(upload),
+            ),
+            qc=QualityMetrics(quality_passed=not issues, request_id=request_id, result_hash=result_hash),
+            warnings=warnings,
+            treatments=request.treatments,
+            strategy=strategy,
+            gemini_calls=gemini_calls,
+        )
+    except CircuitOpenError as e:
+        record_error(e, label)
+        raise _overload_error(e)
+    except Exception as e:
+        logger.error(f"Combined simulation error: {e}")
+        record_error(e, label)
         raise HTTPException(status_code=500, detail=f"Simulation failed: {str(e)}")
+    
+    with observe_stage("serialize", label):
+        body = response.model_dump_json()
+    observe_payload("response_body", label, len(body))
+    return Response(content=body, media_type="application/json")
+
+def _combined_label(treatments: List[Tuple[str, float]]) -> str:
+    """Area label for logs, metrics and the usage ledger, e.g. 'lips+chin'."""
+    return "+".join(area for area, _ in treatments)
+
+def _combined_quality_issues(gemini_input, result: EncodedImage) -> List[str]:
+    """
+    Cheap checks on a combined result: it must differ from the input and keep its framing.
+    Gemini occasionally re-crops when asked for several edits at once, which would misalign
+    the before/after comparison.
+    """
+    issues = []
+    if _is_identical(gemini_input, result):
+        issues.append("result identical to input")
+    input_aspect = gemini_input.size[0] / gemini_input.size[1]
+    result_aspect = result.size[0] / result.size[1]
+    if abs(result_aspect - input_aspect) / input_aspect > COMBINED_MAX_ASPECT_DRIFT:
+        issues.append(f"aspect ratio changed from {input_aspect:.3f} to {result_aspect:.3f}")
+    return issues
+
+async def _sequential_gemini_calls(gemini_input, treatments: List[Tuple[str, float]], img_bytes: bytes) -> EncodedImage:
+    """Fallback for combined requests: one Gemini call per area, each editing the previous result."""
+    current_image, current_bytes = gemini_input, img_bytes
+    result = None
+    for area, volume_ml in treatments:
+        logger.info(f"DEBUG: Sequential fallback - {volume_ml}ml {area}")
+        with GEMINI_IN_FLIGHT.track_inprogress(), observe_stage("gemini_call", area):
+            result = await _direct_gemini_call_working(current_image, float(volume_ml), area, img_bytes=current_bytes)
+        current_image, current_bytes = result.image, None
+    return result
+
+@app.post("/simulate/filler/binary")
+async def simulate_filler_binary(
+    image: UploadFile = File(...),
+    area: AreaType = Form(...),
+    strength: float = Form(..., ge=0.0, le=5.0),
+    output_format: Optional[OutputFormat] = Form(default=None),
+    quality: int = Form(default=85, ge=1, le=100),
+    crop_mode: Optional[CropMode] = Form(default=None),
+    accept: Optional[str] = Header(default=None),
+):
+    """
+    Multipart variant of /simulate/filler: takes the raw image file and returns the raw result image
+    (PNG by default, or output_format / the Accept header's preferred image type).
+    params, qc and warnings are sent as JSON in the X-NuvaFace-Metadata header.
+    The original is not echoed back and the mask is omitted, since all areas run without one.
+    """
+    output_format = negotiate_output_format(output_format, accept)
+    image_bytes = await read_upload(image)
+    source = _resolve_image(image_bytes, area=area.value)
+    
+    try:
+        face_crop, upload = _prepare_gemini_input(source, area.value, crop_mode)
+        result = await _generate_result(source, area.value, strength, face_crop, upload.data)
+        with observe_stage("encode", area.value):
+            result_data = encode_output(result, output_format, quality)
+        observe_payload("result_image", area.value, len(result_data))
+        
+        request_id = str(uuid.uuid4())
+        result_hash = hashlib.sha256(result_data).hexdigest()
+        logger.info(f"🔍 ANTI-CACHE: Request ID: {request_id}, Result Hash: {result_hash[:16]}...")
+        
+        metadata = {
+            "params": ProcessingParameters(
+                model=GEMINI_IMAGE_MODEL, strength_ml=strength,
+                crop_box=list(face_crop.box) if face_crop else None,
+                upload=_upload_encoding(upload),
+            ).model_dump(),
+            "qc": QualityMetrics(quality_passed=True, request_id=request_id, result_hash=result_hash).model_dump(),
+            "warnings": [],
+        }
+        return Response(
+            content=result_data,
+            media_type=MIME_TYPES[output_format],
+            headers={METADATA_HEADER: json.dumps(metadata), "Vary": "Accept"},
+        )
+    except CircuitOpenError as e:
+        record_error(e, area.value)
+        raise _overload_error(e)
+    except Exception as e:
+        logger.error(f"Gemini simulation error: {e}")
+        record_error(e, area.value)
+        raise HTTPException(status_code=500, detail=f"Simulation failed: {str(e)}")
+
+def _overload_error(error: CircuitOpenError) -> HTTPException:
+    """Fast-fail response while the Gemini circuit breaker is open."""
+    retry_after_s = max(1, int(error.retry_after_s + 0.5))
+    logger.warning(f"⚡ Gemini circuit open - failing fast (retry in {retry_after_s}s)")
+    return HTTPException(
+        status_code=503,
+        detail={"error": "SERVER_OVERLOAD", "message": OVERLOAD_MESSAGE, "retry_after_s": retry_after_s},
+        headers={"Retry-After": str(retry_after_s)},
+    )
+
+async def _generate_result(source: StoredImage, area: str, volume_ml: float,
+                           face_crop: Optional[FaceCrop], img_bytes: bytes,
+                           progress: Optional[Callable[[str], None]] = None) -> EncodedImage:
+    """
+    Runs the Gemini edit for an already loaded image and logs whether the result changed.
+    With a face crop, only the crop is edited and then blended back into the full-resolution original.
+    """
+    gemini_input = face_crop.image if face_crop else source.encoded.image
+    
+    # Use the working direct Gemini call (same as test endpoint - NO masks, NO preprocessing!)
+    logger.info(f"DEBUG: Calling working direct Gemini with {volume_ml}ml {area}")
+    if progress:
+        progress("submitted")
+    with GEMINI_IN_FLIGHT.track_inprogress(), observe_stage("gemini_call", area):
+        result = await _direct_gemini_call_working(gemini_input, float(volume_ml), area, img_bytes=img_bytes)
+    if progress:
+        progress("received")
+    logger.info(f"DEBUG: Received result image from Gemini: {result.size} ({result.mime_type})")
+    
+    with observe_stage("replay_check", area):
+        _check_degraded(_input_signature(source, face_crop), result, area, volume_ml)
+    
+    if face_crop is not None:
+        result = EncodedImage.from_image(composite_face_crop(source.encoded.image, result.image, face_crop))
+    
+    return result
+
+def _input_signature(source: StoredImage, face_crop: Optional[FaceCrop]) -> ImageSignature:
+    """Perceptual signature of the image sent to Gemini (cached per stored photo)."""
+    if face_crop is not None:
+        return signature(face_crop.image)
+    if "signature" not in source.derived:
+        source.derived["signature"] = signature(source.encoded.image)
+    return source.derived["signature"]
+
+def _check_degraded(input_signature: ImageSignature, result: EncodedImage, area: str, volume_ml: float) -> Optional[str]:
+    """
+    Flags a result that is the input again or a replay of a result returned to an earlier request
+    for another photo (perceptual signatures, one lookup in the recent-results index).
+    Returns the kind or None.
+    """
+    result_signature = signature(result.image)
+    if near_identical(input_signature, result_signature):
+        logger.warning(f"WARNING: Gemini returned identical image! Volume was {volume_ml}ml for area {area}")
+        logger.warning(f"WARNING: This indicates quota/rate limiting or API degradation")
+        DEGRADED_RESULTS.labels(kind="identical_input", area=area).inc()
+        return "identical_input"
+    
+    earlier = recent_results.check_and_add(uuid.uuid4().hex, result_signature, area, volume_ml,
+                                           source=input_signature)
+    if earlier is not None:
+        logger.warning(f"WARNING: Gemini replayed an earlier result ({earlier.volume_ml}ml {earlier.area}, "
+                       f"{time.time() - earlier.created_at:.0f}s ago) for {volume_ml}ml {area}")
+        DEGRADED_RESULTS.labels(kind="replay", area=area).inc()
+        return "replay"
+    
+    logger.info(f"SUCCESS: Gemini returned different image (expected behavior)")
+    return None
+
+def _is_identical(original_image, result: EncodedImage) -> bool:
+    """Whether Gemini's result is the original up to re-encoding and rescaling (perceptual signatures)."""
+    return near_identical(signature(original_image), signature(result.image))
+
+@lru_cache(maxsize=16)
+def _empty_mask_base64(size) -> str:
+    """Base64 PNG of an all-black mask, cached per image size."""
+    from PIL import Image as PILImage
+    return image_to_base64(PILImage.new('L', size, 0))
 
 @app.post("/test/direct-gemini")
 async def test_direct_gemini(request: dict):
@@ -265,24 +988,19 @@ async def test_direct_gemini(request: dict):
         logger.info(f"DEBUG: Direct test - loaded image: {original_image.size}")
         
         # Use the working direct Gemini call for test endpoint (fixed 3.0ml lips)
-        result_image = await _direct_gemini_call_working(original_image, 3.0, "lips")
+        result = await _direct_gemini_call_working(original_image, 3.0, "lips")
         
-        logger.info(f"DEBUG: Direct test - result image: {result_image.size}")
+        logger.info(f"DEBUG: Direct test - result image: {result.size}")
         
         # Einfacher Vergleich
-        original_bytes = BytesIO()
-        result_bytes = BytesIO()
-        original_image.save(original_bytes, format='PNG')
-        result_image.save(result_bytes, format='PNG')
-        
-        identical = original_bytes.getvalue() == result_bytes.getvalue()
+        identical = _is_identical(original_image, result)
         logger.info(f"DEBUG: Direct test - images identical: {identical}")
         
         end_time = time.time()
         
         return {
             "success": True,
-            "result_png": image_to_base64(result_image),
+            "result_png": result.to_base64('PNG'),
             "original_png": image_to_base64(original_image),
             "processing_time_ms": int((end_time - start_time) * 1000),
             "images_identical": identical,
@@ -294,6 +1012,20 @@ async def test_direct_gemini(request: dict):
         logger.error(f"Direct Gemini test error: {e}")
         raise HTTPException(status_code=500, detail=f"Direct test failed: {str(e)}")
 
+@app.get("/usage/gemini")
+async def gemini_usage(recent: int = Query(default=0, ge=0, le=200)):
+    """
+    Gemini cost and latency over the most recent calls: prompt size, tokens,
+    image bytes up/down and wall time, aggregated by area, volume bucket and model.
+    recent > 0 also returns the last raw call records.
+    """
+    return usage_ledger.summary(recent=recent)
+
+@app.get("/usage/temp-artifacts")
+async def temp_artifact_usage():
+    """Files left in the legacy temp directories and how many the cleanup removed."""
+    return temp_artifacts.usage()
+
 @app.get("/debug/api-key")
 async def debug_api_key():
     """Debug endpoint to check API key setup"""
@@ -307,32 +1039,65 @@ async def debug_api_key():
         "environment": "cloud_run"
     }
 
-async def _direct_gemini_call_working(input_image, volume_ml: float, area: str):
-    """Working direct Gemini call - based on successful test endpoint"""
-    import base64
-    from PIL import Image
-    
-    # API Key
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY environment variable not set")
-    
-    # Client initialisieren
-    client = genai.Client(api_key=api_key)
-    
-    # Get the right prompt based on area and volume
+def _encode_for_gemini(input_image) -> bytes:
+    """Encode an image as the JPEG payload sent to Gemini (within the upload budget)."""
+    return encode_for_upload(input_image).data
+
+def get_prompt_for_area(area: str, volume_ml: float) -> str:
+    """Pick the prompt builder for an area."""
     if area == "lips":
-        prompt = get_prompt_for_lips(volume_ml)
+        return get_prompt_for_lips(volume_ml)
     elif area == "chin":
-        prompt = get_prompt_for_chin(volume_ml)
+        return get_prompt_for_chin(volume_ml)
     elif area == "cheeks":
-        prompt = get_prompt_for_cheeks(volume_ml)
+        return get_prompt_for_cheeks(volume_ml)
     elif area == "forehead":
         # Botox behandelt Units, nicht ml - aber wir konvertieren für UI-Konsistenz
-        prompt = get_prompt_for_botox_forehead(volume_ml)
-    else:
-        # Default fallback prompt
-        prompt = f"Perform {area} enhancement with {volume_ml}ml treatment. Show natural, photorealistic results with enhanced volume and definition while keeping all other facial features exactly unchanged."
+        return get_prompt_for_botox_forehead(volume_ml)
+    # Default fallback prompt
+    return f"Perform {area} enhancement with {volume_ml}ml treatment. Show natural, photorealistic results with enhanced volume and definition while keeping all other facial features exactly unchanged."
+
+def get_combined_prompt(treatments: List[Tuple[str, float]]) -> str:
+    """
+    One prompt applying several treatments in a single edit, built from the per-area prompts.
+    Each area prompt says only its own area may change, so the header widens that to all listed areas.
+    """
+    areas = [area.upper() for area, _ in treatments]
+    sections = [
+        f"=== TREATMENT {i} OF {len(treatments)}: {area.upper()} ===\n{get_prompt_for_area(area, volume_ml)}"
+        for i, (area, volume_ml) in enumerate(treatments, start=1)
+    ]
+    return f"""Perform a COMBINED aesthetic treatment plan in ONE edit of this photo: {", ".join(areas)}.
+Apply ALL {len(treatments)} treatments below together to the same face, each with its own volume and instructions.
+
+COMBINED TREATMENT RULES:
+- Every listed treatment must be visible in the single result image
+- Where a section says only its own area changes, read it as: ONLY the areas {", ".join(areas)} change
+- Treatments must blend naturally with each other - one coherent, photorealistic face
+- CRITICAL: Keep EXACT same face position, angle, framing, background and lighting as input
+- CRITICAL: Do NOT center, crop, or reposition the face
+- Keep all facial features outside the listed areas exactly unchanged
+
+""" + "\n\n".join(sections)
+
+async def _direct_gemini_call_combined(input_image, treatments: List[Tuple[str, float]],
+                                       img_bytes: Optional[bytes] = None) -> EncodedImage:
+    """Single Gemini call for several (area, volume) treatments with the composite prompt."""
+    total_ml = sum(volume_ml for _, volume_ml in treatments)
+    return await _direct_gemini_call_working(
+        input_image, total_ml, _combined_label(treatments), img_bytes=img_bytes,
+        prompt=get_combined_prompt(treatments),
+    )
+
+async def _direct_gemini_call_working(input_image, volume_ml: float, area: str, img_bytes: Optional[bytes] = None,
+                                      prompt: Optional[str] = None) -> EncodedImage:
+    """Working direct Gemini call - based on successful test endpoint"""
+    import base64
+    from google.genai import types
+    
+    # Get the right prompt based on area and volume (combined calls pass their composite prompt)
+    if prompt is None:
+        prompt = get_prompt_for_area(area, volume_ml)
     
     # ChatGPT's Anti-Cache Enhancement: Add Random Token to prompt
     import secrets
@@ -345,14 +1110,9 @@ async def _direct_gemini_call_working(input_image, volume_ml: float, area: str):
     logger.info(f"🔍 DEBUG: Using working direct call for {volume_ml}ml {area}")
     logger.info(f"🔍 DEBUG: Input image size: {input_image.size}")
     
-    # Bild in JPEG konvertieren (für bessere Kompatibilität)
-    if input_image.mode != 'RGB':
-        input_image = input_image.convert('RGB')
-    
-    # Bild zu Bytes
-    img_buffer = BytesIO()
-    input_image.save(img_buffer, format='JPEG', quality=95)
-    img_bytes = img_buffer.getvalue()
+    # Bild zu Bytes (callers running several calls on one photo pass the bytes in once)
+    if img_bytes is None:
+        img_bytes = _encode_for_gemini(input_image)
     
     try:
         logger.info(f"🔍 DEBUG: Calling Gemini 2.5 Flash Image directly...")
@@ -375,8 +1135,9 @@ async def _direct_gemini_call_working(input_image, volume_ml: float, area: str):
         optimized_top_p = 0.85  # Slightly lower for better geometric control
         
         # Gemini-Call mit Image-Response (working version) - ENHANCED CONFIG
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-image-preview", 
+        # Shared async client: does not block the event loop, bounded by GEMINI_MAX_CONCURRENCY
+        response = await generate_content(
+            model=GEMINI_IMAGE_MODEL,
             contents=[content],
             config=types.GenerateContentConfig(
                 response_modalities=[types.Modality.TEXT, types.Modality.IMAGE],
@@ -384,7 +1145,9 @@ async def _direct_gemini_call_working(input_image, volume_ml: float, area: str):
                 top_p=optimized_top_p,  # Optimized top_p for geometric precision
                 # Note: Gemini doesn't support seeds directly, but we log it for tracking
                 seed=None,  # Explicitly no seed caching
-            )
+            ),
+            area=area,
+            volume_ml=volume_ml,
         )
         
         logger.info(f"🎛️ OPTIMIZED PARAMETERS: temp={optimized_temperature}, top_p={optimized_top_p}")
@@ -443,14 +1206,16 @@ async def _direct_gemini_call_working(input_image, volume_ml: float, area: str):
         else:
             raise Exception(f"Unexpected image data type: {type(image_data)}")
         
-        # Bytes zu PIL Image
-        result_image = Image.open(BytesIO(image_bytes))
+        # Keep Gemini's encoded bytes; pixels are only decoded if a caller needs them
+        result = EncodedImage(data=image_bytes, mime_type=image_part.inline_data.mime_type)
         
-        logger.info(f"🔍 DEBUG: Result image size: {result_image.size}")
+        logger.info(f"🔍 DEBUG: Result image size: {result.size}")
         logger.info(f"✅ Working direct Gemini call completed successfully!")
         
-        return result_image
+        return result
         
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.error(f"❌ ERROR: Working Gemini call failed: {e}")
         raise Exception(f"Working Gemini call failed: {e}")
@@ -779,14 +1544,7 @@ async def _direct_gemini_test_inline(input_image):
     """Inline direct Gemini test to avoid import issues"""
     import base64
     from PIL import Image
-    
-    # API Key prüfen
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY environment variable not set")
-    
-    # Client initialisieren
-    client = genai.Client(api_key=api_key)
+    from google.genai import types
     
     # Fester Test-Prompt für 3.0ml Lip Enhancement mit Position-Lock
     prompt = """Perform major lip enhancement with 3ml hyaluronic acid.
@@ -819,14 +1577,8 @@ POSITION & TECHNICAL REQUIREMENTS:
     logger.info(f"🔍 DEBUG: Using inline test prompt for 3.0ml lips")
     logger.info(f"🔍 DEBUG: Input image size: {input_image.size}")
     
-    # Bild in JPEG konvertieren (für bessere Kompatibilität)
-    if input_image.mode != 'RGB':
-        input_image = input_image.convert('RGB')
-    
-    # Bild zu Bytes
-    img_buffer = BytesIO()
-    input_image.save(img_buffer, format='JPEG', quality=95)
-    img_bytes = img_buffer.getvalue()
+    # Bild zu Bytes (gleicher Encoder wie die App)
+    img_bytes = _encode_for_gemini(input_image)
     
     try:
         logger.info(f"🔍 DEBUG: Calling Gemini 2.5 Flash Image directly...")
@@ -840,13 +1592,15 @@ POSITION & TECHNICAL REQUIREMENTS:
         )
         
         # Gemini-Call mit Image-Response
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-image-preview", 
+        response = await generate_content(
+            model=GEMINI_IMAGE_MODEL,
             contents=[content],
             config=types.GenerateContentConfig(
                 response_modalities=[types.Modality.TEXT, types.Modality.IMAGE],
                 temperature=0.3,
-            )
+            ),
+            area="lips",
+            volume_ml=3.0,
         )
         
         logger.info(f"✅ Gemini call successful!")
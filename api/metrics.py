@@ -0,0 +1,178 @@
+"""
+Prometheus metrics for the NuvaFace API.
+Per-stage latency histograms, in-flight gauges, error counters and payload sizes,
+labelled by treatment area, plus an ASGI middleware for request-level metrics
+and an event-loop lag monitor. The risk map API (backend/risk_map/app.py) uses the
+same request metrics. Exposed at GET /metrics.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Optional
+
+from fastapi import Response
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# How often the event loop is probed for lag (0 disables the monitor)
+LOOP_LAG_INTERVAL_S = float(os.getenv("LOOP_LAG_INTERVAL_S", "0.25"))
+
+# Gemini calls take 10-40 s, local stages milliseconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90)
+SIZE_BUCKETS = tuple(2 ** exponent for exponent in range(10, 26))  # 1 KB .. 32 MB
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# --- HTTP (NuvaFace and risk map API, told apart by the app label) ---
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route and status", ["app", "method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["app", "method", "route"], buckets=LATENCY_BUCKETS
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served", ["app"])
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "How late the event loop woke up for a timer (blocking code in async handlers)",
+    ["app"], buckets=LAG_BUCKETS,
+)
+
+# --- Simulation pipeline ---
+STAGE_LATENCY = Histogram(
+    "nuvaface_stage_duration_seconds",
+    "Latency of one pipeline stage (decode, load_image, segment, gemini_call, encode, serialize)",
+    ["stage", "area"],
+    buckets=LATENCY_BUCKETS,
+)
+PAYLOAD_BYTES = Histogram(
+    "nuvaface_payload_bytes", "Image and response payload sizes", ["kind", "area"], buckets=SIZE_BUCKETS
+)
+ERRORS = Counter("nuvaface_errors_total", "Simulation errors by type", ["type", "area"])
+GEMINI_IN_FLIGHT = Gauge("nuvaface_gemini_calls_in_flight", "Gemini calls currently waiting for a response")
+JOB_QUEUE_DEPTH = Gauge("nuvaface_job_queue_depth", "Jobs waiting in the /jobs queue")
+DEGRADED_RESULTS = Counter(
+    "nuvaface_gemini_degraded_results_total",
+    "Gemini results that repeat the input (identical_input) or an earlier request's result (replay)",
+    ["kind", "area"],
+)
+
+
+@contextmanager
+def observe_stage(stage: str, area: Optional[str] = None):
+    """Time a block as one pipeline stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(stage=stage, area=area or "none").observe(time.perf_counter() - start)
+
+
+def observe_payload(kind: str, area: Optional[str], nbytes: int) -> None:
+    PAYLOAD_BYTES.labels(kind=kind, area=area or "none").observe(nbytes)
+
+
+def classify_error(error: Exception) -> str:
+    """Map a simulation error to a small set of error types."""
+    message = str(error)
+    if "REGIONAL_RESTRICTION" in message or "Regional restriction" in message:
+        return "regional_restriction"
+    if "SERVER_OVERLOAD" in message or "overloaded" in message.lower():
+        return "overload"
+    if "No image data" in message or "No response content" in message:
+        return "no_image"
+    if "timeout" in message.lower() or "timed out" in message.lower():
+        return "timeout"
+    if "RESOURCE_EXHAUSTED" in message or "429" in message or "quota" in message.lower():
+        return "quota"
+    return "other"
+
+
+def record_error(error: Exception, area: Optional[str] = None) -> None:
+    ERRORS.labels(type=classify_error(error), area=area or "none").inc()
+
+
+def metrics_response() -> Response:
+    """Current metrics in the Prometheus text format."""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+class PrometheusMiddleware:
+    """
+    ASGI middleware recording request count, latency and in-flight requests.
+    Routes are labelled by their path template (/jobs/{job_id}), not the raw path.
+    """
+
+    def __init__(self, app, app_name: str = "nuvaface"):
+        self.app = app
+        self.app_name = app_name
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels(app=self.app_name)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_LATENCY.labels(app=self.app_name, method=scope["method"], route=route).observe(
+                time.perf_counter() - start
+            )
+            HTTP_REQUESTS.labels(
+                app=self.app_name, method=scope["method"], route=route, status=str(status[0])
+            ).inc()
+
+
+class LoopLagMonitor:
+    """
+    Sleeps for interval_s in a loop and records how much later than requested it woke up.
+    Anything that blocks the event loop (sync I/O, CPU work in an async handler) shows up as lag.
+    """
+
+    def __init__(self, app_name: str = "nuvaface", interval_s: float = LOOP_LAG_INTERVAL_S):
+        self.app_name = app_name
+        self.interval_s = interval_s
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self.interval_s <= 0 or (self._loop is loop and self._task is not None and not self._task.done()):
+            return
+        self._loop = loop
+        self._task = loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        histogram = EVENT_LOOP_LAG.labels(app=self.app_name)
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval_s)
+            lag = loop.time() - start - self.interval_s
+            histogram.observe(max(0.0, lag))
+            if lag > 1.0:
+                logger.warning(f"⚠️ Event loop blocked for {lag:.2f}s")
+
+    async def stop(self) -> None:
+        if self._task is None or self._loop is not asyncio.get_running_loop():
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
@@ -2,8 +2,8 @@
 Pydantic models for API request/response schemas for the Gemini-powered NuvaFace API.
 """
 
-from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any, List
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, Dict, Any, List, Annotated
 from enum import Enum
 
 class AreaType(str, Enum):
@@ -13,20 +13,90 @@ class AreaType(str, Enum):
     CHEEKS = "cheeks"
     FOREHEAD = "forehead"
 
+class OutputFormat(str, Enum):
+    """Image codecs available for result and original images."""
+    PNG = "png"
+    JPEG = "jpeg"
+    WEBP = "webp"
+
+class CropMode(str, Enum):
+    """What part of the photo is sent to Gemini."""
+    NONE = "none"  # Whole photo
+    FACE = "face"  # Padded face box, composited back into the original
+    AREA = "area"  # Padded box around the treatment area, composited back into the original
+
 # --- Request Models ---
 
-class SegmentRequest(BaseModel):
+class ImageSource(BaseModel):
+    """Base for requests taking either inline pixels or a stored image handle."""
+    image: Optional[str] = Field(default=None, description="Base64 encoded image")
+    image_id: Optional[str] = Field(default=None, description="Handle returned by POST /images, instead of image")
+
+    @model_validator(mode="after")
+    def _exactly_one_image_source(self):
+        if (self.image is None) == (self.image_id is None):
+            raise ValueError("Provide exactly one of 'image' or 'image_id'")
+        return self
+
+class SegmentRequest(ImageSource):
     """Request model for face segmentation endpoint."""
-    image: str = Field(..., description="Base64 encoded image")
     area: AreaType = Field(..., description="Facial area to segment")
 
-class SimulationRequest(BaseModel):
+class SimulationRequest(ImageSource):
     """Request model for a Gemini-powered aesthetic simulation."""
-    image: str = Field(..., description="Base64 encoded image")
     area: AreaType = Field(..., description="Facial area to modify")
     strength: float = Field(..., ge=0.0, le=5.0, description="Effect strength in milliliters (ml), e.g., 0.0 to 5.0")
     mask: Optional[str] = Field(default=None, description="Optional base64 mask for UX display")
     seed: Optional[int] = Field(default=None, description="Seed (not currently used by Gemini engine but kept for schema consistency)")
+    output_format: Optional[OutputFormat] = Field(default=None, description="Codec for result and original images; negotiated from the Accept header (default PNG) if omitted")
+    crop_mode: Optional[CropMode] = Field(default=None, description="Send only the face/area crop to Gemini and blend it back (default from GEMINI_CROP_MODE)")
+    quality: int = Field(default=85, ge=1, le=100, description="Quality for lossy output formats (JPEG/WebP)")
+
+class SweepRequest(ImageSource):
+    """Request model for a volume sweep over one image and area."""
+    area: AreaType = Field(..., description="Facial area to modify")
+    volumes: List[Annotated[float, Field(ge=0.0, le=5.0)]] = Field(
+        ..., min_length=1, max_length=21,
+        description="Volumes in milliliters (ml) to simulate, e.g. [0.5, 1.0, 1.5, 2.0]"
+    )
+    output_format: Optional[OutputFormat] = Field(default=None, description="Codec for result images; negotiated from the Accept header (default PNG) if omitted")
+    crop_mode: Optional[CropMode] = Field(default=None, description="Send only the face/area crop to Gemini and blend it back (default from GEMINI_CROP_MODE)")
+    quality: int = Field(default=85, ge=1, le=100, description="Quality for lossy output formats (JPEG/WebP)")
+
+class BatchItem(ImageSource):
+    """One photo of a batch simulation with its own area and volume."""
+    item_id: Optional[str] = Field(default=None, description="Client reference echoed in the result, e.g. a file name")
+    area: AreaType = Field(..., description="Facial area to modify")
+    strength: float = Field(..., ge=0.0, le=5.0, description="Effect strength in milliliters (ml), e.g., 0.0 to 5.0")
+    crop_mode: Optional[CropMode] = Field(default=None, description="Send only the face/area crop to Gemini and blend it back (default from GEMINI_CROP_MODE)")
+
+class BatchRequest(BaseModel):
+    """Request model for simulating many photos in one call (at most BATCH_MAX_ITEMS)."""
+    items: List[BatchItem] = Field(..., min_length=1, description="Photos with per-item area and volume")
+    output_format: Optional[OutputFormat] = Field(default=None, description="Codec for result images; negotiated from the Accept header (default PNG) if omitted")
+    quality: int = Field(default=85, ge=1, le=100, description="Quality for lossy output formats (JPEG/WebP)")
+
+class AreaVolume(BaseModel):
+    """One treatment of a combined simulation."""
+    area: AreaType = Field(..., description="Facial area to modify")
+    volume_ml: float = Field(..., ge=0.0, le=5.0, description="Volume in milliliters (ml) for this area")
+
+class CombinedSimulationRequest(ImageSource):
+    """Request model for several areas simulated together in one Gemini call."""
+    treatments: List[AreaVolume] = Field(
+        ..., min_length=2, max_length=len(AreaType),
+        description="Areas and volumes to combine, e.g. [{\"area\": \"lips\", \"volume_ml\": 1.0}, {\"area\": \"chin\", \"volume_ml\": 2.0}]"
+    )
+    output_format: Optional[OutputFormat] = Field(default=None, description="Codec for result and original images; negotiated from the Accept header (default PNG) if omitted")
+    crop_mode: Optional[CropMode] = Field(default=None, description="Send only the face crop to Gemini and blend it back (default from GEMINI_CROP_MODE; 'area' is treated as 'face')")
+    quality: int = Field(default=85, ge=1, le=100, description="Quality for lossy output formats (JPEG/WebP)")
+
+    @model_validator(mode="after")
+    def _unique_areas(self):
+        areas = [treatment.area for treatment in self.treatments]
+        if len(set(areas)) != len(areas):
+            raise ValueError("Each area may appear only once in 'treatments'")
+        return self
 
 # --- Response Models ---
 
@@ -44,10 +114,24 @@ class SegmentResponse(BaseModel):
     metadata: Dict[str, Any] = Field(..., description="Segmentation metadata")
     confidence: float = Field(..., ge=0, le=1, description="Detection confidence")
 
+class UploadEncoding(BaseModel):
+    """Resolution and JPEG quality chosen for the image uploaded to Gemini."""
+    width: int = Field(..., description="Width of the uploaded image")
+    height: int = Field(..., description="Height of the uploaded image")
+    source_width: int = Field(..., description="Width before downscaling (photo or face crop)")
+    source_height: int = Field(..., description="Height before downscaling (photo or face crop)")
+    scale: float = Field(..., description="width / source_width")
+    quality: int = Field(..., description="JPEG quality")
+    bytes: int = Field(..., description="Size of the JPEG payload")
+    budget_met: bool = Field(..., description="False if the payload is over GEMINI_UPLOAD_MAX_BYTES at the lowest allowed quality and size")
+    face_px: Optional[int] = Field(default=None, description="Shorter side of the face in the uploaded image, if a face was detected")
+
 class ProcessingParameters(BaseModel):
     """Simplified processing parameters for Gemini response."""
     model: str = Field(default="gemini-1.5-flash-latest", description="Model used for generation")
     strength_ml: float = Field(..., description="Volume in milliliters")
+    crop_box: Optional[List[int]] = Field(default=None, description="Face/area crop sent to Gemini as [x1, y1, x2, y2], if any")
+    upload: Optional[UploadEncoding] = Field(default=None, description="How the Gemini input was encoded")
 
 class QualityMetrics(BaseModel):
     """Simplified quality metrics for Gemini response."""
@@ -59,15 +143,70 @@ class QualityMetrics(BaseModel):
 
 class SimulationResponse(BaseModel):
     """Response model for aesthetic simulation."""
-    result_png: str = Field(..., description="Base64 encoded result image")
-    original_png: str = Field(..., description="Base64 encoded original for comparison")
-    mask_png: str = Field(..., description="Base64 encoded mask used for UX")
+    result_png: str = Field(..., description="Base64 encoded result image (encoded as image_format)")
+    original_png: str = Field(..., description="Base64 encoded original for comparison (encoded as image_format)")
+    mask_png: str = Field(..., description="Base64 encoded mask used for UX (always PNG)")
+    image_format: OutputFormat = Field(default=OutputFormat.PNG, description="Codec of result_png and original_png")
     params: ProcessingParameters = Field(..., description="Processing parameters")
     qc: QualityMetrics = Field(..., description="Quality control metrics")
     warnings: List[str] = Field(default_factory=list)
 
+class CombinedSimulationResponse(SimulationResponse):
+    """Response model for a combined simulation."""
+    treatments: List[AreaVolume] = Field(..., description="Treatments applied, in request order")
+    strategy: str = Field(..., description="'combined' for a single Gemini call, 'sequential' if it fell back to one call per area")
+    gemini_calls: int = Field(..., description="Number of Gemini calls made for this result")
+
+class SweepItemResult(BaseModel):
+    """One volume of a sweep, streamed as a single NDJSON line when it completes."""
+    volume_ml: float = Field(..., description="Volume in milliliters for this result")
+    result_png: Optional[str] = Field(default=None, description="Base64 encoded result image (encoded as image_format)")
+    image_format: OutputFormat = Field(default=OutputFormat.PNG, description="Codec of result_png")
+    request_id: Optional[str] = Field(default=None, description="Unique request ID for anti-cache validation")
+    result_hash: Optional[str] = Field(default=None, description="SHA-256 hash of result image")
+    processing_time_ms: int = Field(..., description="Time from sweep start until this result was ready")
+    error: Optional[str] = Field(default=None, description="Error message if this volume failed")
+
+class BatchItemResult(BaseModel):
+    """One NDJSON line of a batch simulation stream."""
+    index: int = Field(..., description="Position of the item in the request")
+    item_id: Optional[str] = Field(default=None, description="Client reference from the request item")
+    area: AreaType
+    volume_ml: float
+    result_png: Optional[str] = Field(default=None, description="Base64 encoded result image (encoded as image_format)")
+    image_format: OutputFormat = Field(default=OutputFormat.PNG, description="Codec of result_png")
+    request_id: Optional[str] = Field(default=None, description="Unique request ID for anti-cache validation")
+    result_hash: Optional[str] = Field(default=None, description="SHA-256 hash of result image")
+    processing_time_ms: int = Field(..., description="Time from batch start until this result was ready")
+    error: Optional[str] = Field(default=None, description="Error message if this item failed")
+    status_code: Optional[int] = Field(default=None, description="HTTP status /simulate/filler would have returned on failure")
+
+class ImageUploadResponse(BaseModel):
+    """Response model for a stored image handle."""
+    image_id: str = Field(..., description="Handle to pass as image_id to /simulate/filler, /segment and the sweep")
+    width: int
+    height: int
+    expires_in_s: float = Field(..., description="Seconds of inactivity after which the handle expires")
+
 # --- Status and Health Models ---
 
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+class JobResponse(BaseModel):
+    """State of an asynchronous simulation job."""
+    job_id: str
+    status: JobStatus
+    position: Optional[int] = Field(default=None, description="1-based position in the queue while queued")
+    eta_s: Optional[float] = Field(default=None, description="Estimated seconds until the job finishes")
+    result: Optional[SimulationResponse] = Field(default=None, description="Simulation result once succeeded")
+    error: Optional[str] = Field(default=None, description="Error message if the job failed")
+    status_code: Optional[int] = Field(default=None, description="HTTP status the synchronous endpoint would have returned on failure")
+    processing_time_ms: Optional[int] = Field(default=None, description="Time the job spent running")
+
 class HealthResponse(BaseModel):
     """Health check response."""
     status: str
@@ -0,0 +1,83 @@
+"""
+Binary upload handling for the NuvaFace API.
+Enforces a maximum request body size while the body is still streaming in,
+so oversized uploads are rejected before they are fully buffered.
+"""
+
+import os
+from typing import Iterable
+
+from fastapi import HTTPException, UploadFile
+
+# --- Configuration ---
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+
+# Response header carrying JSON metadata next to a raw image body
+METADATA_HEADER = "X-NuvaFace-Metadata"
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Upload exceeds maximum size of {max_bytes // (1024 * 1024)} MB"
+    )
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware limiting the request body size on selected paths.
+    Requests announcing a larger Content-Length are rejected up front; chunked
+    bodies are counted as they arrive and aborted as soon as the limit is crossed.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES, paths: Iterable[str] = ()):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised inside body parsing; FastAPI re-raises HTTPExceptions as-is
+                    raise _too_large(self.max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send):
+        body = f'{{"detail":"{_too_large(self.max_bytes).detail}"}}'.encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+async def read_upload(upload: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """Read an uploaded file into memory, rejecting empty or oversized uploads."""
+    data = await upload.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise _too_large(max_bytes)
+    if not data:
+        raise HTTPException(status_code=400, detail="Uploaded image is empty")
+    return data
@@ -0,0 +1,118 @@
+"""
+Startup warm-up and readiness for the NuvaFace API.
+Warm-up steps (FaceMesh graph, Gemini connection pool, prompt/knowledge data)
+run in the background after startup so the first real request does not pay
+for them. Liveness only says the process is up; readiness turns true once the
+warm-up has finished, so the load balancer routes traffic to warm instances only.
+The risk map API (backend/risk_map/app.py) uses the same module.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+# Comma-separated step names to run; empty runs every registered step
+WARMUP_STEPS = os.getenv("WARMUP_STEPS", "")
+WARMUP_STEP_TIMEOUT_S = float(os.getenv("WARMUP_STEP_TIMEOUT_S", "30"))
+
+PENDING = "pending"
+RUNNING = "running"
+OK = "ok"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class WarmupSkipped(Exception):
+    """Raised by a step that cannot run in this environment (e.g. no API key)."""
+
+
+@dataclass
+class WarmupStep:
+    name: str
+    fn: Callable[[], Union[Any, Awaitable[Any]]]
+    status: str = PENDING
+    duration_ms: Optional[int] = None
+    error: Optional[str] = None
+
+
+class Warmup:
+    """
+    Ordered warm-up steps. Sync steps run in a thread, async steps on the loop.
+    A failing step is logged and reported but does not block readiness:
+    the instance can still serve, it just pays the cost on first use.
+    """
+
+    def __init__(self, enabled: bool = WARMUP_ENABLED, only: str = WARMUP_STEPS,
+                 step_timeout_s: float = WARMUP_STEP_TIMEOUT_S):
+        self.enabled = enabled
+        self.only = {name.strip() for name in only.split(",") if name.strip()}
+        self.step_timeout_s = step_timeout_s
+        self.steps: List[WarmupStep] = []
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, name: str, fn: Callable[[], Union[Any, Awaitable[Any]]]) -> None:
+        step = WarmupStep(name, fn)
+        if not self.enabled or (self.only and name not in self.only):
+            step.status = SKIPPED
+        self.steps.append(step)
+
+    @property
+    def ready(self) -> bool:
+        return not self.enabled or self.finished_at is not None
+
+    def start(self) -> None:
+        """Run the warm-up in the background on the running loop."""
+        if self.enabled and self.finished_at is None and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self) -> None:
+        self.started_at = time.time()
+        for step in self.steps:
+            if step.status != PENDING:
+                continue
+            step.status = RUNNING
+            start = time.perf_counter()
+            try:
+                if asyncio.iscoroutinefunction(step.fn):
+                    await asyncio.wait_for(step.fn(), self.step_timeout_s)
+                else:
+                    await asyncio.wait_for(asyncio.to_thread(step.fn), self.step_timeout_s)
+                step.status = OK
+            except WarmupSkipped as e:
+                step.status, step.error = SKIPPED, str(e)
+            except asyncio.CancelledError:
+                step.status = PENDING  # Rerun on the next start()
+                raise
+            except Exception as e:
+                step.status, step.error = FAILED, f"{type(e).__name__}: {e}"[:300]
+                logger.warning(f"⚠️ Warm-up step '{step.name}' failed: {step.error}")
+            step.duration_ms = int((time.perf_counter() - start) * 1000)
+            logger.info(f"🔥 Warm-up step '{step.name}': {step.status} in {step.duration_ms}ms")
+        self.finished_at = time.time()
+        logger.info(f"✅ Warm-up finished in {self.finished_at - self.started_at:.1f}s")
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "enabled": self.enabled,
+            "steps": [asdict(step, dict_factory=lambda items: {k: v for k, v in items if k != "fn"})
+                      for step in self.steps],
+        }
@@ -3,21 +3,10 @@
 
 echo "🏥 Deploying Medical AI Assistant Backend..."
 
-# Navigate to backend directory
-cd "$(dirname "$0")"
+# Navigate to the repository root: the backend image is built with it as context (shared api/ modules)
+cd "$(dirname "$0")/.."
 
-# Deploy using gcloud (make sure we're in backend/ directory)
-gcloud run deploy nuvaface-medical-assistant \
-  --source=. \
-  --region=us-central1 \
-  --platform=managed \
-  --allow-unauthenticated \
-  --memory=4Gi \
-  --cpu=2 \
-  --timeout=600 \
-  --max-instances=10 \
-  --min-instances=0 \
-  --concurrency=80 \
-  --set-env-vars=PYTHONPATH=/app
+# Build backend/Dockerfile and deploy it to Cloud Run
+gcloud builds submit --config cloudbuild-medical.yaml --region=us-central1 .
 
-echo "✅ Medical AI Assistant Backend deployed!"
\ No newline at end of file
+echo "✅ Medical AI Assistant Backend deployed!"
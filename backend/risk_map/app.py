@@ -5,9 +5,13 @@ Simplified version that starts reliably and can be extended
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import logging
 import time
 
+from api.metrics import PrometheusMiddleware, LoopLagMonitor, metrics_response
+from api.warmup import Warmup
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,6 +34,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request metrics, shared with the NuvaFace API (told apart by the app label)
+app.add_middleware(PrometheusMiddleware, app_name="risk_map")
+app.add_api_route("/metrics", metrics_response, methods=["GET"], include_in_schema=False)
+loop_lag_monitor = LoopLagMonitor(app_name="risk_map")
+
+@app.on_event("startup")
+async def start_loop_lag_monitor():
+    loop_lag_monitor.start()
+
+@app.on_event("shutdown")
+async def stop_loop_lag_monitor():
+    await loop_lag_monitor.stop()
+
 # Services (initialized on-demand)
 _services_initialized = False
 image_processor = None
@@ -60,6 +77,32 @@ def init_services():
         logger.error(f"❌ Service initialization failed: {e}")
         return False
 
+# Warm-up and readiness, shared with the NuvaFace API
+def _warm_up_services():
+    if not init_services():
+        raise RuntimeError("service initialization failed")
+
+warmup = Warmup()
+warmup.add("services", _warm_up_services)
+
+@app.on_event("startup")
+async def start_warmup():
+    warmup.start()
+
+@app.on_event("shutdown")
+async def stop_warmup():
+    await warmup.stop()
+
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is up"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: 503 until the services are warmed up"""
+    return JSONResponse(status_code=200 if warmup.ready else 503, content=warmup.status())
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Process a directory of photos offline: segmentation masks and/or Gemini simulations
+for every image, area and volume, with N concurrent workers.
+
+Results go to OUTPUT_DIR/<image>_<ext>/ (photo.jpg -> photo_jpg/), one line per finished task to OUTPUT_DIR/manifest.jsonl.
+The manifest is the checkpoint: after a crash or Ctrl+C, rerunning the same command
+skips every task that already succeeded and retries the failed ones.
+
+    python batch_process.py photos/ out/ --areas lips,chin --volumes 1,2 --workers 4
+    python batch_process.py photos/ out/ --segment --no-simulate
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from PIL import Image
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(PROJECT_ROOT)
+
+from engine.utils import load_image
+from api.metrics import classify_error
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+MANIFEST_NAME = "manifest.jsonl"
+REPORT_NAME = "report.json"
+
+SimulateFn = Callable[[Image.Image, float, str], Awaitable[Image.Image]]
+SegmentFn = Callable[[Image.Image, str], Image.Image]
+
+
+@dataclass(frozen=True)
+class Task:
+    """One unit of work: a segmentation of an area or a simulation of an area and volume."""
+    image: str  # Path relative to the input directory
+    kind: str  # segment | simulate
+    area: str
+    volume_ml: Optional[float] = None
+
+    @property
+    def key(self) -> str:
+        volume = "" if self.volume_ml is None else f"{self.volume_ml:g}"
+        return f"{self.image}|{self.kind}|{self.area}|{volume}"
+
+    @property
+    def output_dir(self) -> Path:
+        """Result directory; keeps the extension so a.jpg and a.png do not share one."""
+        path = Path(self.image)
+        return path.with_name(path.name.replace(".", "_"))
+
+    def output_name(self, image_format: str) -> str:
+        if self.kind == "segment":
+            return f"{self.area}_mask.png"
+        return f"{self.area}_{self.volume_ml:g}ml.{image_format}"
+
+
+@dataclass
+class RunStats:
+    """Outcome of this run (tasks skipped from the checkpoint are only counted)."""
+    started_at: float = field(default_factory=time.monotonic)
+    skipped: int = 0
+    latencies_ms: Dict[str, List[int]] = field(default_factory=lambda: defaultdict(list))
+    errors: Counter = field(default_factory=Counter)
+    completed_images: Set[str] = field(default_factory=set)
+    ok: int = 0
+    failed: int = 0
+
+
+def find_images(input_dir: Path) -> List[str]:
+    return sorted(
+        str(path.relative_to(input_dir)) for path in input_dir.rglob("*")
+        if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS
+    )
+
+
+def plan_tasks(images: List[str], areas: List[str], volumes: List[float],
+               segment: bool, simulate: bool) -> List[Task]:
+    tasks = []
+    for image in images:
+        for area in areas:
+            if segment:
+                tasks.append(Task(image, "segment", area))
+            if simulate:
+                tasks.extend(Task(image, "simulate", area, volume_ml) for volume_ml in volumes)
+    return tasks
+
+
+def load_checkpoint(manifest_path: Path) -> Set[str]:
+    """Keys of tasks that already succeeded. A line cut off by a crash is ignored."""
+    done = set()
+    if not manifest_path.exists():
+        return done
+    with open(manifest_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("status") == "ok":
+                done.add(entry["key"])
+    return done
+
+
+def percentile(values: List[int], pct: float) -> Optional[int]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _read_image(path: Path) -> Image.Image:
+    image = load_image(path.read_bytes())
+    image.load()  # Decode fully before tasks on other threads share it
+    return image
+
+
+async def _engine_simulate(image: Image.Image, volume_ml: float, area: str) -> Image.Image:
+    from engine.edit_gemini import generate_gemini_simulation
+    return await generate_gemini_simulation(image, volume_ml, area)
+
+
+def _engine_segment(image: Image.Image, area: str) -> Image.Image:
+    from engine.parsing import segment_area
+    mask, _ = segment_area(image, area)
+    return mask
+
+
+class BatchRunner:
+    """
+    Runs planned tasks with a fixed number of workers and appends each outcome to the manifest.
+    Segmentations run one at a time on a dedicated thread: the FaceMesh parser behind
+    engine.parsing is a process-wide singleton and not thread-safe.
+    """
+
+    def __init__(self, input_dir: Path, output_dir: Path, workers: int = 4, image_format: str = "png",
+                 simulate: SimulateFn = _engine_simulate, segment: SegmentFn = _engine_segment):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.workers = workers
+        self.image_format = image_format
+        self.simulate = simulate
+        self.segment = segment
+        self.stats = RunStats()
+        self._manifest = None
+        self._segment_executor: Optional[ThreadPoolExecutor] = None
+        self._remaining: Dict[str, int] = {}
+        # Decoded once per image while its tasks are running
+        self._images: Dict[str, asyncio.Task] = {}
+
+    async def run(self, tasks: List[Task]) -> RunStats:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        done = load_checkpoint(self.output_dir / MANIFEST_NAME)
+        pending = [task for task in tasks if task.key not in done]
+        self.stats = RunStats(skipped=len(tasks) - len(pending))
+        for task in pending:
+            self._remaining[task.image] = self._remaining.get(task.image, 0) + 1
+        if self.stats.skipped:
+            print(f"Resuming: {self.stats.skipped} of {len(tasks)} tasks already done")
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for task in pending:
+            queue.put_nowait(task)
+        with open(self.output_dir / MANIFEST_NAME, "a", encoding="utf-8") as self._manifest, \
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix="segment") as self._segment_executor:
+            workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.workers)]
+            try:
+                await queue.join()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+        return self.stats
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            task = await queue.get()
+            try:
+                await self._run_task(task)
+            finally:
+                queue.task_done()
+
+    async def _load(self, image: str) -> Image.Image:
+        if image not in self._images:
+            self._images[image] = asyncio.create_task(asyncio.to_thread(_read_image, self.input_dir / image))
+        return await self._images[image]
+
+    async def _run_task(self, task: Task) -> None:
+        start = time.perf_counter()
+        entry = {"key": task.key, "image": task.image, "kind": task.kind, "area": task.area,
+                 "volume_ml": task.volume_ml}
+        try:
+            image = await self._load(task.image)
+            if task.kind == "segment":
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self._segment_executor, self.segment, image, task.area)
+            else:
+                result = await self.simulate(image, task.volume_ml, task.area)
+            output = self.output_dir / task.output_dir / task.output_name(self.image_format)
+            output.parent.mkdir(parents=True, exist_ok=True)
+            await asyncio.to_thread(self._save, result, output)
+            entry.update(status="ok", output=str(output.relative_to(self.output_dir)))
+            self.stats.ok += 1
+        except Exception as e:
+            error_type = classify_error(e)
+            entry.update(status="error", error=str(e)[:500], error_type=error_type)
+            self.stats.errors[error_type] += 1
+            self.stats.failed += 1
+            print(f"❌ {task.key}: {e}", file=sys.stderr)
+        latency_ms = int((time.perf_counter() - start) * 1000)
+        entry.update(latency_ms=latency_ms, finished_at=time.time())
+        self.stats.latencies_ms[task.kind].append(latency_ms)
+        self._write_manifest(entry)
+        self._finish_image(task.image)
+
+    def _save(self, result: Image.Image, output: Path) -> None:
+        if self.image_format == "jpeg" and result.mode not in ("RGB", "L"):
+            result = result.convert("RGB")
+        result.save(output, format=self.image_format.upper(), **({"quality": 92} if self.image_format == "jpeg" else {}))
+
+    def _write_manifest(self, entry: Dict) -> None:
+        # Flushed and synced per line so the checkpoint survives a crash
+        self._manifest.write(json.dumps(entry) + "\n")
+        self._manifest.flush()
+        os.fsync(self._manifest.fileno())
+
+    def _finish_image(self, image: str) -> None:
+        self._remaining[image] -= 1
+        if not self._remaining[image]:
+            self.stats.completed_images.add(image)
+            self._images.pop(image, None)
+
+
+def build_report(stats: RunStats) -> Dict:
+    elapsed_s = time.monotonic() - stats.started_at
+    minutes = max(elapsed_s / 60, 1e-9)
+    all_latencies = [ms for values in stats.latencies_ms.values() for ms in values]
+    return {
+        "elapsed_s": round(elapsed_s, 1),
+        "tasks_ok": stats.ok,
+        "tasks_failed": stats.failed,
+        "tasks_skipped": stats.skipped,
+        "images_completed": len(stats.completed_images),
+        "images_per_minute": round(len(stats.completed_images) / minutes, 2),
+        "tasks_per_minute": round((stats.ok + stats.failed) / minutes, 2),
+        "latency_ms": {
+            kind: {"p50": percentile(values, 50), "p95": percentile(values, 95), "count": len(values)}
+            for kind, values in [("all", all_latencies), *sorted(stats.latencies_ms.items())]
+        },
+        "errors": dict(stats.errors),
+    }
+
+
+def print_report(report: Dict) -> None:
+    print(f"\n{'=' * 50}")
+    print(f"Finished in {report['elapsed_s']}s: {report['tasks_ok']} ok, {report['tasks_failed']} failed, "
+          f"{report['tasks_skipped']} skipped (checkpoint)")
+    print(f"Throughput: {report['images_per_minute']} images/min, {report['tasks_per_minute']} tasks/min")
+    for kind, latency in report["latency_ms"].items():
+        if latency["count"]:
+            print(f"Latency {kind:<9} p50 {latency['p50']} ms, p95 {latency['p95']} ms ({latency['count']} tasks)")
+    if report["errors"]:
+        print("Errors: " + ", ".join(f"{kind} {count}" for kind, count in sorted(report["errors"].items())))
+
+
+def _csv(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+async def _main_async(args) -> Dict:
+    input_dir, output_dir = Path(args.input_dir), Path(args.output_dir)
+    images = find_images(input_dir)
+    tasks = plan_tasks(images, _csv(args.areas), [float(v) for v in _csv(args.volumes)],
+                       segment=args.segment, simulate=args.simulate)
+    print(f"{len(images)} images, {len(tasks)} tasks, {args.workers} workers")
+
+    runner = BatchRunner(input_dir, output_dir, workers=args.workers, image_format=args.format)
+    try:
+        stats = await runner.run(tasks)
+    finally:
+        if args.simulate:
+            from engine.edit_gemini import worker_pool
+            await worker_pool.stop()
+    report = build_report(stats)
+    with open(output_dir / REPORT_NAME, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch segmentation / Gemini simulation for a directory of photos")
+    parser.add_argument("input_dir", help="Directory with photos (searched recursively)")
+    parser.add_argument("output_dir", help="Directory for results, manifest.jsonl and report.json")
+    parser.add_argument("--areas", default="lips", help="Comma-separated areas (lips, chin, cheeks, forehead)")
+    parser.add_argument("--volumes", default="1.0", help="Comma-separated volumes in ml for simulations")
+    parser.add_argument("--segment", action="store_true", help="Also write a segmentation mask per area")
+    parser.add_argument("--no-simulate", dest="simulate", action="store_false", help="Skip Gemini simulations")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent tasks")
+    parser.add_argument("--format", choices=["png", "jpeg"], default="png", help="Format of simulation results")
+    args = parser.parse_args()
+    if not args.segment and not args.simulate:
+        parser.error("Nothing to do: --no-simulate needs --segment")
+
+    try:
+        report = asyncio.run(_main_async(args))
+    except KeyboardInterrupt:
+        print("\nInterrupted - rerun the same command to resume from the manifest")
+        sys.exit(130)
+    print_report(report)
+    sys.exit(1 if report["tasks_failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Circuit breaker for the Gemini call path.
+When Gemini is overloaded, every request would otherwise wait for its full
+timeout before failing. The breaker watches the outcome and latency of recent
+calls; once too many fail or are too slow it opens and rejects calls in
+milliseconds. After a cool-down a few probe calls are let through (half-open)
+and their outcome decides whether it closes again.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Deque, Dict
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+GEMINI_BREAKER_WINDOW = int(os.getenv("GEMINI_BREAKER_WINDOW", "20"))  # Recent calls considered
+GEMINI_BREAKER_MIN_CALLS = int(os.getenv("GEMINI_BREAKER_MIN_CALLS", "5"))
+GEMINI_BREAKER_ERROR_RATE = float(os.getenv("GEMINI_BREAKER_ERROR_RATE", "0.5"))
+GEMINI_BREAKER_SLOW_S = float(os.getenv("GEMINI_BREAKER_SLOW_S", "45"))  # Slower calls count as failures
+GEMINI_BREAKER_OPEN_S = float(os.getenv("GEMINI_BREAKER_OPEN_S", "30"))
+GEMINI_BREAKER_PROBES = int(os.getenv("GEMINI_BREAKER_PROBES", "2"))
+
+# User-facing message, same wording as the worker's SERVER_OVERLOAD_MESSAGE
+OVERLOAD_MESSAGE = "Entschuldigung! :( Die Server sind aktuell überlastet, bitte versuche es in Kürze erneut"
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Errors that say nothing about Gemini's health (bad request, invalid key, ...)
+OVERLOAD_STATUS_CODES = {429, 500, 502, 503, 504}
+OVERLOAD_MARKERS = ("resource_exhausted", "overloaded", "unavailable", "server_overload", "timeout", "timed out")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Gemini while the breaker is open."""
+
+    def __init__(self, name: str, retry_after_s: float):
+        super().__init__(f"SERVER_OVERLOAD: circuit for {name} is open, retry in {retry_after_s:.0f}s")
+        self.name = name
+        self.retry_after_s = retry_after_s
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker driven by error rate and latency."""
+
+    def __init__(self, name: str, window: int = GEMINI_BREAKER_WINDOW, min_calls: int = GEMINI_BREAKER_MIN_CALLS,
+                 error_rate: float = GEMINI_BREAKER_ERROR_RATE, slow_call_s: float = GEMINI_BREAKER_SLOW_S,
+                 open_s: float = GEMINI_BREAKER_OPEN_S, probes: int = GEMINI_BREAKER_PROBES):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_s = slow_call_s
+        self.open_s = open_s
+        self.probes = probes
+        self.state = CLOSED
+        self._outcomes: Deque[bool] = deque(maxlen=window)  # True = failed or too slow
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """Admit a call or raise CircuitOpenError without touching Gemini."""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self._opened_at + self.open_s - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpenError(self.name, remaining)
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes_in_flight >= self.probes:
+                    raise CircuitOpenError(self.name, 1.0)
+                self._probes_in_flight += 1
+
+    def record(self, failed: bool, latency_s: float = 0.0) -> None:
+        """Record the outcome of an admitted call."""
+        failed = failed or latency_s > self.slow_call_s
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if failed:
+                    self._transition(OPEN)
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.probes:
+                    self._transition(CLOSED)
+                return
+
+            self._outcomes.append(failed)
+            if self.state == CLOSED and len(self._outcomes) >= self.min_calls:
+                failure_rate = sum(self._outcomes) / len(self._outcomes)
+                if failure_rate >= self.error_rate:
+                    self._transition(OPEN)
+
+    def release(self) -> None:
+        """Give back an admitted call's probe slot without an outcome (the caller was cancelled)."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        logger.warning(f"Gemini circuit '{self.name}': {self.state} -> {state}")
+        self.state = state
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        if state == CLOSED:
+            self._outcomes.clear()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "recent_calls": len(self._outcomes),
+                "recent_failures": sum(self._outcomes),
+            }
+
+
+def is_overload_error(error: Exception) -> bool:
+    """True for errors that indicate Gemini is overloaded or unreachable."""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in OVERLOAD_STATUS_CODES
+    message = f"{type(error).__name__} {error}".lower()
+    return any(marker in message for marker in OVERLOAD_MARKERS)
+
+
+# Global breakers, one per model
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Get the process-wide breaker for a model (or other Gemini call path)."""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
@@ -2,23 +2,25 @@
 """
 This module orchestrates the call to the isolated Gemini worker script.
 """
-import os
-import subprocess
-import uuid
+import time
+import asyncio
 from PIL import Image
 import logging
 import sys
 import io
 from pathlib import Path
 
+from .circuit_breaker import get_circuit_breaker, CircuitOpenError, OVERLOAD_MESSAGE
+from .gemini_usage import usage_ledger, parse_usage_records
+from .worker_pool import GeminiWorkerPool
+from .worker_protocol import ERROR_OVERLOAD
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
 # --- Configuration ---
-# Define paths for temporary files and the worker environment
+# Define paths for the worker environment
 ROOT_DIR = Path(__file__).parent.parent
-TEMP_INPUT_DIR = ROOT_DIR / 'temp_inputs'
-TEMP_OUTPUT_DIR = ROOT_DIR / 'temp_outputs'
 
 # Try to find the Python executable - check multiple possible locations
 possible_pythons = [
@@ -38,8 +40,24 @@ if not GEMINI_ENV_PYTHON:
 
 WORKER_SCRIPT = ROOT_DIR / 'gemini_worker.py'
 
-os.makedirs(TEMP_INPUT_DIR, exist_ok=True)
-os.makedirs(TEMP_OUTPUT_DIR, exist_ok=True)
+# Breaker for the worker path; fails fast instead of queueing jobs into an overload
+worker_breaker = get_circuit_breaker("gemini_worker")
+
+# Long-lived worker processes, started on the first simulation
+worker_pool = GeminiWorkerPool(command=[str(GEMINI_ENV_PYTHON), str(WORKER_SCRIPT), "--serve"])
+
+def _png_bytes(image: Image.Image) -> bytes:
+    # Lossless but fast: the worker re-encodes to JPEG for Gemini anyway
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+def _record_worker_usage(stderr: str, area: str, volume_ml: float) -> None:
+    """Move the usage records a worker printed into this process's ledger."""
+    for record in parse_usage_records(stderr or ""):
+        record.area = area
+        record.volume_ml = volume_ml
+        usage_ledger.record(record)
 
 async def generate_gemini_simulation(
     original_image: Image.Image, 
@@ -48,124 +66,68 @@ async def generate_gemini_simulation(
     mask_image: Image.Image = None
 ) -> Image.Image:
     """
-    Generates an aesthetic simulation by calling the gemini_worker.py script
-    in its own dedicated virtual environment.
+    Generates an aesthetic simulation on one of the pooled gemini_worker.py
+    processes, which run in their own dedicated virtual environment.
     """
     if not Path(GEMINI_ENV_PYTHON).exists():
         raise FileNotFoundError(f"Python executable not found at {GEMINI_ENV_PYTHON}")
     if not WORKER_SCRIPT.exists():
         raise FileNotFoundError(f"Gemini worker script not found at {WORKER_SCRIPT}")
+    try:
+        worker_breaker.before_call()
+    except CircuitOpenError as e:
+        raise RuntimeError(f"SERVER_OVERLOAD: {OVERLOAD_MESSAGE}") from e
 
-    session_id = str(uuid.uuid4())
-    input_path = TEMP_INPUT_DIR / f"{session_id}_input.png"
-    mask_path = TEMP_INPUT_DIR / f"{session_id}_mask.png"
-    output_path = TEMP_OUTPUT_DIR / f"{session_id}_output.png"
-    
-    logger.info(f"DEBUG: Session ID: {session_id}")
     logger.info(f"DEBUG: Area parameter: '{area}'")
     logger.info(f"DEBUG: Volume: {volume_ml}ml")
-    
-    # Save original image
-    original_image.save(input_path, "PNG")
-    logger.info(f"DEBUG: Saved input image to: {input_path}")
-    
-    # Save mask if provided
-    mask_arg = ""
+
+    # Images travel in memory as PNG blobs; the worker does not use the mask yet
+    blobs = [_png_bytes(original_image)]
     if mask_image is not None:
-        mask_image.save(mask_path, "PNG")
-        mask_arg = f"--mask {mask_path}"
-        logger.info(f"DEBUG: Saved mask image to: {mask_path}")
+        blobs.append(_png_bytes(mask_image))
         logger.info(f"DEBUG: Mask image mode: {mask_image.mode}, size: {mask_image.size}")
-    else:
-        logger.info(f"DEBUG: No mask image provided!")
 
+    start_time = time.monotonic()
+    overloaded = False
+    cancelled = False
     try:
-        command = [
-            str(GEMINI_ENV_PYTHON),
-            str(WORKER_SCRIPT),
-            "--input", str(input_path),
-            "--output", str(output_path),
-            "--volume", str(volume_ml),
-            "--area", str(area),
-        ]
-        
-        # Add mask if provided
-        if mask_image is not None:
-            command.extend(["--mask", str(mask_path)])
-            logger.info(f"DEBUG: Added mask argument to command")
-        
-        logger.info(f"DEBUG: Executing Gemini worker command: {' '.join(command)}")
-        
-        # Add timeout to prevent hanging (40 seconds for subprocess, API has 30s timeout)
-        process = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            check=True, # This will raise a CalledProcessError if the script fails
-            encoding='utf-8',
-            timeout=40  # 40 seconds timeout for subprocess
+        header, result_blobs = await worker_pool.submit(
+            {"type": "job", "area": area, "volume_ml": volume_ml}, blobs
         )
-        
-        logger.info(f"Gemini worker stdout: {process.stdout}")
-        if process.stderr:
-            logger.info(f"Gemini worker stderr: {process.stderr}")
-        
-        # Extract image data from stdout instead of file
-        stdout = process.stdout
-        logger.info(f"🔍 DEBUG: Stdout length = {len(stdout)} chars")
-        logger.info(f"🔍 DEBUG: Stdout contains IMAGE_DATA_START: {'IMAGE_DATA_START:' in stdout}")
-        logger.info(f"🔍 DEBUG: Stdout contains :IMAGE_DATA_END: {':IMAGE_DATA_END' in stdout}")
-        logger.info(f"🔍 DEBUG: First 200 chars of stdout: {stdout[:200]}")
-        logger.info(f"🔍 DEBUG: Last 200 chars of stdout: {stdout[-200:]}")
-        
-        if "IMAGE_DATA_START:" in stdout and ":IMAGE_DATA_END" in stdout:
-            # Extract base64 image data from stdout
-            start_marker = "IMAGE_DATA_START:"
-            end_marker = ":IMAGE_DATA_END"
-            start_idx = stdout.find(start_marker) + len(start_marker)
-            end_idx = stdout.find(end_marker)
-            
-            if start_idx >= len(start_marker) and end_idx > start_idx:
-                base64_data = stdout[start_idx:end_idx].strip()
-                
-                # Decode base64 to image
-                import base64
-                image_bytes = base64.b64decode(base64_data)
-                result_image = Image.open(io.BytesIO(image_bytes))
-                
-                # Convert to RGB if needed
-                if result_image.mode != 'RGB':
-                    result_image = result_image.convert('RGB')
-                
-                logger.info("Successfully extracted image from stdout")
-                return result_image
-            else:
-                raise RuntimeError("Could not extract image data from stdout")
-        else:
-            raise RuntimeError(f"Worker script did not return image data. Stdout: {stdout[:500]}")
-
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Gemini worker script failed with code {e.returncode}:\n{e.stderr}")
-        
-        # Check for specific error types
-        stderr_content = e.stderr or ""
-        stdout_content = process.stdout if 'process' in locals() else ""
-        
+        stderr_content = header.get("stderr", "")
+        _record_worker_usage(stderr_content, area, volume_ml)
+
+        if header["type"] == "result":
+            result_image = Image.open(io.BytesIO(result_blobs[0]))
+            if result_image.mode != 'RGB':
+                result_image = result_image.convert('RGB')
+            logger.info(f"Received {len(result_blobs[0])} byte result from Gemini worker ({header.get('model')})")
+            return result_image
+
+        logger.error(f"Gemini worker job failed: {header.get('error')}\n{stderr_content}")
+
         # Check for regional restrictions first
         if "Regional restriction" in stderr_content or "SOLUTION: Please use a VPN" in stderr_content:
             raise RuntimeError("REGIONAL_RESTRICTION: Image generation is not available in your region. Please use a VPN or deploy to a supported region (US, Canada, etc.)")
-        
-        # Check for server overload
-        elif "SERVER_OVERLOAD_MESSAGE:" in stderr_content or "SERVER_OVERLOAD_MESSAGE:" in stdout_content:
-            # Extract the actual message after the marker
-            if "SERVER_OVERLOAD_MESSAGE:" in stderr_content:
-                message_start = stderr_content.find("SERVER_OVERLOAD_MESSAGE:") + len("SERVER_OVERLOAD_MESSAGE:")
-                message_line = stderr_content[message_start:].split('\n')[0].strip()
-                raise RuntimeError(f"SERVER_OVERLOAD: {message_line}")
-            else:
-                raise RuntimeError("SERVER_OVERLOAD: Entschuldigung! :( Die Server sind aktuell überlastet, Ergebnisse können schlechter ausfallen als sonst")
+    
+        # Check for server overload (reported by the worker in the reply header)
+        elif header.get("error_type") == ERROR_OVERLOAD:
+            overloaded = True
+            raise RuntimeError(f"SERVER_OVERLOAD: {header.get('error') or OVERLOAD_MESSAGE}")
         else:
-            raise RuntimeError(f"Gemini Worker Error: {e.stderr}")
+            raise RuntimeError(f"Gemini Worker Error: {header.get('error')}")
+    except asyncio.CancelledError:
+        # Cancelled (client disconnect): no outcome, but a half-open probe slot is freed
+        cancelled = True
+        worker_breaker.release()
+        raise
+    except asyncio.TimeoutError:
+        overloaded = True
+        logger.error("Gemini worker timed out")
+        raise RuntimeError(f"SERVER_OVERLOAD: {OVERLOAD_MESSAGE}")
     except Exception as e:
         logger.error(f"Error in generate_gemini_simulation: {e}")
-        raise
\ No newline at end of file
+        raise
+    finally:
+        if not cancelled:
+            worker_breaker.record(overloaded, time.monotonic() - start_time)
@@ -0,0 +1,138 @@
+"""
+Face-crop round trip for Gemini edits.
+Crops a padded face (or treatment area) box from the full-resolution photo,
+scales it to Gemini's working resolution, and feather-blends the edited crop
+back into the untouched original so the output keeps the input resolution.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple, List
+
+import numpy as np
+from PIL import Image
+
+from .utils import feather_mask, blend_images_with_mask, resize_to_target
+
+# --- Configuration ---
+GEMINI_WORKING_SIZE = int(os.getenv("GEMINI_WORKING_SIZE", "1024"))
+# Landmarks are detected on a downscaled copy; the box is scaled back up
+LANDMARK_DETECTION_SIZE = 768
+
+# Upper face oval (forehead to hairline) used for the forehead area box
+FOREHEAD_UPPER = [10, 338, 297, 332, 284, 54, 103, 67, 109]
+
+
+@dataclass
+class FaceCrop:
+    """A crop prepared for Gemini and the data needed to composite it back."""
+    box: Tuple[int, int, int, int]  # (x1, y1, x2, y2) in original image coordinates
+    image: Image.Image  # crop at Gemini working resolution
+
+
+def _area_indices(area: Optional[str]) -> List[int]:
+    """Landmark indices whose bounding box defines the crop for an area."""
+    from .parsing import (
+        FACE_OVAL_ALL, LIPS_COMPLETE_CORRECT, CHIN_JAWLINE_LOWER,
+        CHEEK_LEFT_ENHANCED, CHEEK_RIGHT_ENHANCED, EYEBROW_LEFT, EYEBROW_RIGHT
+    )
+    if area == "lips":
+        return LIPS_COMPLETE_CORRECT
+    if area == "chin":
+        return CHIN_JAWLINE_LOWER + LIPS_COMPLETE_CORRECT
+    if area == "cheeks":
+        return CHEEK_LEFT_ENHANCED + CHEEK_RIGHT_ENHANCED
+    if area == "forehead":
+        return FOREHEAD_UPPER + EYEBROW_LEFT + EYEBROW_RIGHT
+    return FACE_OVAL_ALL
+
+
+def detect_landmarks(image: Image.Image) -> Optional[np.ndarray]:
+    """Run FaceMesh on a downscaled copy and return landmarks in full-resolution pixels."""
+    from .parsing import get_face_parser
+
+    small = resize_to_target(image, LANDMARK_DETECTION_SIZE) if max(image.size) > LANDMARK_DETECTION_SIZE else image
+    landmarks = get_face_parser().extract_landmarks(small)
+    if landmarks is None:
+        return None
+    scale = image.width / small.width
+    return landmarks * scale
+
+
+def face_size_px(landmarks: np.ndarray, face_crop: Optional[FaceCrop] = None) -> int:
+    """Shorter side of the unpadded face box, in pixels of the photo or of the scaled crop."""
+    from .parsing import FACE_OVAL_ALL
+
+    face = landmarks[FACE_OVAL_ALL]
+    size = min(np.ptp(face[:, 0]), np.ptp(face[:, 1]))
+    if face_crop is not None:
+        x1, _, x2, _ = face_crop.box
+        size *= face_crop.image.width / (x2 - x1)
+    return int(size)
+
+
+def compute_crop_box(image_size: Tuple[int, int], landmarks: np.ndarray, area: Optional[str] = None,
+                     padding: float = 0.35) -> Tuple[int, int, int, int]:
+    """
+    Padded bounding box around the face (area=None) or one treatment area.
+    Padding is relative to the face size, so small areas like the lips still get
+    enough surrounding context for Gemini to keep lighting and skin texture consistent.
+    """
+    from .parsing import FACE_OVAL_ALL
+
+    width, height = image_size
+    face = landmarks[FACE_OVAL_ALL]
+    face_size = max(np.ptp(face[:, 0]), np.ptp(face[:, 1]))
+
+    points = landmarks[_area_indices(area)]
+    pad = padding * face_size
+    x1 = int(max(0, np.min(points[:, 0]) - pad))
+    y1 = int(max(0, np.min(points[:, 1]) - pad))
+    x2 = int(min(width, np.max(points[:, 0]) + pad))
+    y2 = int(min(height, np.max(points[:, 1]) + pad))
+    return x1, y1, x2, y2
+
+
+def prepare_face_crop(image: Image.Image, area: Optional[str] = None, working_size: int = GEMINI_WORKING_SIZE,
+                      landmarks: Optional[np.ndarray] = None) -> Optional[FaceCrop]:
+    """
+    Crop the face or area box and downscale it to the working size (never upscaled).
+    Returns None when no face is found, so callers can fall back to the full photo.
+    """
+    if landmarks is None:
+        landmarks = detect_landmarks(image)
+        if landmarks is None:
+            return None
+
+    box = compute_crop_box(image.size, landmarks, area)
+    crop = image.crop(box)
+    if max(crop.size) > working_size:
+        crop = resize_to_target(crop, working_size)
+    return FaceCrop(box=box, image=crop)
+
+
+def composite_face_crop(original: Image.Image, edited_crop: Image.Image, face_crop: FaceCrop,
+                        feather_fraction: float = 0.08) -> Image.Image:
+    """
+    Scale Gemini's edited crop back to the box size and blend it into the original.
+    The blend mask fades out towards the box border, so the seam and any off-face
+    drift Gemini introduced at the crop edges are hidden by the original pixels.
+    """
+    x1, y1, x2, y2 = face_crop.box
+    box_w, box_h = x2 - x1, y2 - y1
+
+    edited = edited_crop.convert('RGB')
+    if edited.size != (box_w, box_h):
+        edited = edited.resize((box_w, box_h), Image.Resampling.LANCZOS)
+
+    feather_px = max(1, int(min(box_w, box_h) * feather_fraction))
+    mask = np.zeros((box_h, box_w), dtype=np.uint8)
+    mask[feather_px:box_h - feather_px, feather_px:box_w - feather_px] = 255
+    mask = feather_mask(mask, feather_px)
+
+    region = original.crop(face_crop.box).convert('RGB')
+    blended = blend_images_with_mask(region, edited, Image.fromarray(mask, 'L'))
+
+    result = original.convert('RGB') if original.mode != 'RGB' else original.copy()
+    result.paste(blended, (x1, y1))
+    return result
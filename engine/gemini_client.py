@@ -0,0 +1,199 @@
+"""
+Process-wide Gemini client for the NuvaFace API.
+Keeps a single google-genai client (and with it one pooled HTTP connection set)
+and bounds the number of Gemini calls that may be in flight at the same time.
+Calls are rate limited and retried through engine.rate_limit and fail fast
+through engine.circuit_breaker while Gemini is overloaded. Every call that
+reaches Gemini is recorded in engine.gemini_usage.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, Optional
+
+from .rate_limit import get_rate_limiter
+from .circuit_breaker import get_circuit_breaker, is_overload_error
+from .gemini_usage import usage_ledger, record_from_response, measure_contents, emit_usage_record
+
+if TYPE_CHECKING:  # google-genai takes ~0.5 s to import; loaded with the first client
+    from google import genai
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+GEMINI_IMAGE_MODEL = "gemini-2.5-flash-image-preview"
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_TIMEOUT_S = float(os.getenv("GEMINI_TIMEOUT_S", "60"))
+# Alternative API endpoint, e.g. the local stand-in from loadtest/fake_gemini.py
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "")
+
+# Global state, created lazily on first use
+_client: Optional["genai.Client"] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def gemini_http_options(timeout_s: Optional[float] = None) -> "types.HttpOptions":
+    """
+    HTTP options for every genai client in the repo: timeout, GEMINI_BASE_URL override
+    and the record/replay transport from engine.gemini_transport (GEMINI_TRANSPORT).
+    """
+    from google.genai import types
+    from .gemini_transport import transport_client_args
+
+    client_args, async_client_args = transport_client_args()
+    return types.HttpOptions(
+        base_url=GEMINI_BASE_URL or None,
+        timeout=int(timeout_s * 1000) if timeout_s else None,
+        client_args=client_args,
+        async_client_args=async_client_args,
+    )
+
+
+def gemini_api_key() -> str:
+    """
+    API key for genai clients (GOOGLE_API_KEY or GEMINI_API_KEY).
+    In replay mode nothing reaches Google, so a placeholder stands in for a missing key.
+    """
+    from .gemini_transport import is_replay
+
+    api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
+    if api_key:
+        return api_key
+    if is_replay():
+        return "replay"
+    raise ValueError("GOOGLE_API_KEY environment variable not set")
+
+
+def get_gemini_client() -> "genai.Client":
+    """Get the shared Gemini client, creating it on first use."""
+    global _client
+    if _client is None:
+        from google import genai
+
+        _client = genai.Client(
+            api_key=gemini_api_key(),
+            http_options=gemini_http_options(GEMINI_TIMEOUT_S),
+        )
+        logger.info(f"Created shared Gemini client (max concurrency: {GEMINI_MAX_CONCURRENCY})")
+        if GEMINI_BASE_URL:
+            logger.warning(f"⚠️ Gemini requests go to {GEMINI_BASE_URL} instead of the Google API")
+    return _client
+
+
+def get_gemini_semaphore() -> asyncio.Semaphore:
+    """Get the semaphore bounding concurrent Gemini calls on the running loop."""
+    global _semaphore, _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore is None or _semaphore_loop is not loop:
+        _semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+        _semaphore_loop = loop
+    return _semaphore
+
+
+async def generate_content(model: str, contents: Any, config: Optional["types.GenerateContentConfig"] = None,
+                           area: Optional[str] = None, volume_ml: Optional[float] = None):
+    """
+    Call Gemini through the shared async client.
+    Waits for a rate-limit token and a free concurrency slot first, so a burst of
+    requests queues here instead of opening an unbounded number of upstream calls.
+    Quota and transient errors are retried with jittered backoff. While the model's
+    circuit is open this raises CircuitOpenError immediately.
+    area and volume_ml only label the usage record.
+    """
+    client = get_gemini_client()
+    breaker = get_circuit_breaker(model)
+    breaker.before_call()
+    # The breaker judges Gemini by the upstream request alone, not by the time spent
+    # queueing for a slot, a rate-limit token or between retries
+    upstream_s = 0.0
+
+    async def attempt():
+        nonlocal upstream_s
+        async with get_gemini_semaphore():
+            attempt_start = time.monotonic()
+            try:
+                return await client.aio.models.generate_content(
+                    model=model,
+                    contents=contents,
+                    config=config,
+                )
+            finally:
+                upstream_s = time.monotonic() - attempt_start
+
+    prompt_chars, image_bytes_up = measure_contents(contents)
+    start = time.monotonic()
+    try:
+        response = await get_rate_limiter().call_async(model, attempt)
+    except BaseException as e:
+        elapsed = time.monotonic() - start
+        if isinstance(e, Exception):
+            # Client errors (bad request, invalid key) say nothing about overload
+            breaker.record(is_overload_error(e), upstream_s)
+        else:
+            # Cancelled (client disconnect): no outcome, but a half-open probe slot is freed
+            breaker.release()
+        usage_ledger.record(record_from_response(
+            model, None, area=area, volume_ml=volume_ml, prompt_chars=prompt_chars,
+            image_bytes_up=image_bytes_up, wall_time_ms=int(elapsed * 1000), ok=False, error=str(e)[:200],
+        ))
+        raise
+    elapsed = time.monotonic() - start
+    breaker.record(False, upstream_s)
+    usage_ledger.record(record_from_response(
+        model, response, area=area, volume_ml=volume_ml, prompt_chars=prompt_chars,
+        image_bytes_up=image_bytes_up, wall_time_ms=int(elapsed * 1000),
+    ))
+    return response
+
+
+def generate_content_sync(client: "genai.Client", model: str, contents: Any,
+                          config: Optional["types.GenerateContentConfig"] = None):
+    """
+    Blocking call for the gemini_worker*.py scripts, which run in their own process
+    with their own client. Rate limited like generate_content; the usage record is
+    printed for the parent process instead of being kept here.
+    """
+    prompt_chars, image_bytes_up = measure_contents(contents)
+    start = time.monotonic()
+    try:
+        response = get_rate_limiter().call(
+            model, lambda: client.models.generate_content(model=model, contents=contents, config=config)
+        )
+    except Exception as e:
+        emit_usage_record(record_from_response(
+            model, None, prompt_chars=prompt_chars, image_bytes_up=image_bytes_up,
+            wall_time_ms=int((time.monotonic() - start) * 1000), ok=False, error=str(e)[:200],
+        ))
+        raise
+    emit_usage_record(record_from_response(
+        model, response, prompt_chars=prompt_chars, image_bytes_up=image_bytes_up,
+        wall_time_ms=int((time.monotonic() - start) * 1000),
+    ))
+    return response
+
+
+async def warm_up_gemini_client(model: str = GEMINI_IMAGE_MODEL) -> None:
+    """
+    Create the shared client and open its connection pool (DNS, TLS handshake)
+    with a cheap model metadata request, so the first simulation does not pay for it.
+    """
+    client = get_gemini_client()
+    await client.aio.models.get(model=model)
+
+
+async def close_gemini_client() -> None:
+    """Close the shared client and release its HTTP connections."""
+    global _client, _semaphore, _semaphore_loop
+    if _client is not None:
+        try:
+            await _client.aio.aclose()
+            _client.close()
+        except Exception as e:
+            logger.warning(f"Error while closing Gemini client: {e}")
+    _client = None
+    _semaphore = None
+    _semaphore_loop = None
@@ -0,0 +1,234 @@
+"""
+Record/replay HTTP transport under every google-genai client in the repo
+(installed through engine.gemini_client.gemini_http_options).
+
+GEMINI_TRANSPORT selects the mode:
+- passthrough (default): no transport is installed, requests go straight to Gemini
+- record: requests go to Gemini and each response is appended to the cassette
+- replay: responses come from the cassette, after the recorded latency times
+  GEMINI_REPLAY_LATENCY_SCALE (0 = instant); nothing touches the network
+
+Requests are matched by a fingerprint of method, path and JSON body. The anti-cache
+REQUEST_ID / RANDOM_TOKEN lines in prompts are masked first, so the same simulation
+matches its recording. Identical fingerprints replay their recordings in order.
+"""
+
+import os
+import re
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+ROOT_DIR = Path(__file__).parent.parent
+GEMINI_TRANSPORT = os.getenv("GEMINI_TRANSPORT", "passthrough").lower()
+GEMINI_CASSETTE = os.getenv("GEMINI_CASSETTE", str(ROOT_DIR / "cassettes" / "gemini.jsonl"))
+GEMINI_REPLAY_LATENCY_SCALE = float(os.getenv("GEMINI_REPLAY_LATENCY_SCALE", "1.0"))
+
+PASSTHROUGH = "passthrough"
+RECORD = "record"
+REPLAY = "replay"
+
+# Per-request noise in prompts that must not change the fingerprint
+VOLATILE_PATTERNS = [re.compile(r"\b(REQUEST_ID|RANDOM_TOKEN):[ \t]*\S+")]
+# Set by httpx for the decoded body we store, wrong once the body is replayed
+DROPPED_RESPONSE_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+
+class CassetteMiss(Exception):
+    """Raised in replay mode for a request that was never recorded."""
+
+
+def _mask(value):
+    if isinstance(value, str):
+        for pattern in VOLATILE_PATTERNS:
+            value = pattern.sub(r"\1: *", value)
+        return value
+    if isinstance(value, dict):
+        return {key: _mask(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_mask(item) for item in value]
+    return value
+
+
+def fingerprint(method: str, path: str, body: bytes) -> str:
+    """Stable hash of a request; JSON bodies are canonicalized and volatile prompt lines masked."""
+    try:
+        canonical = json.dumps(_mask(json.loads(body)), sort_keys=True, separators=(",", ":")).encode("utf-8")
+    except ValueError:
+        canonical = body
+    digest = hashlib.sha256(f"{method.upper()} {path}\n".encode("utf-8"))
+    digest.update(canonical)
+    return digest.hexdigest()
+
+
+@dataclass
+class Interaction:
+    """One recorded request/response pair."""
+    fingerprint: str
+    method: str
+    path: str
+    status: int
+    headers: Dict[str, str]
+    body: str  # base64
+    latency_s: float
+    recorded_at: float
+
+    def to_response(self, request: httpx.Request) -> httpx.Response:
+        return httpx.Response(self.status, headers=self.headers, content=base64.b64decode(self.body), request=request)
+
+
+class Cassette:
+    """Interactions in a JSON-lines file, appended to while recording."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._by_fingerprint: Dict[str, List[Interaction]] = {}
+        self._replayed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._add(Interaction(**json.loads(line)))
+
+    def __len__(self) -> int:
+        return sum(len(items) for items in self._by_fingerprint.values())
+
+    def _add(self, interaction: Interaction) -> None:
+        self._by_fingerprint.setdefault(interaction.fingerprint, []).append(interaction)
+
+    def record(self, interaction: Interaction) -> None:
+        with self._lock:
+            self._add(interaction)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(asdict(interaction)) + "\n")
+
+    def next_for(self, fingerprint: str) -> Interaction:
+        """The next recording for this fingerprint, cycling through them in recorded order."""
+        with self._lock:
+            recordings = self._by_fingerprint.get(fingerprint)
+            if not recordings:
+                raise CassetteMiss(f"No recorded Gemini response for request {fingerprint[:12]} in {self.path}")
+            index = self._replayed.get(fingerprint, 0)
+            self._replayed[fingerprint] = index + 1
+            return recordings[index % len(recordings)]
+
+
+def _interaction(request: httpx.Request, response: httpx.Response, body: bytes, latency_s: float) -> Interaction:
+    return Interaction(
+        fingerprint=fingerprint(request.method, request.url.path, request.content),
+        method=request.method,
+        path=request.url.path,
+        status=response.status_code,
+        headers={k: v for k, v in response.headers.items() if k.lower() not in DROPPED_RESPONSE_HEADERS},
+        body=base64.b64encode(body).decode("ascii"),
+        latency_s=round(latency_s, 4),
+        recorded_at=time.time(),
+    )
+
+
+class RecordReplayTransport(httpx.BaseTransport):
+    """Transport for the blocking genai client (gemini_worker.py, scripts)."""
+
+    def __init__(self, cassette: Cassette, mode: str, latency_scale: float = GEMINI_REPLAY_LATENCY_SCALE,
+                 inner: Optional[httpx.BaseTransport] = None):
+        self.cassette = cassette
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.inner = inner or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        if self.mode == REPLAY:
+            interaction = self.cassette.next_for(fingerprint(request.method, request.url.path, request.content))
+            if self.latency_scale > 0:
+                time.sleep(interaction.latency_s * self.latency_scale)
+            return interaction.to_response(request)
+
+        start = time.monotonic()
+        response = self.inner.handle_request(request)
+        body = response.read()
+        interaction = _interaction(request, response, body, time.monotonic() - start)
+        response.close()
+        self.cassette.record(interaction)
+        return interaction.to_response(request)
+
+    def close(self) -> None:
+        self.inner.close()
+
+
+class AsyncRecordReplayTransport(httpx.AsyncBaseTransport):
+    """Transport for the async genai client (engine.gemini_client)."""
+
+    def __init__(self, cassette: Cassette, mode: str, latency_scale: float = GEMINI_REPLAY_LATENCY_SCALE,
+                 inner: Optional[httpx.AsyncBaseTransport] = None):
+        self.cassette = cassette
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.inner = inner or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        if self.mode == REPLAY:
+            interaction = self.cassette.next_for(fingerprint(request.method, request.url.path, request.content))
+            if self.latency_scale > 0:
+                await asyncio.sleep(interaction.latency_s * self.latency_scale)
+            return interaction.to_response(request)
+
+        start = time.monotonic()
+        response = await self.inner.handle_async_request(request)
+        body = await response.aread()
+        interaction = _interaction(request, response, body, time.monotonic() - start)
+        await response.aclose()
+        self.cassette.record(interaction)
+        return interaction.to_response(request)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+# Cassettes shared by all clients of this process, keyed by path
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(path: Optional[str] = None) -> Cassette:
+    path = path or GEMINI_CASSETTE
+    with _cassettes_lock:
+        if path not in _cassettes:
+            _cassettes[path] = Cassette(path)
+            logger.info(f"Gemini cassette {path}: {len(_cassettes[path])} recorded interactions")
+        return _cassettes[path]
+
+
+def is_replay(mode: Optional[str] = None) -> bool:
+    """Whether Gemini responses come from the cassette (no request reaches Google)."""
+    return (mode or GEMINI_TRANSPORT) == REPLAY
+
+
+def transport_client_args(mode: Optional[str] = None) -> Tuple[Optional[dict], Optional[dict]]:
+    """httpx client kwargs (sync, async) for genai's HttpOptions; (None, None) in passthrough mode."""
+    mode = mode or GEMINI_TRANSPORT
+    if mode == PASSTHROUGH:
+        return None, None
+    if mode not in (RECORD, REPLAY):
+        raise ValueError(f"GEMINI_TRANSPORT must be passthrough, record or replay, not {mode!r}")
+    cassette = get_cassette()
+    logger.warning(f"⚠️ Gemini transport in {mode} mode ({cassette.path})")
+    return (
+        {"transport": RecordReplayTransport(cassette, mode)},
+        {"transport": AsyncRecordReplayTransport(cassette, mode)},
+    )
@@ -0,0 +1,186 @@
+"""
+Per-call accounting for Gemini: prompt size, token usage, image bytes and latency.
+Records are kept in an in-memory ring buffer and aggregated by treatment area and
+by volume bucket, so slow or expensive prompts stand out.
+
+Worker subprocesses cannot reach the API's buffer; they print each record as a
+GEMINI_USAGE: line on stderr, which engine.edit_gemini parses and records.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+GEMINI_USAGE_BUFFER_SIZE = int(os.getenv("GEMINI_USAGE_BUFFER_SIZE", "1000"))
+VOLUME_BUCKET_ML = 1.0
+MAX_VOLUME_ML = 5.0
+
+# Marker for records printed by worker subprocesses
+USAGE_MARKER = "GEMINI_USAGE:"
+
+
+@dataclass
+class GeminiCallRecord:
+    """One Gemini call as seen by the caller."""
+    model: str
+    area: Optional[str] = None
+    volume_ml: Optional[float] = None
+    prompt_chars: int = 0
+    prompt_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    total_tokens: Optional[int] = None
+    image_bytes_up: int = 0
+    image_bytes_down: int = 0
+    wall_time_ms: int = 0
+    ok: bool = True
+    error: Optional[str] = None
+    timestamp: float = field(default_factory=time.time)
+
+
+def record_from_response(model: str, response: Any, **fields) -> GeminiCallRecord:
+    """Build a record, filling token counts and returned image bytes from a Gemini response."""
+    record = GeminiCallRecord(model=model, **fields)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        record.prompt_tokens = getattr(usage, "prompt_token_count", None)
+        record.output_tokens = getattr(usage, "candidates_token_count", None)
+        record.total_tokens = getattr(usage, "total_token_count", None)
+
+    for candidate in getattr(response, "candidates", None) or []:
+        content = getattr(candidate, "content", None)
+        for part in getattr(content, "parts", None) or []:
+            inline_data = getattr(part, "inline_data", None)
+            if inline_data is not None and inline_data.data:
+                record.image_bytes_down += len(inline_data.data)
+    return record
+
+
+def measure_contents(contents: Any) -> Tuple[int, int]:
+    """
+    Prompt characters and inline image bytes in a generate_content `contents` argument
+    (strings, bytes, types.Content / types.Part, dicts, or lists of these).
+    PIL images handed to the SDK directly are not counted as their upload size is unknown.
+    """
+    if isinstance(contents, str):
+        return len(contents), 0
+    if isinstance(contents, (bytes, bytearray)):
+        return 0, len(contents)
+    if isinstance(contents, (list, tuple)):
+        sizes = [measure_contents(item) for item in contents]
+        return sum(c for c, _ in sizes), sum(b for _, b in sizes)
+
+    get = contents.get if isinstance(contents, dict) else lambda name: getattr(contents, name, None)
+    if get("parts"):
+        return measure_contents(get("parts"))
+    chars = len(get("text") or "")
+    inline_data = get("inline_data")
+    data = inline_data.get("data") if isinstance(inline_data, dict) else getattr(inline_data, "data", None)
+    return chars, len(data or b"")
+
+
+def volume_bucket(volume_ml: Optional[float]) -> str:
+    """Label of the volume bucket, e.g. '1-2ml' (the top volume joins the bucket below it)."""
+    if volume_ml is None:
+        return "unknown"
+    low = math.floor(min(volume_ml, MAX_VOLUME_ML - 1e-9) / VOLUME_BUCKET_ML) * VOLUME_BUCKET_ML
+    return f"{low:g}-{low + VOLUME_BUCKET_ML:g}ml"
+
+
+def _percentile(values: List[int], q: float) -> Optional[int]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _aggregate(records: List[GeminiCallRecord]) -> Dict[str, Any]:
+    def total(name):
+        return sum(getattr(r, name) or 0 for r in records)
+
+    latencies = [r.wall_time_ms for r in records if r.ok]
+    count = len(records)
+    return {
+        "calls": count,
+        "errors": sum(1 for r in records if not r.ok),
+        "avg_prompt_chars": round(total("prompt_chars") / count),
+        "prompt_tokens": total("prompt_tokens"),
+        "output_tokens": total("output_tokens"),
+        "total_tokens": total("total_tokens"),
+        "avg_total_tokens": round(total("total_tokens") / count),
+        "image_bytes_up": total("image_bytes_up"),
+        "image_bytes_down": total("image_bytes_down"),
+        "avg_wall_time_ms": round(sum(latencies) / len(latencies)) if latencies else None,
+        "p50_wall_time_ms": _percentile(latencies, 0.5),
+        "p95_wall_time_ms": _percentile(latencies, 0.95),
+    }
+
+
+class UsageLedger:
+    """Thread-safe ring buffer of the most recent Gemini call records."""
+
+    def __init__(self, size: int = GEMINI_USAGE_BUFFER_SIZE):
+        self._records: Deque[GeminiCallRecord] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, record: GeminiCallRecord) -> None:
+        with self._lock:
+            self._records.append(record)
+        logger.info(
+            f"Gemini usage: {record.area} {record.volume_ml}ml {record.model} "
+            f"{record.wall_time_ms}ms tokens={record.total_tokens} "
+            f"up={record.image_bytes_up}B down={record.image_bytes_down}B ok={record.ok}"
+        )
+
+    def records(self) -> List[GeminiCallRecord]:
+        with self._lock:
+            return list(self._records)
+
+    def summary(self, recent: int = 0) -> Dict[str, Any]:
+        """Aggregates over the buffer by area, by volume bucket and by model."""
+        records = self.records()
+        groups = {"by_area": {}, "by_volume": {}, "by_model": {}}
+        for r in records:
+            groups["by_area"].setdefault(r.area or "unknown", []).append(r)
+            groups["by_volume"].setdefault(volume_bucket(r.volume_ml), []).append(r)
+            groups["by_model"].setdefault(r.model, []).append(r)
+
+        summary: Dict[str, Any] = {
+            "calls": len(records),
+            "since": records[0].timestamp if records else None,
+        }
+        for name, grouped in groups.items():
+            summary[name] = {key: _aggregate(items) for key, items in sorted(grouped.items())}
+        if recent:
+            summary["recent"] = [asdict(r) for r in records[-recent:]]
+        return summary
+
+
+def emit_usage_record(record: GeminiCallRecord) -> None:
+    """Print a record for the parent process (used by the gemini_worker*.py scripts)."""
+    print(USAGE_MARKER + json.dumps(asdict(record)), file=sys.stderr)
+
+
+def parse_usage_records(output: str) -> List[GeminiCallRecord]:
+    """Extract records printed by emit_usage_record from a worker's output."""
+    records = []
+    for line in output.splitlines():
+        if line.startswith(USAGE_MARKER):
+            try:
+                records.append(GeminiCallRecord(**json.loads(line[len(USAGE_MARKER):])))
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Ignoring malformed usage record: {e}")
+    return records
+
+
+# Global ledger instance
+usage_ledger = UsageLedger()
@@ -3,6 +3,8 @@ Face parsing using MediaPipe FaceMesh to generate area-specific masks.
 Supports lips, chin, cheeks, and forehead regions for aesthetic treatments.
 """
 
+import threading
+
 import numpy as np
 import cv2
 from PIL import Image
@@ -423,12 +425,15 @@ class FaceParser:
 
 # Global parser instance for efficiency
 _face_parser = None
+_face_parser_lock = threading.Lock()
 
 def get_face_parser() -> FaceParser:
-    """Get singleton face parser instance."""
+    """Get singleton face parser instance (created once, even when first called from several threads)."""
     global _face_parser
     if _face_parser is None:
-        _face_parser = FaceParser()
+        with _face_parser_lock:
+            if _face_parser is None:
+                _face_parser = FaceParser()
     return _face_parser
 
 
@@ -0,0 +1,172 @@
+"""
+Perceptual hashing for Gemini results.
+Detects results that are (nearly) the input image or a replay of a result returned
+to an earlier request, both signs of a degraded or caching upstream.
+
+An ImageSignature is computed from one 64x64 grayscale thumbnail:
+- dhash: 64-bit difference hash (9x8 gradients), used to find candidates
+- thumb: the thumbnail itself, used to confirm a candidate block by block
+
+A dHash alone cannot tell a subtle lip edit from its input, since both share the same
+coarse gradients; the block check can, because an edit moves at least one 4x4 block
+of the thumbnail a lot, while re-encoding or rescaling moves every block a little.
+
+RecentResults is a bounded index over the last N result signatures. The 64 hash bits are
+split into max_distance + 1 bands: two hashes within max_distance bits agree on at least
+one band (pigeonhole), so a lookup is one dict hit per band instead of a scan. Each band
+value keeps only its MAX_CANDIDATES newest keys, so a lookup confirms a bounded number of
+candidates even when many results share a hash (e.g. flat or blank images).
+Each record also keeps the signature of the input it was made from: results of the same
+photo (e.g. 1 ml and 1.5 ml) can legitimately be near-identical and are not replays.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+# --- Configuration ---
+REPLAY_INDEX_SIZE = int(os.getenv("REPLAY_INDEX_SIZE", "512"))
+# Max differing dHash bits for a candidate
+REPLAY_MAX_HASH_DISTANCE = int(os.getenv("REPLAY_MAX_HASH_DISTANCE", "8"))
+# Max mean gray-level change (0-255) in any 4x4 block of the 64x64 thumbnail
+REPLAY_MAX_BLOCK_DIFF = float(os.getenv("REPLAY_MAX_BLOCK_DIFF", "6.0"))
+
+THUMB_SIZE = 64
+BLOCK_SIZE = 4
+HASH_BITS = 64
+MAX_ASPECT_DRIFT = 0.02
+# Keys kept per band value and candidates confirmed per lookup; keeps degenerate cases (many flat images) O(1)
+MAX_CANDIDATES = 32
+
+
+@dataclass(frozen=True)
+class ImageSignature:
+    dhash: int
+    thumb: np.ndarray  # THUMB_SIZE x THUMB_SIZE float32 gray
+    aspect: float
+
+
+def signature(image: Image.Image) -> ImageSignature:
+    """Signature of an image; cost is one downscale regardless of the input size."""
+    thumb = image.convert("RGB") if image.mode not in ("RGB", "L") else image
+    thumb = thumb.resize((THUMB_SIZE, THUMB_SIZE), Image.Resampling.BOX).convert("L")
+    small = np.asarray(thumb.resize((9, 8), Image.Resampling.BILINEAR), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    dhash = int.from_bytes(np.packbits(bits).tobytes(), "big")
+    return ImageSignature(dhash=dhash, thumb=np.asarray(thumb, dtype=np.float32), aspect=image.width / image.height)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def max_block_diff(a: ImageSignature, b: ImageSignature) -> float:
+    """Largest mean absolute gray-level difference over the blocks of the thumbnails."""
+    diff = np.abs(a.thumb - b.thumb)
+    blocks = diff.reshape(THUMB_SIZE // BLOCK_SIZE, BLOCK_SIZE, THUMB_SIZE // BLOCK_SIZE, BLOCK_SIZE)
+    return float(blocks.mean(axis=(1, 3)).max())
+
+
+def near_identical(a: ImageSignature, b: ImageSignature, max_distance: int = REPLAY_MAX_HASH_DISTANCE,
+                   max_diff: float = REPLAY_MAX_BLOCK_DIFF) -> bool:
+    """Same picture up to re-encoding and rescaling (no local edit anywhere)."""
+    if abs(a.aspect - b.aspect) > MAX_ASPECT_DRIFT * max(a.aspect, b.aspect):
+        return False
+    if hamming(a.dhash, b.dhash) > max_distance:
+        return False
+    return max_block_diff(a, b) <= max_diff
+
+
+@dataclass
+class ResultRecord:
+    """A result returned to an earlier request."""
+    key: str  # unique per result
+    area: str
+    volume_ml: float
+    signature: ImageSignature
+    created_at: float
+    source: Optional[ImageSignature] = None  # The input the result was made from
+
+
+class RecentResults:
+    """Bounded index of recent result signatures with O(1) near-duplicate lookup."""
+
+    def __init__(self, capacity: int = REPLAY_INDEX_SIZE, max_distance: int = REPLAY_MAX_HASH_DISTANCE,
+                 max_diff: float = REPLAY_MAX_BLOCK_DIFF):
+        self.capacity = capacity
+        self.max_distance = max_distance
+        self.max_diff = max_diff
+        band_count = max_distance + 1
+        # Bit ranges of the bands, as even as possible
+        edges = [round(i * HASH_BITS / band_count) for i in range(band_count + 1)]
+        self._bands = list(zip(edges[:-1], edges[1:]))
+        self._records: "OrderedDict[str, ResultRecord]" = OrderedDict()
+        self._index: List[Dict[int, Deque[str]]] = [{} for _ in self._bands]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _band_values(self, dhash: int) -> List[int]:
+        return [(dhash >> start) & ((1 << (end - start)) - 1) for start, end in self._bands]
+
+    def _same_source(self, a: Optional[ImageSignature], b: Optional[ImageSignature]) -> bool:
+        return a is not None and b is not None and near_identical(a, b, self.max_distance, self.max_diff)
+
+    def find(self, sig: ImageSignature, source: Optional[ImageSignature] = None) -> Optional[ResultRecord]:
+        """An earlier result near-identical to sig, if any, ignoring results of the same source input."""
+        with self._lock:
+            # Newest first, at most MAX_CANDIDATES distinct keys
+            candidates: Dict[str, None] = {}
+            for band, value in zip(self._index, self._band_values(sig.dhash)):
+                for key in reversed(band.get(value, ())):
+                    candidates[key] = None
+                    if len(candidates) >= MAX_CANDIDATES:
+                        break
+                if len(candidates) >= MAX_CANDIDATES:
+                    break
+            for key in candidates:
+                record = self._records[key]
+                if self._same_source(source, record.source):
+                    continue
+                if near_identical(sig, record.signature, self.max_distance, self.max_diff):
+                    return record
+        return None
+
+    def add(self, key: str, sig: ImageSignature, area: str, volume_ml: float,
+            source: Optional[ImageSignature] = None) -> None:
+        with self._lock:
+            if key in self._records:
+                self._remove(key)
+            self._records[key] = ResultRecord(key=key, area=area, volume_ml=volume_ml,
+                                              signature=sig, created_at=time.time(), source=source)
+            for band, value in zip(self._index, self._band_values(sig.dhash)):
+                band.setdefault(value, deque(maxlen=MAX_CANDIDATES)).append(key)
+            while len(self._records) > self.capacity:
+                self._remove(next(iter(self._records)))
+
+    def _remove(self, key: str) -> None:
+        record = self._records.pop(key)
+        for band, value in zip(self._index, self._band_values(record.signature.dhash)):
+            keys = band.get(value)
+            if keys is not None and key in keys:
+                keys.remove(key)
+                if not keys:
+                    del band[value]
+
+    def check_and_add(self, key: str, sig: ImageSignature, area: str, volume_ml: float,
+                      source: Optional[ImageSignature] = None) -> Optional[ResultRecord]:
+        """Look up an earlier near-identical result of another input, then index this one."""
+        match = self.find(sig, source)
+        self.add(key, sig, area, volume_ml, source)
+        return match
+
+
+# Results of this process, shared by all endpoints
+recent_results = RecentResults()
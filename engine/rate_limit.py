@@ -0,0 +1,290 @@
+"""
+Quota-aware rate limiting for Gemini calls.
+One token bucket per model keeps the request rate under the configured quota and
+tightens itself from the quota headers Gemini sends back. Retryable errors
+(429 / RESOURCE_EXHAUSTED, 500, 503) are retried with exponential backoff and full
+jitter, bounded by a retry budget so retries cannot snowball into a storm.
+
+Used by the API (engine.gemini_client) and by the gemini_worker*.py scripts.
+State is per process: each worker subprocess has its own buckets. GEMINI_RPM and
+GEMINI_BURST are the quota of the whole deployment, so every process takes an equal
+share of them. A process on its own gets the full quota (GEMINI_RATE_PROCESSES=1);
+a running GeminiWorkerPool splits it between the API and the workers it spawned.
+"""
+
+import os
+import re
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# --- Configuration ---
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "60"))  # Requests per minute and model
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", "8"))  # Requests allowed back to back
+# Processes sharing GEMINI_RPM / GEMINI_BURST while no worker pool is running
+GEMINI_RATE_PROCESSES = int(os.getenv("GEMINI_RATE_PROCESSES", "1"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_BACKOFF_BASE_S = float(os.getenv("GEMINI_BACKOFF_BASE_S", "1.0"))
+GEMINI_BACKOFF_MAX_S = float(os.getenv("GEMINI_BACKOFF_MAX_S", "30"))
+# Retries allowed per request on average (0.2 = at most one retry per five calls)
+GEMINI_RETRY_RATIO = float(os.getenv("GEMINI_RETRY_RATIO", "0.2"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 503}
+RETRYABLE_MARKERS = ("resource_exhausted", "quota", "rate limit", "429", "unavailable", "overloaded")
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket for one model.
+    Tokens refill at `rate_per_s` up to `capacity`. A Retry-After from Gemini
+    blocks the bucket until that time has passed.
+    """
+
+    def __init__(self, rate_per_s: float, capacity: int):
+        self.rate_per_s = rate_per_s
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_s)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Take a token; returns how many seconds the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate_per_s
+            return max(wait, self._blocked_until - now)
+
+    def resize(self, rate_per_s: float, capacity: int) -> None:
+        """Change rate and capacity, keeping the tokens already earned up to the new capacity."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate_per_s = rate_per_s
+            self.capacity = capacity
+            self._tokens = min(self._tokens, float(capacity))
+
+    def acquire(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def block_for(self, seconds: float) -> None:
+        """Stop handing out usable tokens for `seconds` (server-side Retry-After)."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def limit_remaining(self, remaining: int) -> None:
+        """Never hold more tokens than the quota the server says is left."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, float(remaining))
+
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of calls: every call deposits `ratio` tokens,
+    every retry withdraws one. With a drained budget errors surface immediately.
+    """
+
+    def __init__(self, ratio: float = GEMINI_RETRY_RATIO, min_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = min_tokens
+        self._tokens = min_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RateLimiter:
+    """Token buckets per model plus the shared retry budget and backoff policy."""
+
+    def __init__(self, rpm: float = GEMINI_RPM, burst: int = GEMINI_BURST,
+                 max_retries: int = GEMINI_MAX_RETRIES, backoff_base_s: float = GEMINI_BACKOFF_BASE_S,
+                 backoff_max_s: float = GEMINI_BACKOFF_MAX_S):
+        self.rpm = rpm
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.budget = RetryBudget()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, model: str) -> TokenBucket:
+        with self._lock:
+            if model not in self._buckets:
+                self._buckets[model] = TokenBucket(self.rpm / 60.0, self.burst)
+            return self._buckets[model]
+
+    def resize(self, rpm: float, burst: int) -> None:
+        """Change the rate of every model's bucket (this process's share of the quota changed)."""
+        with self._lock:
+            self.rpm = rpm
+            self.burst = burst
+            for bucket in self._buckets.values():
+                bucket.resize(rpm / 60.0, burst)
+
+    def observe_headers(self, model: str, headers: Optional[Mapping[str, str]]) -> None:
+        """Adjust the model's bucket from quota headers of a response or error."""
+        if not headers:
+            return
+        headers = {key.lower(): value for key, value in headers.items()}
+        bucket = self.bucket(model)
+
+        for name in ("x-ratelimit-remaining", "x-goog-quota-remaining"):
+            remaining = _parse_number(headers.get(name))
+            if remaining is not None:
+                bucket.limit_remaining(int(remaining))
+                if remaining <= 1:
+                    logger.warning(f"Gemini quota for {model} almost used up ({name}: {remaining})")
+
+        retry_after = _parse_number(headers.get("retry-after"))
+        if retry_after is not None:
+            bucket.block_for(retry_after)
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff, never shorter than a server-provided delay."""
+        ceiling = min(self.backoff_max_s, self.backoff_base_s * (2 ** attempt))
+        delay = random.uniform(0, ceiling)
+        return max(delay, retry_after or 0.0)
+
+    def _should_retry(self, model: str, error: Exception, attempt: int) -> Optional[float]:
+        """Delay before the next attempt, or None if the error should be raised."""
+        if not is_retryable(error) or attempt >= self.max_retries:
+            return None
+        if not self.budget.withdraw():
+            logger.warning(f"Gemini retry budget exhausted - not retrying {model}: {error}")
+            return None
+        retry_after = retry_after_from_error(error)
+        self.observe_headers(model, _error_headers(error))
+        if retry_after is not None:
+            self.bucket(model).block_for(retry_after)
+        delay = self.backoff_delay(attempt, retry_after)
+        logger.warning(f"Gemini {model} attempt {attempt + 1} failed ({error}); retrying in {delay:.1f}s")
+        return delay
+
+    def call(self, model: str, fn: Callable[[], T]) -> T:
+        """Run a blocking Gemini call under the model's rate limit, retrying retryable errors."""
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            self.bucket(model).acquire()
+            try:
+                response = fn()
+            except Exception as e:
+                delay = self._should_retry(model, e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.observe_headers(model, response_headers(response))
+            return response
+
+    async def call_async(self, model: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Async variant of call() for the API's shared client."""
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            await self.bucket(model).acquire_async()
+            try:
+                response = await fn()
+            except Exception as e:
+                delay = self._should_retry(model, e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.observe_headers(model, response_headers(response))
+            return response
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for quota, rate-limit and transient server errors."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    message = str(error).lower()
+    return any(marker in message for marker in RETRYABLE_MARKERS)
+
+
+def retry_after_from_error(error: Exception) -> Optional[float]:
+    """Server-requested delay from a Retry-After header or a RetryInfo detail ("23s")."""
+    retry_after = _parse_number((_error_headers(error) or {}).get("retry-after"))
+    if retry_after is not None:
+        return retry_after
+    match = re.search(r"retryDelay'?\"?:\s*'?\"?(\d+(?:\.\d+)?)s", str(getattr(error, "details", "")))
+    return float(match.group(1)) if match else None
+
+
+def response_headers(response: Any) -> Optional[Mapping[str, str]]:
+    http_response = getattr(response, "sdk_http_response", None)
+    return getattr(http_response, "headers", None)
+
+
+def _error_headers(error: Exception) -> Optional[Mapping[str, str]]:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    return {key.lower(): value for key, value in headers.items()} if headers else None
+
+
+def _parse_number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+# Global limiter instance, shared by all Gemini call sites in this process
+_limiter: Optional[RateLimiter] = None
+# Processes sharing the quota right now (set by a running worker pool); None = GEMINI_RATE_PROCESSES
+_processes: Optional[int] = None
+
+
+def _quota_share() -> Tuple[float, int]:
+    processes = max(1, _processes or GEMINI_RATE_PROCESSES)
+    return GEMINI_RPM / processes, max(1, GEMINI_BURST // processes)
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Get the process-wide rate limiter (this process's share of the quota), creating it on first use."""
+    global _limiter
+    if _limiter is None:
+        rpm, burst = _quota_share()
+        _limiter = RateLimiter(rpm=rpm, burst=burst)
+    return _limiter
+
+
+def set_rate_processes(processes: Optional[int]) -> None:
+    """Set how many processes share the quota (None = GEMINI_RATE_PROCESSES) and rescale this process's limiter."""
+    global _processes
+    _processes = processes
+    if _limiter is not None:
+        _limiter.resize(*_quota_share())
@@ -0,0 +1,113 @@
+"""
+Cleanup of temporary artifacts left on disk by older versions.
+Simulation inputs, masks and results travel between the API and the Gemini
+workers in memory (engine.worker_protocol), so nothing is written to disk any more.
+Earlier worker versions wrote them to temp_inputs / temp_outputs and never deleted
+them; if enabled, a background thread removes files there that are older than the
+TTL, and usage() reports what is left.
+"""
+
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+TEMP_ARTIFACT_TTL_S = float(os.getenv("TEMP_ARTIFACT_TTL_S", "600"))
+TEMP_ARTIFACT_GC_INTERVAL_S = float(os.getenv("TEMP_ARTIFACT_GC_INTERVAL_S", "60"))
+# Delete old files from temp_inputs / temp_outputs (written by older worker versions)
+TEMP_ARTIFACT_SWEEP_LEGACY = os.getenv("TEMP_ARTIFACT_SWEEP_LEGACY", "false").lower() == "true"
+
+ROOT_DIR = Path(__file__).parent.parent
+LEGACY_TEMP_DIRS = [ROOT_DIR / "temp_inputs", ROOT_DIR / "temp_outputs"]
+
+
+class TempArtifactSweeper:
+    """Deletes files older than the TTL from the legacy temp directories, in a background thread."""
+
+    def __init__(self, ttl_s: float = TEMP_ARTIFACT_TTL_S, gc_interval_s: float = TEMP_ARTIFACT_GC_INTERVAL_S,
+                 legacy_dirs: Optional[List[Path]] = None):
+        self.ttl_s = ttl_s
+        self.gc_interval_s = gc_interval_s
+        if legacy_dirs is None:
+            legacy_dirs = LEGACY_TEMP_DIRS if TEMP_ARTIFACT_SWEEP_LEGACY else []
+        self.legacy_dirs = legacy_dirs
+        self._removed = 0
+        self._lock = threading.Lock()
+        self._gc_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def sweep_legacy_dirs(self) -> int:
+        """Delete files older than the TTL from the legacy temp directories."""
+        cutoff = time.time() - self.ttl_s
+        removed = 0
+        for directory in self.legacy_dirs:
+            if not directory.is_dir():
+                continue
+            for path in directory.iterdir():
+                try:
+                    if path.is_file() and path.stat().st_mtime < cutoff:
+                        path.unlink()
+                        removed += 1
+                except OSError as e:
+                    logger.warning(f"Could not remove {path}: {e}")
+        if removed:
+            with self._lock:
+                self._removed += removed
+            logger.info(f"Removed {removed} old files from legacy temp directories")
+        return removed
+
+    def start(self) -> None:
+        """Start the background cleanup thread (idempotent; nothing to do without legacy dirs)."""
+        if not self.legacy_dirs or (self._gc_thread is not None and self._gc_thread.is_alive()):
+            return
+        self._stop.clear()
+        self._gc_thread = threading.Thread(target=self._gc_loop, name="temp-artifact-gc", daemon=True)
+        self._gc_thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._gc_thread is not None:
+            self._gc_thread.join(timeout=5)
+            self._gc_thread = None
+
+    def _gc_loop(self) -> None:
+        while True:
+            try:
+                self.sweep_legacy_dirs()
+            except Exception as e:
+                logger.error(f"Temp artifact cleanup failed: {e}")
+            if self._stop.wait(self.gc_interval_s):
+                return
+
+    def usage(self) -> Dict[str, object]:
+        files = 0
+        total_bytes = 0
+        for directory in self.legacy_dirs:
+            if not directory.is_dir():
+                continue
+            for path in directory.iterdir():
+                try:
+                    if path.is_file():
+                        files += 1
+                        total_bytes += path.stat().st_size
+                except OSError:
+                    pass
+        with self._lock:
+            removed = self._removed
+        return {
+            "sweep_enabled": bool(self.legacy_dirs),
+            "dirs": [str(directory) for directory in self.legacy_dirs],
+            "files": files,
+            "bytes": total_bytes,
+            "ttl_s": self.ttl_s,
+            "removed_total": removed,
+        }
+
+
+# Global sweeper instance
+temp_artifacts = TempArtifactSweeper()
@@ -25,13 +25,12 @@ async def direct_gemini_test(input_image: Image.Image) -> Image.Image:
     Testprompt: 3.0ml Lip Enhancement
     """
     
-    # API Key prüfen
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY environment variable not set")
+    # API Key prüfen (GEMINI_TRANSPORT=replay spielt aufgezeichnete Antworten ab und braucht keinen)
+    from engine.gemini_client import gemini_api_key, gemini_http_options
+    api_key = gemini_api_key()
     
     # Client initialisieren
-    client = genai.Client(api_key=api_key)
+    client = genai.Client(api_key=api_key, http_options=gemini_http_options())
     
     # Fester Test-Prompt für 3.0ml Lip Enhancement
     prompt = """Perform major lip enhancement with 3.0ml hyaluronic acid.
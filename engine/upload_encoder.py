@@ -0,0 +1,136 @@
+"""
+Encoder for the image uploaded to Gemini.
+Picks resolution and JPEG quality so the payload stays within a pixel and byte budget
+whatever the phone camera produced, keeping upload time and Gemini input cost flat.
+
+Concessions are made in this order:
+1. downscale to GEMINI_UPLOAD_MAX_PIXELS (hard cap)
+2. lower the JPEG quality, down to GEMINI_UPLOAD_MIN_QUALITY
+3. downscale further, but never so far that the face drops below GEMINI_UPLOAD_MIN_FACE_PX
+If the byte budget still cannot be met, the smallest allowed encoding is sent and
+budget_met is False in the recorded settings.
+"""
+
+import os
+import math
+from dataclasses import dataclass, asdict
+from io import BytesIO
+from typing import Optional, Tuple
+
+from PIL import Image
+
+# --- Configuration ---
+GEMINI_UPLOAD_MAX_PIXELS = int(os.getenv("GEMINI_UPLOAD_MAX_PIXELS", str(1024 * 1024)))
+GEMINI_UPLOAD_MAX_BYTES = int(os.getenv("GEMINI_UPLOAD_MAX_BYTES", str(400 * 1024)))
+GEMINI_UPLOAD_QUALITY = int(os.getenv("GEMINI_UPLOAD_QUALITY", "92"))
+GEMINI_UPLOAD_MIN_QUALITY = int(os.getenv("GEMINI_UPLOAD_MIN_QUALITY", "75"))
+# Shorter side of the face box in the uploaded image; Gemini needs this much detail to edit lips/skin
+GEMINI_UPLOAD_MIN_FACE_PX = int(os.getenv("GEMINI_UPLOAD_MIN_FACE_PX", "384"))
+# Floor for the longer side when the face size is unknown
+MIN_LONG_SIDE_PX = 512
+MAX_RESIZE_ROUNDS = 4
+
+
+@dataclass
+class UploadSettings:
+    """What the encoder chose, reported in the response metadata."""
+    width: int
+    height: int
+    source_width: int
+    source_height: int
+    quality: int
+    bytes: int
+    budget_met: bool
+    face_px: Optional[int] = None  # Shorter face side in the uploaded image, if known
+
+    @property
+    def scale(self) -> float:
+        return self.width / self.source_width
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "scale": round(self.scale, 4)}
+
+
+@dataclass
+class UploadPayload:
+    """JPEG bytes for Gemini plus the settings that produced them."""
+    data: bytes
+    settings: UploadSettings
+
+
+def _jpeg(image: Image.Image, quality: int) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def _fit_quality(image: Image.Image, max_bytes: int, quality: int, min_quality: int) -> Tuple[bytes, int]:
+    """
+    Highest quality in [min_quality, quality] whose encoding fits max_bytes (binary search).
+    Returns the min_quality encoding if none fits. Most photos fit on the first encode.
+    """
+    data = _jpeg(image, quality)
+    if len(data) <= max_bytes or quality <= min_quality:
+        return data, quality
+
+    best = None
+    low, high = min_quality, quality - 1
+    while low <= high:
+        mid = (low + high) // 2
+        candidate = _jpeg(image, mid)
+        if len(candidate) <= max_bytes:
+            best = (candidate, mid)
+            low = mid + 1
+        else:
+            high = mid - 1
+    if best is not None:
+        return best
+    return _jpeg(image, min_quality), min_quality
+
+
+def _resize(image: Image.Image, scale: float) -> Image.Image:
+    if scale >= 1.0:
+        return image
+    size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+    # reducing_gap: box-filter first for large reductions, then Lanczos (fast on 12+ MP photos)
+    return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def encode_for_upload(image: Image.Image, face_px: Optional[int] = None,
+                      max_bytes: int = GEMINI_UPLOAD_MAX_BYTES, max_pixels: int = GEMINI_UPLOAD_MAX_PIXELS,
+                      quality: int = GEMINI_UPLOAD_QUALITY, min_quality: int = GEMINI_UPLOAD_MIN_QUALITY,
+                      min_face_px: int = GEMINI_UPLOAD_MIN_FACE_PX) -> UploadPayload:
+    """
+    Encode image as the JPEG sent to Gemini within the pixel and byte budget.
+    face_px is the shorter side of the face box in image pixels, if known; it limits
+    how far the encoder may shrink the photo to meet the byte budget.
+    """
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    width, height = image.size
+
+    scale = min(1.0, math.sqrt(max_pixels / (width * height)))
+    if face_px:
+        min_scale = min_face_px / face_px
+    else:
+        min_scale = MIN_LONG_SIDE_PX / max(width, height)
+    min_scale = min(scale, min_scale)
+
+    for _ in range(MAX_RESIZE_ROUNDS):
+        candidate = _resize(image, scale)
+        data, chosen_quality = _fit_quality(candidate, max_bytes, quality, min_quality)
+        if len(data) <= max_bytes or scale <= min_scale:
+            break
+        # JPEG size grows roughly with the pixel count
+        scale = max(min_scale, scale * math.sqrt(max_bytes / len(data)) * 0.95)
+
+    return UploadPayload(data=data, settings=UploadSettings(
+        width=candidate.width,
+        height=candidate.height,
+        source_width=width,
+        source_height=height,
+        quality=chosen_quality,
+        bytes=len(data),
+        budget_met=len(data) <= max_bytes,
+        face_px=round(face_px * candidate.width / width) if face_px else None,
+    ))
@@ -6,11 +6,13 @@ Handles base64 encoding/decoding, face alignment, resizing, and EXIF handling.
 import base64
 import io
 import random
+from dataclasses import dataclass, field
 import numpy as np
-import cv2
 from PIL import Image, ExifTags
-from typing import Union, Tuple, Optional
-import mediapipe as mp
+from typing import Union, Tuple, Optional, Dict
+
+# cv2 is imported inside the mask/alignment helpers: the API imports this module at
+# startup but only segmentation needs OpenCV
 
 
 def set_seed(seed: int) -> None:
@@ -41,13 +43,8 @@ def fix_exif_orientation(image: Image.Image) -> Image.Image:
     return image
 
 
-def base64_to_image(base64_str: str) -> Image.Image:
-    """Convert base64 string to PIL Image."""
-    # Remove data URL prefix if present
-    if base64_str.startswith('data:image'):
-        base64_str = base64_str.split(',')[1]
-    
-    image_bytes = base64.b64decode(base64_str)
+def bytes_to_image(image_bytes: bytes) -> Image.Image:
+    """Convert raw encoded image bytes (PNG, JPEG, ...) to PIL Image."""
     image = Image.open(io.BytesIO(image_bytes))
     
     # Fix orientation and convert to RGB
@@ -58,6 +55,15 @@ def base64_to_image(base64_str: str) -> Image.Image:
     return image
 
 
+def base64_to_image(base64_str: str) -> Image.Image:
+    """Convert base64 string to PIL Image."""
+    # Remove data URL prefix if present
+    if base64_str.startswith('data:image'):
+        base64_str = base64_str.split(',')[1]
+    
+    return bytes_to_image(base64.b64decode(base64_str))
+
+
 def image_to_base64(image: Image.Image, format: str = 'PNG') -> str:
     """Convert PIL Image to base64 string."""
     buffer = io.BytesIO()
@@ -80,10 +86,12 @@ def url_to_image(url: str) -> Image.Image:
     return image
 
 
-def load_image(image_input: Union[str, Image.Image]) -> Image.Image:
-    """Load image from various input formats (base64, URL, or PIL Image)."""
+def load_image(image_input: Union[str, bytes, Image.Image]) -> Image.Image:
+    """Load image from various input formats (base64, URL, raw bytes or PIL Image)."""
     if isinstance(image_input, Image.Image):
         return image_input
+    elif isinstance(image_input, (bytes, bytearray)):
+        return bytes_to_image(bytes(image_input))
     elif isinstance(image_input, str):
         if image_input.startswith('http'):
             return url_to_image(image_input)
@@ -93,6 +101,91 @@ def load_image(image_input: Union[str, Image.Image]) -> Image.Image:
         raise ValueError(f"Unsupported image input type: {type(image_input)}")
 
 
+@dataclass
+class EncodedImage:
+    """
+    An image kept in the encoded form it arrived in (upload or Gemini response).
+    The pixels are decoded lazily and at most once, and each output format is
+    encoded at most once. When the requested format matches the stored bytes and
+    no orientation/mode fix was applied, the stored bytes are served unchanged.
+    """
+    data: Optional[bytes] = None
+    mime_type: Optional[str] = None
+    _image: Optional[Image.Image] = field(default=None, repr=False)
+    # False when the decoded pixels differ from `data` (EXIF rotation, mode conversion)
+    _pristine: bool = field(default=True, repr=False)
+    _encoded: Dict[tuple, bytes] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_upload(cls, data: bytes) -> 'EncodedImage':
+        """Decode uploaded bytes with the same normalization as load_image."""
+        raw = Image.open(io.BytesIO(data))
+        mime_type = Image.MIME.get(raw.format)
+        image = fix_exif_orientation(raw)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        return cls(data=data, mime_type=mime_type, _image=image, _pristine=image is raw)
+
+    @classmethod
+    def from_image(cls, image: Image.Image) -> 'EncodedImage':
+        """Wrap an already decoded image; it is encoded on first request."""
+        return cls(_image=image, _pristine=False)
+
+    @property
+    def image(self) -> Image.Image:
+        """Decoded pixels (decoded on first access)."""
+        if self._image is None:
+            self._image = Image.open(io.BytesIO(self.data))
+            self._image.load()
+        return self._image
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Image size; reads only the header if the pixels are not decoded yet."""
+        if self._image is not None:
+            return self._image.size
+        return Image.open(io.BytesIO(self.data)).size
+
+    def encode(self, format: str = 'PNG', **params) -> bytes:
+        """Get the image encoded as `format`, reusing the stored bytes when possible."""
+        format = format.upper()
+        if (self.data is not None and self._pristine and not params
+                and self.mime_type == Image.MIME.get(format)):
+            return self.data
+
+        key = (format, tuple(sorted(params.items())))
+        if key not in self._encoded:
+            buffer = io.BytesIO()
+            self.image.save(buffer, format=format, **params)
+            self._encoded[key] = buffer.getvalue()
+        return self._encoded[key]
+
+    def to_base64(self, format: str = 'PNG', **params) -> str:
+        """Get the image as a base64 string in the given format."""
+        return base64.b64encode(self.encode(format, **params)).decode('utf-8')
+
+
+def load_encoded_image(image_input: Union[str, bytes, Image.Image, EncodedImage]) -> EncodedImage:
+    """Load image like load_image, but keep the original encoded bytes alongside the pixels."""
+    if isinstance(image_input, EncodedImage):
+        return image_input
+    elif isinstance(image_input, Image.Image):
+        return EncodedImage.from_image(image_input)
+    elif isinstance(image_input, (bytes, bytearray)):
+        return EncodedImage.from_upload(bytes(image_input))
+    elif isinstance(image_input, str):
+        if image_input.startswith('http'):
+            import requests
+            response = requests.get(image_input)
+            response.raise_for_status()
+            return EncodedImage.from_upload(response.content)
+        if image_input.startswith('data:image'):
+            image_input = image_input.split(',')[1]
+        return EncodedImage.from_upload(base64.b64decode(image_input))
+    else:
+        raise ValueError(f"Unsupported image input type: {type(image_input)}")
+
+
 def resize_to_target(image: Image.Image, target_size: int = 768) -> Image.Image:
     """Resize image so that the longer side equals target_size, maintaining aspect ratio."""
     w, h = image.size
@@ -115,6 +208,9 @@ def align_face_horizontal(image: Image.Image) -> Tuple[Image.Image, Optional[dic
     Align face so that eyes are horizontal using MediaPipe Face Detection.
     Returns aligned image and alignment info.
     """
+    import mediapipe as mp  # Heavy import, only needed for alignment
+    import cv2
+
     mp_face_detection = mp.solutions.face_detection
     mp_drawing = mp.solutions.drawing_utils
     
@@ -234,6 +330,7 @@ def create_circular_mask(size: Tuple[int, int], center: Tuple[int, int], radius:
 
 def feather_mask(mask: np.ndarray, feather_px: int) -> np.ndarray:
     """Apply feathering (Gaussian blur) to mask edges."""
+    import cv2
     if feather_px <= 0:
         return mask
     
@@ -246,6 +343,7 @@ def feather_mask(mask: np.ndarray, feather_px: int) -> np.ndarray:
 
 def morphological_cleanup(mask: np.ndarray, kernel_size: int = 3) -> np.ndarray:
     """Clean up mask using morphological operations (opening + closing)."""
+    import cv2
     kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
     
     # Opening: remove small noise
@@ -295,6 +393,7 @@ def blend_images_with_mask(background: Image.Image, foreground: Image.Image, mas
 
 def get_bbox_from_mask(mask: np.ndarray) -> Tuple[int, int, int, int]:
     """Get bounding box coordinates (x, y, w, h) from binary mask."""
+    import cv2
     coords = cv2.findNonZero(mask)
     if coords is not None:
         x, y, w, h = cv2.boundingRect(coords)
@@ -318,6 +417,7 @@ def adjust_mask_volume(mask: Image.Image, strength: int, max_pixel_change: int =
     Adjust the volume of a mask by dilating or eroding it based on strength.
     Strength is on a scale of 0-100. 50 is neutral (no change).
     """
+    import cv2
     if strength == 50:
         return mask
 
@@ -352,6 +452,7 @@ def adjust_chin_mask_volume(mask: Image.Image, strength: int, max_pixel_projecti
     Adjusts the chin mask to simulate filler by adding projection and rounding.
     The effect is strongest at the bottom-center of the chin.
     """
+    import cv2
     if strength <= 50:
         # For now, we only handle volume increase for chin. 
         # Erosion could be added here if needed.
@@ -0,0 +1,259 @@
+"""
+Pool of long-lived Gemini worker processes.
+Each worker runs `gemini_worker.py --serve`, imports google-genai and creates
+its client once, then handles jobs sent over its stdin / stdout with the
+framing from engine.worker_protocol. The pool hands out idle workers to async
+callers, pings idle workers periodically, replaces workers that die or time
+out and recycles each worker after a number of jobs. While it runs, the API
+process and its workers split the Gemini quota (engine.rate_limit).
+"""
+
+import os
+import sys
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set
+
+from . import rate_limit
+from .worker_protocol import Frame, ProtocolError, encode_frame, read_frame_async
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+GEMINI_WORKER_POOL_SIZE = int(os.getenv("GEMINI_WORKER_POOL_SIZE", "2"))
+GEMINI_WORKER_MAX_JOBS = int(os.getenv("GEMINI_WORKER_MAX_JOBS", "100"))  # Recycle after this many jobs
+GEMINI_WORKER_TIMEOUT_S = float(os.getenv("GEMINI_WORKER_TIMEOUT_S", "40"))
+GEMINI_WORKER_START_TIMEOUT_S = float(os.getenv("GEMINI_WORKER_START_TIMEOUT_S", "30"))
+GEMINI_WORKER_HEALTH_INTERVAL_S = float(os.getenv("GEMINI_WORKER_HEALTH_INTERVAL_S", "30"))
+
+ROOT_DIR = Path(__file__).parent.parent
+
+
+class WorkerDiedError(RuntimeError):
+    """The worker process exited or broke the protocol during a request."""
+
+
+class WorkerProcess:
+    """One pooled worker process and its pipes."""
+
+    def __init__(self, command: Sequence[str], env: Optional[Dict[str, str]] = None):
+        self.command = list(command)
+        self.env = env
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.jobs_done = 0
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid if self.process else None
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self, timeout_s: float = GEMINI_WORKER_START_TIMEOUT_S) -> None:
+        """Spawn the process and wait for its ready frame (client created)."""
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, cwd=str(ROOT_DIR),
+            env=self.env,
+        )
+        try:
+            header, _ = await asyncio.wait_for(self._read(), timeout_s)
+        except BaseException:
+            self.kill()
+            raise
+        if header.get("type") != "ready":
+            self.kill()
+            raise WorkerDiedError(f"Worker failed to start: {header.get('error', header)}")
+        logger.info(f"Gemini worker {self.pid} ready")
+
+    async def _read(self) -> Frame:
+        try:
+            return await read_frame_async(self.process.stdout)
+        except (asyncio.IncompleteReadError, ProtocolError) as e:
+            raise WorkerDiedError(f"Gemini worker {self.pid} exited or sent garbage: {e}") from e
+
+    async def request(self, header: Dict, blobs: Sequence[bytes] = (), timeout_s: float = GEMINI_WORKER_TIMEOUT_S) -> Frame:
+        """
+        Send one request and wait for its response. On timeout or cancellation the
+        worker's state is unknown, so it is killed and the pool replaces it.
+        """
+        if not self.alive:
+            raise WorkerDiedError(f"Gemini worker {self.pid} is not running")
+        try:
+            self.process.stdin.write(encode_frame(header, blobs))
+            await self.process.stdin.drain()
+            return await asyncio.wait_for(self._read(), timeout_s)
+        except (ConnectionError, BrokenPipeError) as e:
+            self.kill()
+            raise WorkerDiedError(f"Gemini worker {self.pid} closed its pipe: {e}") from e
+        except BaseException:
+            self.kill()
+            raise
+
+    async def ping(self, timeout_s: float = 5.0) -> bool:
+        try:
+            header, _ = await self.request({"type": "ping"}, timeout_s=timeout_s)
+            return header.get("type") == "pong"
+        except (WorkerDiedError, asyncio.TimeoutError):
+            return False
+
+    def kill(self) -> None:
+        if self.alive:
+            self.process.kill()
+
+    async def stop(self, timeout_s: float = 5.0) -> None:
+        """Ask the worker to exit, killing it if it does not."""
+        if not self.alive:
+            return
+        try:
+            self.process.stdin.write(encode_frame({"type": "shutdown"}))
+            await self.process.stdin.drain()
+            self.process.stdin.close()
+            await asyncio.wait_for(self.process.wait(), timeout_s)
+        except (ConnectionError, asyncio.TimeoutError):
+            self.kill()
+            await self.process.wait()
+
+
+class GeminiWorkerPool:
+    """
+    Fixed-size pool of WorkerProcess instances bound to one event loop.
+    Started lazily by the first submit() on a loop; stop() shuts it down.
+    """
+
+    def __init__(self, size: int = GEMINI_WORKER_POOL_SIZE, max_jobs: int = GEMINI_WORKER_MAX_JOBS,
+                 command: Optional[Sequence[str]] = None, timeout_s: float = GEMINI_WORKER_TIMEOUT_S,
+                 health_interval_s: float = GEMINI_WORKER_HEALTH_INTERVAL_S):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.command = list(command or [sys.executable, str(ROOT_DIR / "gemini_worker.py"), "--serve"])
+        self.timeout_s = timeout_s
+        self.health_interval_s = health_interval_s
+        self.workers: List[WorkerProcess] = []
+        self.recycled = 0
+        self._idle: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._replacements: Set[asyncio.Task] = set()
+        self._start_lock: Optional[asyncio.Lock] = None
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._idle is not None:
+            return
+        if self._start_lock is None or self._loop is not loop:
+            self._loop, self._start_lock, self._idle = loop, asyncio.Lock(), None
+        async with self._start_lock:
+            if self._idle is not None:
+                return
+            idle: asyncio.Queue = asyncio.Queue()
+            self.workers = []
+            try:
+                for _ in range(self.size):
+                    idle.put_nowait(await self._spawn())
+            except BaseException:
+                for worker in self.workers:
+                    worker.kill()
+                self.workers = []
+                raise
+            self._idle = idle
+            rate_limit.set_rate_processes(self.rate_processes)
+            self._health_task = loop.create_task(self._health_loop())
+            logger.info(f"Gemini worker pool started with {self.size} workers")
+
+    @property
+    def rate_processes(self) -> int:
+        """Processes sharing the Gemini quota while the pool runs: this one plus the workers."""
+        return 1 + self.size
+
+    async def _spawn(self) -> WorkerProcess:
+        worker = WorkerProcess(self.command, env={**os.environ, "GEMINI_RATE_PROCESSES": str(self.rate_processes)})
+        await worker.start()
+        self.workers.append(worker)
+        return worker
+
+    async def _replace(self, worker: WorkerProcess) -> None:
+        """Stop a worker and put a fresh one into the idle queue."""
+        if worker in self.workers:
+            self.workers.remove(worker)
+        try:
+            await worker.stop()
+        except asyncio.CancelledError:
+            worker.kill()
+            raise
+        if self._idle is None:  # Pool stopped meanwhile
+            return
+        try:
+            self._idle.put_nowait(await self._spawn())
+        except Exception as e:
+            # Keep capacity: retry on the next health check
+            logger.error(f"Could not start replacement Gemini worker: {e}")
+
+    async def submit(self, header: Dict, blobs: Sequence[bytes] = ()) -> Frame:
+        """Run one request on an idle worker (waiting for one if all are busy)."""
+        await self.start()
+        worker = await self._idle.get()
+        healthy = False
+        try:
+            response = await worker.request(header, blobs, timeout_s=self.timeout_s)
+            worker.jobs_done += 1
+            healthy = worker.alive
+            return response
+        finally:
+            if healthy and worker.jobs_done < self.max_jobs:
+                self._idle.put_nowait(worker)
+            else:
+                if healthy:
+                    self.recycled += 1
+                    logger.info(f"Recycling Gemini worker {worker.pid} after {worker.jobs_done} jobs")
+                task = self._loop.create_task(self._replace(worker))
+                self._replacements.add(task)
+                task.add_done_callback(self._replacements.discard)
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval_s)
+            await self.check_health()
+
+    async def check_health(self) -> None:
+        """Ping idle workers, replace unresponsive ones and refill missing capacity."""
+        idle = []
+        while not self._idle.empty():
+            idle.append(self._idle.get_nowait())
+        for worker in idle:
+            if await worker.ping():
+                self._idle.put_nowait(worker)
+            else:
+                logger.warning(f"Gemini worker {worker.pid} failed its health check, replacing it")
+                await self._replace(worker)
+        for _ in range(self.size - len(self.workers)):
+            try:
+                self._idle.put_nowait(await self._spawn())
+            except Exception as e:
+                logger.error(f"Could not start Gemini worker: {e}")
+                break
+
+    async def stop(self) -> None:
+        if self._loop is not asyncio.get_running_loop():
+            return
+        tasks = list(self._replacements) + ([self._health_task] if self._health_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._health_task = None
+        await asyncio.gather(*(worker.stop() for worker in self.workers), return_exceptions=True)
+        self.workers = []
+        if self._idle is not None:
+            rate_limit.set_rate_processes(None)
+        self._idle = None
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "size": self.size,
+            "alive": sum(1 for worker in self.workers if worker.alive),
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "recycled": self.recycled,
+            "jobs_done": [worker.jobs_done for worker in self.workers],
+        }
+
@@ -0,0 +1,78 @@
+"""
+Length-prefixed binary framing between engine.worker_pool and the
+pooled gemini_worker.py processes (their stdin / stdout pipes).
+
+A frame is a 4-byte big-endian header length, a UTF-8 JSON header and the raw
+blobs (images) listed in the header's "blob_sizes". Images travel as bytes,
+so nothing is base64 encoded or written to disk on the way.
+
+A failed job is answered with {"type": "error", "error": ..., "error_type": ...};
+error_type is ERROR_OVERLOAD when Gemini was overloaded (feeds the circuit breaker)
+and ERROR_OTHER otherwise.
+"""
+
+import json
+import struct
+from typing import Any, BinaryIO, Dict, List, Sequence, Tuple
+
+HEADER_LENGTH = struct.Struct(">I")
+MAX_HEADER_BYTES = 1 << 20
+MAX_BLOB_BYTES = 64 << 20
+
+ERROR_OVERLOAD = "overload"
+ERROR_OTHER = "other"
+
+Frame = Tuple[Dict[str, Any], List[bytes]]
+
+
+class ProtocolError(Exception):
+    """Raised for frames that cannot be parsed."""
+
+
+def encode_frame(header: Dict[str, Any], blobs: Sequence[bytes] = ()) -> bytes:
+    header = dict(header, blob_sizes=[len(blob) for blob in blobs])
+    data = json.dumps(header).encode("utf-8")
+    return HEADER_LENGTH.pack(len(data)) + data + b"".join(blobs)
+
+
+def _parse_header(data: bytes) -> Dict[str, Any]:
+    try:
+        header = json.loads(data.decode("utf-8"))
+    except ValueError as e:
+        raise ProtocolError(f"Invalid frame header: {e}") from e
+    sizes = header.get("blob_sizes", [])
+    if any(not isinstance(size, int) or size < 0 or size > MAX_BLOB_BYTES for size in sizes):
+        raise ProtocolError(f"Invalid blob sizes: {sizes}")
+    return header
+
+
+def _check_length(length: int) -> int:
+    if length > MAX_HEADER_BYTES:
+        raise ProtocolError(f"Frame header too large: {length} bytes")
+    return length
+
+
+def write_frame(stream: BinaryIO, header: Dict[str, Any], blobs: Sequence[bytes] = ()) -> None:
+    stream.write(encode_frame(header, blobs))
+    stream.flush()
+
+
+def _read_exactly(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size) if size else b""
+    if len(data) != size:
+        raise EOFError("Stream closed in the middle of a frame" if data else "Stream closed")
+    return data
+
+
+def read_frame(stream: BinaryIO) -> Frame:
+    """Read one frame from a blocking binary stream; EOFError when it is closed."""
+    (length,) = HEADER_LENGTH.unpack(_read_exactly(stream, HEADER_LENGTH.size))
+    header = _parse_header(_read_exactly(stream, _check_length(length)))
+    return header, [_read_exactly(stream, size) for size in header.get("blob_sizes", [])]
+
+
+async def read_frame_async(reader) -> Frame:
+    """Read one frame from an asyncio.StreamReader; IncompleteReadError when it is closed."""
+    (length,) = HEADER_LENGTH.unpack(await reader.readexactly(HEADER_LENGTH.size))
+    header = _parse_header(await reader.readexactly(_check_length(length)))
+    return header, [await reader.readexactly(size) for size in header.get("blob_sizes", [])]
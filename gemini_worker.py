@@ -9,7 +9,12 @@ import argparse
 from pathlib import Path
 from PIL import Image
 from dotenv import load_dotenv
-from io import BytesIO
+from io import BytesIO, StringIO
+
+# Rate-limited, accounted Gemini call shared with the API
+from engine.gemini_client import generate_content_sync, gemini_http_options, gemini_api_key
+from engine.circuit_breaker import is_overload_error
+from engine.upload_encoder import encode_for_upload
 import base64
 
 # Force UTF-8 encoding for Windows
@@ -214,30 +219,37 @@ def get_prompt_for_forehead(volume_ml: float) -> str:
 # --- VEREINFACHTER GEMINI CLIENT ---
 def create_gemini_client():
     """Create simplified Gemini client"""
-    api_key = os.getenv('GOOGLE_API_KEY') or os.getenv('GEMINI_API_KEY')
-    
-    if not api_key:
+    try:
+        api_key = gemini_api_key()  # GEMINI_TRANSPORT=replay kommt ohne Key aus
+    except ValueError:
         raise ValueError("❌ No API key found. Set GOOGLE_API_KEY or GEMINI_API_KEY environment variable.")
     
     print(f"✅ API key loaded (length: {len(api_key)})", file=sys.stderr)
     
     # Simplified client - let Gemini handle the complexity
-    return genai.Client(api_key=api_key)
+    return genai.Client(api_key=api_key, http_options=gemini_http_options())
+
+class AllModelsFailed(Exception):
+    """Kein Modell hat ein Bild geliefert; errors enthält die Exception je fehlgeschlagenem Modell"""
+
+    def __init__(self, errors):
+        super().__init__("💥 All Gemini models failed to generate image")
+        self.errors = errors
+
+def error_type(error: Exception) -> str:
+    """Fehlerart für den Reply-Header: overload, sobald ein Modell überlastet war"""
+    from engine.worker_protocol import ERROR_OVERLOAD, ERROR_OTHER
+    errors = getattr(error, "errors", None) or [error]
+    return ERROR_OVERLOAD if any(is_overload_error(e) for e in errors) else ERROR_OTHER
 
 # --- EINFACHE BILDGENERIERUNG ---
 def generate_image_edit(client, prompt, input_image):
     """Vereinfachte Bildbearbeitung mit Gemini 2.5 Flash Image"""
     
-    # Bild für Gemini vorbereiten (kleinere Größe für bessere Performance)
-    if input_image.size[0] > 768 or input_image.size[1] > 768:
-        # Proportionales Resize
-        input_image.thumbnail((768, 768), Image.Resampling.LANCZOS)
-        print(f"📏 Image resized to {input_image.size}", file=sys.stderr)
-    
-    # Bild zu bytes konvertieren
-    img_buffer = BytesIO()
-    input_image.save(img_buffer, format='JPEG', quality=90)
-    img_bytes = img_buffer.getvalue()
+    # Bild für Gemini vorbereiten: Auflösung und JPEG-Qualität nach Pixel-/Byte-Budget (wie die API)
+    upload = encode_for_upload(input_image)
+    img_bytes = upload.data
+    print(f"📏 Upload encoding: {upload.settings.as_dict()}", file=sys.stderr)
     
     # Direkte Parts für Gemini
     image_part = types.Part.from_bytes(data=img_bytes, mime_type="image/jpeg")
@@ -259,6 +271,7 @@ The output must be a visual image, not a text description."""
         "gemini-1.5-flash-latest"
     ]
     
+    errors = []
     for model_name in models_to_try:
         try:
             print(f"🚀 Trying {model_name}...", file=sys.stderr)
@@ -272,7 +285,8 @@ The output must be a visual image, not a text description."""
             )
             
             # API-Aufruf
-            response = client.models.generate_content(
+            response = generate_content_sync(
+                client,
                 model=model_name,
                 contents=[edit_prompt, image_part],
                 config=config
@@ -321,10 +335,76 @@ The output must be a visual image, not a text description."""
             
         except Exception as e:
             print(f"❌ {model_name} failed: {str(e)[:100]}...", file=sys.stderr)
+            errors.append(e)
             continue
     
     # Alle Modelle fehlgeschlagen
-    raise Exception("💥 All Gemini models failed to generate image")
+    raise AllModelsFailed(errors)
+
+def build_prompt(area: str, volume_ml: float) -> str:
+    """Prompt für Behandlungsbereich und Volumen"""
+    if area.lower() == 'lips':
+        return get_prompt_for_lips(volume_ml)
+    elif area.lower() == 'cheeks':
+        return get_prompt_for_cheeks(volume_ml)
+    elif area.lower() == 'chin':
+        return get_prompt_for_chin(volume_ml)
+    elif area.lower() == 'forehead':
+        return get_prompt_for_forehead(volume_ml)
+    raise ValueError(f"❌ Unsupported area: {area}")
+
+def serve():
+    """
+    Pool-Modus (engine/worker_pool.py): Client einmal erstellen, dann Jobs über
+    stdin/stdout (engine/worker_protocol.py) bearbeiten bis shutdown oder EOF.
+    """
+    import contextlib
+    import traceback
+    from engine.worker_protocol import read_frame, write_frame
+
+    requests, responses = sys.stdin.buffer, sys.stdout.buffer
+    sys.stdout = sys.stderr  # stdout transportiert nur Frames
+
+    load_dotenv()
+    try:
+        client = create_gemini_client()
+    except Exception as e:
+        write_frame(responses, {"type": "error", "error": str(e)})
+        sys.exit(1)
+    write_frame(responses, {"type": "ready", "pid": os.getpid()})
+
+    while True:
+        try:
+            header, blobs = read_frame(requests)
+        except EOFError:
+            break
+        if header["type"] == "shutdown":
+            break
+        if header["type"] == "ping":
+            write_frame(responses, {"type": "pong"})
+            continue
+
+        # stderr pro Job sammeln: enthält Usage-Records und Fehlermeldungen für edit_gemini.py
+        log = StringIO()
+        try:
+            with contextlib.redirect_stderr(log):
+                input_image = Image.open(BytesIO(blobs[0]))
+                if input_image.mode != 'RGB':
+                    input_image = input_image.convert('RGB')
+                prompt = build_prompt(header["area"], header["volume_ml"])
+                result_data, used_model = generate_image_edit(client, prompt, input_image)
+                image_bytes = result_data if isinstance(result_data, bytes) else base64.b64decode(result_data)
+                result_image = Image.open(BytesIO(image_bytes))
+                if result_image.mode != 'RGB':
+                    result_image = result_image.convert('RGB')
+                final_buffer = BytesIO()
+                result_image.save(final_buffer, format='JPEG', quality=85)
+            write_frame(responses, {"type": "result", "model": used_model, "stderr": log.getvalue()},
+                        [final_buffer.getvalue()])
+        except Exception as e:
+            traceback.print_exc(file=log)
+            write_frame(responses, {"type": "error", "error": str(e), "error_type": error_type(e),
+                                    "stderr": log.getvalue()})
 
 def main():
     """Hauptfunktion - vereinfacht"""
@@ -355,16 +435,7 @@ def main():
         # Prompt generieren (UNVERÄNDERT)
         print(f"📝 Generating prompt for {args.area} with {args.volume}ml", file=sys.stderr)
         
-        if args.area.lower() == 'lips':
-            prompt = get_prompt_for_lips(args.volume)
-        elif args.area.lower() == 'cheeks':
-            prompt = get_prompt_for_cheeks(args.volume)
-        elif args.area.lower() == 'chin':
-            prompt = get_prompt_for_chin(args.volume)
-        elif args.area.lower() == 'forehead':
-            prompt = get_prompt_for_forehead(args.volume)
-        else:
-            raise ValueError(f"❌ Unsupported area: {args.area}")
+        prompt = build_prompt(args.area, args.volume)
         
         # Gemini Client erstellen
         client = create_gemini_client()
@@ -438,4 +509,7 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--serve" in sys.argv:
+        serve()
+    else:
+        main()
\ No newline at end of file
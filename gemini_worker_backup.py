@@ -13,6 +13,10 @@ from PIL import Image
 from dotenv import load_dotenv
 from io import BytesIO
 
+# Rate-limited, accounted Gemini call shared with the API
+from engine.rate_limit import is_retryable
+from engine.gemini_client import generate_content_sync
+
 # Force UTF-8 encoding for Windows
 if sys.platform.startswith('win'):
     import codecs
@@ -492,7 +496,8 @@ A second image (mask) is provided showing EXACTLY which area to edit:
             try:
                 print(f"🤖 Trying model: {model_name}")
                 
-                resp = client.models.generate_content(
+                resp = generate_content_sync(
+                    client,
                     model=model_name,
                     contents=contents,  # Text + Image + optional Mask as input
                 )
@@ -504,7 +509,7 @@ A second image (mask) is provided showing EXACTLY which area to edit:
             except Exception as model_error:
                 error_str = str(model_error).lower()
                 
-                if 'quota' in error_str or 'rate' in error_str or '429' in error_str or 'resource_exhausted' in error_str:
+                if is_retryable(model_error):
                     print(f"ERROR QUOTA/RATE LIMIT: {model_name} - {model_error}")
                     print(f"GEMINI {model_name} nicht verfügbar, weiter mit nächstem Modell...")
                     continue
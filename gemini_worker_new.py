@@ -13,6 +13,10 @@ from PIL import Image
 from dotenv import load_dotenv
 from io import BytesIO
 
+# Rate-limited, accounted Gemini call shared with the API
+from engine.rate_limit import is_retryable
+from engine.gemini_client import generate_content_sync
+
 # Force UTF-8 encoding for Windows
 if sys.platform.startswith('win'):
     import codecs
@@ -329,7 +333,8 @@ def generate_with_fallback(client, prompt, image_data, mask_data=None):
             if mask_data:
                 parts.append(mask_data)
             
-            response = client.models.generate_content(
+            response = generate_content_sync(
+                client,
                 model=model_name,
                 contents=[{
                     "parts": parts
@@ -354,7 +359,7 @@ def generate_with_fallback(client, prompt, image_data, mask_data=None):
                 
         except Exception as model_error:
             error_str = str(model_error).lower()
-            if "quota" in error_str or "rate" in error_str or "limit" in error_str:
+            if is_retryable(model_error):
                 print(f"ERROR QUOTA/RATE LIMIT: {model_name} - {model_error}")
                 if "try again" in error_str:
                     print(f"GEMINI {model_name} nicht verfügbar, weiter mit nächstem Modell...")
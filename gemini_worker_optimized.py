@@ -9,6 +9,9 @@ import io
 from PIL import Image
 import logging
 
+# Rate-limited, accounted Gemini call shared with the API
+from engine.gemini_client import generate_content_sync
+
 # Configure logging to stderr so it doesn't interfere with stdout image data
 logging.basicConfig(
     level=logging.INFO,
@@ -363,7 +366,8 @@ This is for educational and consultation visualization purposes only."""
         print("🚀 Calling Gemini 2.5 Flash Image API...", file=sys.stderr)
         
         # Make the API call with optimized configuration
-        response = client.models.generate_content(
+        response = generate_content_sync(
+            client,
             model='gemini-2.5-flash-image-preview',
             contents=content_parts,
             config=types.GenerateContentConfig(
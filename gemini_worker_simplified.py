@@ -10,6 +10,9 @@ from pathlib import Path
 from PIL import Image
 from dotenv import load_dotenv
 from io import BytesIO
+
+# Rate-limited, accounted Gemini call shared with the API
+from engine.gemini_client import generate_content_sync
 import base64
 
 # Force UTF-8 encoding for Windows
@@ -274,7 +277,8 @@ The output must be a visual image, not a text description."""
             )
             
             # API-Aufruf
-            response = client.models.generate_content(
+            response = generate_content_sync(
+                client,
                 model=model_name,
                 contents=[edit_prompt, image_part],
                 config=config
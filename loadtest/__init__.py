@@ -0,0 +1 @@
+"""Load tests for the NuvaFace APIs against a local Gemini stand-in, see loadtest/harness.py."""
@@ -0,0 +1,147 @@
+"""
+Local stand-in for the Gemini REST API, for load tests that must not spend quota.
+Serves the two calls the repo makes through google-genai:
+
+    POST /v1beta/models/{model}:generateContent   image edit
+    GET  /v1beta/models/{model}                   connection warm-up
+
+Point the API at it with GEMINI_BASE_URL=http://127.0.0.1:<port> (any GOOGLE_API_KEY).
+Latency and the error mix (429 quota, 503 overload, 500, responses without an image)
+are configurable; the returned image is a fixed file or a tinted copy of the input.
+
+    python -m loadtest.fake_gemini --port 8090 --latency-ms 800 --jitter-ms 400 --rate-429 0.05
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from PIL import Image, ImageOps
+
+ERROR_STATUSES = {
+    429: ("RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota)."),
+    500: ("INTERNAL", "An internal error has occurred."),
+    503: ("UNAVAILABLE", "The model is overloaded. Please try again later."),
+}
+
+
+@dataclass
+class FakeGeminiConfig:
+    latency_ms: float = 800.0
+    jitter_ms: float = 0.0  # Uniform +/- around latency_ms
+    rate_429: float = 0.0
+    rate_500: float = 0.0
+    rate_503: float = 0.0
+    rate_no_image: float = 0.0  # 200 with a text part only
+    image_path: Optional[str] = None  # Fixed result image; default is a tinted copy of the input
+    seed: Optional[int] = None
+
+
+def _error(status: int) -> JSONResponse:
+    name, message = ERROR_STATUSES[status]
+    return JSONResponse(status_code=status, content={"error": {"code": status, "message": message, "status": name}})
+
+
+def _tinted_copy(data: bytes) -> bytes:
+    """The input with slightly lifted shadows, so the API's identical-result check passes."""
+    image = Image.open(io.BytesIO(data)).convert("RGB")
+    image = ImageOps.autocontrast(image, cutoff=1).point(lambda value: min(255, value + 6))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def _b64decode(data: str) -> bytes:
+    # google-genai sends URL-safe base64 without padding
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _input_image(body: Dict[str, Any]) -> Optional[bytes]:
+    for content in body.get("contents", []):
+        for part in content.get("parts", []):
+            inline = part.get("inlineData") or part.get("inline_data")
+            if inline and inline.get("data"):
+                return _b64decode(inline["data"])
+    return None
+
+
+def create_app(config: FakeGeminiConfig) -> FastAPI:
+    app = FastAPI(title="Fake Gemini")
+    rng = random.Random(config.seed)
+    fixed_image = open(config.image_path, "rb").read() if config.image_path else None
+    stats: Counter = Counter()
+
+    def pick_outcome() -> str:
+        roll = rng.random()
+        for outcome, rate in (("429", config.rate_429), ("500", config.rate_500),
+                              ("503", config.rate_503), ("no_image", config.rate_no_image)):
+            if roll < rate:
+                return outcome
+            roll -= rate
+        return "ok"
+
+    @app.post("/{version}/models/{model}:generateContent")
+    async def generate_content(version: str, model: str, request: Request):
+        body = await request.json()
+        delay_s = max(0.0, config.latency_ms + rng.uniform(-config.jitter_ms, config.jitter_ms)) / 1000
+        await asyncio.sleep(delay_s)
+        outcome = pick_outcome()
+        stats[outcome] += 1
+        if outcome.isdigit():
+            return _error(int(outcome))
+
+        parts = [{"text": "Applied the requested treatment (fake Gemini)."}]
+        if outcome == "ok":
+            image = fixed_image
+            if image is None:
+                data = _input_image(body)
+                image = await asyncio.to_thread(_tinted_copy, data) if data else b""
+            parts.append({"inlineData": {"mimeType": "image/png", "data": base64.b64encode(image).decode("ascii")}})
+        return {
+            "candidates": [{"content": {"role": "model", "parts": parts}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": 1290, "candidatesTokenCount": 1300, "totalTokenCount": 2590},
+            "modelVersion": model,
+        }
+
+    @app.get("/{version}/models/{model}")
+    async def get_model(version: str, model: str):
+        return {"name": f"models/{model}", "displayName": model, "version": "fake"}
+
+    @app.get("/_stats")
+    async def get_stats():
+        return {"responses": dict(stats), "uptime_s": round(time.monotonic() - started, 1)}
+
+    started = time.monotonic()
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local Gemini stand-in for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="Mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform jitter around the latency")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Share of quota errors")
+    parser.add_argument("--rate-500", type=float, default=0.0, help="Share of internal errors")
+    parser.add_argument("--rate-503", type=float, default=0.0, help="Share of overload errors")
+    parser.add_argument("--rate-no-image", type=float, default=0.0, help="Share of text-only responses")
+    parser.add_argument("--image", dest="image_path", help="Return this image instead of a tinted copy of the input")
+    parser.add_argument("--seed", type=int, help="Seed for latency and error draws")
+    args = parser.parse_args()
+
+    config = FakeGeminiConfig(**{k: v for k, v in vars(args).items() if k not in ("host", "port")})
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+"""
+Load test for the NuvaFace API and the risk map API without spending Gemini quota.
+Starts loadtest/fake_gemini.py, api.main:app (pointed at it via GEMINI_BASE_URL) and
+backend/risk_map/app.py as local uvicorn processes, drives concurrent simulate,
+segment and risk-map traffic with closed-loop virtual users and reports throughput,
+latency percentiles per scenario and the servers' event-loop lag (from the
+event_loop_lag_seconds histogram on /metrics). High loop lag means something
+blocks the event loop, e.g. sync work in an async handler.
+
+    python -m loadtest.harness --users 16 --duration 60 --mix simulate=6,segment=3,risk_map=1
+    python -m loadtest.harness --gemini-latency-ms 2000 --rate-429 0.05 --json report.json
+    python -m loadtest.harness --api-url http://localhost:8000 --no-risk-map   # against running servers
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from PIL import Image
+from prometheus_client.parser import text_string_to_metric_families
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_IMAGE = os.path.join(PROJECT_ROOT, "testbild.png")
+AREAS = ["lips", "chin", "cheeks", "forehead"]
+LOOP_LAG_METRIC = "event_loop_lag_seconds"
+# Last stderr lines of a managed server kept for the "exited" error
+STDERR_TAIL_LINES = 50
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ManagedServer:
+    """
+    A uvicorn (or other) server subprocess that is polled until it answers ready_path.
+    Its stderr is drained by a thread for the whole run (a full pipe would block the
+    server's logging and hang it); only the last lines are kept.
+    """
+
+    def __init__(self, name: str, command: Sequence[str], port: int, ready_path: str = "/health/ready",
+                 env: Optional[Dict[str, str]] = None, cwd: str = PROJECT_ROOT):
+        self.name = name
+        self.command = list(command)
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        self.ready_path = ready_path
+        self.env = dict(os.environ, **(env or {}))
+        self.cwd = cwd
+        self.process: Optional[subprocess.Popen] = None
+        self.stderr_tail: Deque[str] = deque(maxlen=STDERR_TAIL_LINES)
+        self._stderr_thread: Optional[threading.Thread] = None
+
+    def _drain_stderr(self) -> None:
+        for line in iter(self.process.stderr.readline, b""):
+            self.stderr_tail.append(line.decode(errors="replace"))
+        self.process.stderr.close()
+
+    async def start(self, timeout_s: float = 60.0) -> None:
+        self.process = subprocess.Popen(self.command, cwd=self.cwd, env=self.env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, name=f"{self.name}-stderr", daemon=True)
+        self._stderr_thread.start()
+        deadline = time.monotonic() + timeout_s
+        async with httpx.AsyncClient() as client:
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    self._stderr_thread.join(timeout=5)
+                    raise RuntimeError(f"{self.name} exited: {''.join(self.stderr_tail)[-2000:]}")
+                try:
+                    if (await client.get(self.url + self.ready_path, timeout=2)).status_code == 200:
+                        return
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.2)
+        self.stop()
+        raise TimeoutError(f"{self.name} was not ready after {timeout_s}s")
+
+    def stop(self) -> None:
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+def uvicorn_command(app: str, port: int) -> List[str]:
+    return [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+
+
+@dataclass
+class Sample:
+    scenario: str
+    status: int  # 0 for transport errors
+    latency_s: float
+
+
+@dataclass
+class LoadConfig:
+    api_url: str
+    risk_map_url: Optional[str] = None
+    users: int = 8
+    duration_s: float = 30.0
+    mix: Dict[str, float] = field(default_factory=lambda: {"simulate": 6, "segment": 3, "risk_map": 1})
+    image_base64: str = ""
+    timeout_s: float = 120.0
+    seed: Optional[int] = None
+
+
+def load_image_base64(path: str, max_side: int = 1024) -> str:
+    """The test photo as a JPEG no larger than max_side, like a resized phone upload."""
+    if os.path.exists(path):
+        image = Image.open(path).convert("RGB")
+    else:
+        image = Image.new("RGB", (768, 1024), color=(200, 150, 120))
+    image.thumbnail((max_side, max_side))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def _request(config: LoadConfig, scenario: str, rng: random.Random) -> Tuple[str, dict]:
+    if scenario == "simulate":
+        return config.api_url + "/simulate/filler", {
+            "image": config.image_base64, "area": rng.choice(AREAS), "strength": rng.choice([0.5, 1.0, 2.0, 3.0]),
+        }
+    if scenario == "segment":
+        return config.api_url + "/segment", {"image": config.image_base64, "area": "lips"}
+    if scenario == "risk_map":
+        return config.risk_map_url + "/api/risk-map/analyze", {"image": config.image_base64, "treatment_area": "lips"}
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+async def _virtual_user(client: httpx.AsyncClient, config: LoadConfig, scenarios: List[str], weights: List[float],
+                        deadline: float, rng: random.Random, samples: List[Sample]) -> None:
+    while time.monotonic() < deadline:
+        scenario = rng.choices(scenarios, weights)[0]
+        url, body = _request(config, scenario, rng)
+        start = time.perf_counter()
+        try:
+            status = (await client.post(url, json=body, timeout=config.timeout_s)).status_code
+        except httpx.HTTPError:
+            status = 0
+        samples.append(Sample(scenario, status, time.perf_counter() - start))
+
+
+async def scrape_loop_lag(client: httpx.AsyncClient, url: str) -> Dict[str, Dict[float, float]]:
+    """Cumulative event-loop lag bucket counts per app label, {app: {le: count}}."""
+    try:
+        text = (await client.get(url + "/metrics", timeout=10)).text
+    except httpx.HTTPError:
+        return {}
+    buckets: Dict[str, Dict[float, float]] = defaultdict(dict)
+    for family in text_string_to_metric_families(text):
+        if family.name != LOOP_LAG_METRIC:
+            continue
+        for sample in family.samples:
+            if sample.name == LOOP_LAG_METRIC + "_bucket":
+                buckets[sample.labels["app"]][float(sample.labels["le"])] = sample.value
+    return dict(buckets)
+
+
+def histogram_quantile(buckets: Dict[float, float], q: float) -> Optional[float]:
+    """Upper bound of the bucket containing quantile q of cumulative bucket counts."""
+    total = buckets.get(math.inf, 0)
+    if not total:
+        return None
+    for bound in sorted(buckets):
+        if buckets[bound] >= q * total:
+            return bound
+    return math.inf
+
+
+def loop_lag_report(before: Dict[str, Dict[float, float]], after: Dict[str, Dict[float, float]]) -> Dict[str, dict]:
+    report = {}
+    for app, counts in after.items():
+        delta = {bound: count - before.get(app, {}).get(bound, 0) for bound, count in counts.items()}
+        worst, previous = None, 0.0
+        for bound in sorted(delta):
+            if delta[bound] > previous:
+                worst = bound
+            previous = delta[bound]
+        report[app] = {
+            "samples": int(delta.get(math.inf, 0)),
+            "p50_ms": _ms(histogram_quantile(delta, 0.5)),
+            "p99_ms": _ms(histogram_quantile(delta, 0.99)),
+            "max_bucket_ms": _ms(worst),
+        }
+    return report
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    """Milliseconds; None without data or beyond the largest histogram bucket."""
+    if seconds is None or math.isinf(seconds):
+        return None
+    return round(seconds * 1000, 1)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(pct / 100 * len(ordered))) - 1]
+
+
+def summarize(samples: List[Sample], elapsed_s: float) -> Dict[str, dict]:
+    by_scenario: Dict[str, List[Sample]] = defaultdict(list)
+    for sample in samples:
+        by_scenario[sample.scenario].append(sample)
+    summary = {}
+    for scenario, items in sorted(by_scenario.items()):
+        ok = [s.latency_s for s in items if 200 <= s.status < 300]
+        summary[scenario] = {
+            "requests": len(items),
+            "ok": len(ok),
+            "throughput_rps": round(len(ok) / elapsed_s, 2),
+            "p50_ms": _ms(percentile(ok, 50)),
+            "p95_ms": _ms(percentile(ok, 95)),
+            "p99_ms": _ms(percentile(ok, 99)),
+            "statuses": dict(Counter(str(s.status) for s in items)),
+        }
+    return summary
+
+
+async def run_load(config: LoadConfig) -> dict:
+    """Drive traffic against already running servers and return the report."""
+    scenarios = [name for name, weight in config.mix.items() if weight > 0
+                 and (name != "risk_map" or config.risk_map_url)]
+    weights = [config.mix[name] for name in scenarios]
+    targets = [config.api_url] + ([config.risk_map_url] if config.risk_map_url else [])
+    rng = random.Random(config.seed)
+    samples: List[Sample] = []
+
+    limits = httpx.Limits(max_connections=config.users * 2, max_keepalive_connections=config.users * 2)
+    async with httpx.AsyncClient(limits=limits) as client:
+        before = {}
+        for url in targets:
+            before.update(await scrape_loop_lag(client, url))
+        start = time.monotonic()
+        deadline = start + config.duration_s
+        await asyncio.gather(*(
+            _virtual_user(client, config, scenarios, weights, deadline, random.Random(rng.random()), samples)
+            for _ in range(config.users)
+        ))
+        elapsed_s = time.monotonic() - start
+        after = {}
+        for url in targets:
+            after.update(await scrape_loop_lag(client, url))
+
+    return {
+        "users": config.users,
+        "elapsed_s": round(elapsed_s, 1),
+        "requests": len(samples),
+        "throughput_rps": round(sum(200 <= s.status < 300 for s in samples) / elapsed_s, 2),
+        "scenarios": summarize(samples, elapsed_s),
+        "event_loop_lag": loop_lag_report(before, after),
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"\n{report['requests']} requests from {report['users']} users in {report['elapsed_s']}s "
+          f"({report['throughput_rps']} ok/s)")
+    print(f"{'scenario':<10} {'req':>6} {'ok':>6} {'rps':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  statuses")
+    for name, row in report["scenarios"].items():
+        print(f"{name:<10} {row['requests']:>6} {row['ok']:>6} {row['throughput_rps']:>7} {row['p50_ms']!s:>9} "
+              f"{row['p95_ms']!s:>9} {row['p99_ms']!s:>9}  {row['statuses']}")
+    for app, lag in report["event_loop_lag"].items():
+        print(f"Event-loop lag {app}: p50 <= {lag['p50_ms']} ms, p99 <= {lag['p99_ms']} ms, "
+              f"worst bucket {lag['max_bucket_ms']} ms ({lag['samples']} probes)")
+
+
+async def _main_async(args) -> dict:
+    servers: List[ManagedServer] = []
+    api_url, risk_map_url = args.api_url, args.risk_map_url
+    try:
+        if not api_url:
+            port = free_port()
+            gemini = ManagedServer("fake-gemini", [
+                sys.executable, "-m", "loadtest.fake_gemini", "--port", str(port),
+                "--latency-ms", str(args.gemini_latency_ms), "--jitter-ms", str(args.gemini_jitter_ms),
+                "--rate-429", str(args.rate_429), "--rate-503", str(args.rate_503),
+                "--rate-500", str(args.rate_500), "--rate-no-image", str(args.rate_no_image),
+            ], port, ready_path="/_stats")
+            servers.append(gemini)
+            await gemini.start()
+
+            port = free_port()
+            api = ManagedServer("api", uvicorn_command("api.main:app", port), port, env={
+                "GEMINI_BASE_URL": gemini.url, "GOOGLE_API_KEY": "loadtest", "LOG_LEVEL": "WARNING",
+            })
+            servers.append(api)
+            await api.start()
+            api_url = api.url
+        if not risk_map_url and not args.no_risk_map:
+            port = free_port()
+            risk_map = ManagedServer("risk-map", uvicorn_command("app:app", port), port,
+                                     cwd=os.path.join(PROJECT_ROOT, "backend", "risk_map"),
+                                     # Repository root on the path for the shared api/ modules, as in the image
+                                     env={"LOG_LEVEL": "WARNING", "PYTHONPATH": PROJECT_ROOT})
+            servers.append(risk_map)
+            await risk_map.start()
+            risk_map_url = risk_map.url
+
+        config = LoadConfig(
+            api_url=api_url, risk_map_url=risk_map_url, users=args.users, duration_s=args.duration,
+            mix=parse_mix(args.mix), image_base64=load_image_base64(args.image, args.max_side), seed=args.seed,
+        )
+        print(f"Running {args.users} users for {args.duration}s against {api_url}"
+              + (f" and {risk_map_url}" if risk_map_url else ""))
+        return await run_load(config)
+    finally:
+        for server in reversed(servers):
+            server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test with a local Gemini stand-in")
+    parser.add_argument("--users", type=int, default=8, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of traffic")
+    parser.add_argument("--mix", default="simulate=6,segment=3,risk_map=1", help="Scenario weights")
+    parser.add_argument("--image", default=DEFAULT_IMAGE, help="Test photo sent with every request")
+    parser.add_argument("--max-side", type=int, default=1024, help="Resize the test photo to this size")
+    parser.add_argument("--seed", type=int, help="Seed for scenario and parameter choices")
+    parser.add_argument("--api-url", help="Use a running NuvaFace API instead of starting one with fake Gemini")
+    parser.add_argument("--risk-map-url", help="Use a running risk map API instead of starting one")
+    parser.add_argument("--no-risk-map", action="store_true", help="Skip risk map traffic")
+    parser.add_argument("--gemini-latency-ms", type=float, default=800.0)
+    parser.add_argument("--gemini-jitter-ms", type=float, default=300.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-503", type=float, default=0.0)
+    parser.add_argument("--rate-500", type=float, default=0.0)
+    parser.add_argument("--rate-no-image", type=float, default=0.0)
+    parser.add_argument("--max-loop-lag-ms", type=float,
+                        help="Exit with status 1 if any server's p99 event-loop lag exceeds this")
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(_main_async(args))
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.max_loop_lag_ms is not None:
+        too_slow = {app: lag["p99_ms"] for app, lag in report["event_loop_lag"].items()
+                    if lag["samples"] and (lag["p99_ms"] is None or lag["p99_ms"] > args.max_loop_lag_ms)}
+        if too_slow:
+            print(f"❌ Event-loop lag p99 above {args.max_loop_lag_ms} ms: {too_slow}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
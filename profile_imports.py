@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Profile how long importing a module takes, broken down per imported module.
+Runs `python -X importtime` in a fresh interpreter so nothing is cached.
+
+    python profile_imports.py                      # api.main, top 25 packages
+    python profile_imports.py --by module --top 40
+    python profile_imports.py backend.risk_map.app
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure_imports(module: str) -> List[Tuple[str, int, int]]:
+    """(module, self_us, cumulative_us) for every module imported by `import module`."""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{process.stderr[-2000:]}")
+
+    entries = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        entries.append((name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+
+def by_package(entries: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    """Self time summed per top-level package, in microseconds."""
+    totals: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in entries:
+        totals[name.split(".")[0]] += self_us
+    return dict(totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-module import time breakdown")
+    parser.add_argument("module", nargs="?", default="api.main", help="Module to import (default: api.main)")
+    parser.add_argument("--by", choices=["package", "module"], default="package",
+                        help="Group self time by top-level package or list modules by cumulative time")
+    parser.add_argument("--top", type=int, default=25, help="Number of rows to show")
+    args = parser.parse_args()
+
+    entries = measure_imports(args.module)
+    total_us = next((cumulative for name, _, cumulative in entries if name == args.module), 0)
+
+    print(f"Import of {args.module}: {total_us / 1000:.0f} ms ({len(entries)} modules)\n")
+    if args.by == "package":
+        rows = sorted(by_package(entries).items(), key=lambda item: item[1], reverse=True)
+        print(f"{'package':<40} {'self ms':>10} {'share':>7}")
+        for name, self_us in rows[:args.top]:
+            print(f"{name:<40} {self_us / 1000:>10.1f} {self_us / max(total_us, 1):>7.1%}")
+    else:
+        rows = sorted(entries, key=lambda entry: entry[2], reverse=True)
+        print(f"{'module':<60} {'self ms':>10} {'cumul. ms':>10}")
+        for name, self_us, cumulative_us in rows[:args.top]:
+            print(f"{name:<60} {self_us / 1000:>10.1f} {cumulative_us / 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,855 @@
+"""
+Test suite for the NuvaFace API endpoints.
+Gemini is replaced by a local stand-in so the tests run offline.
+"""
+
+import asyncio
+import base64
+import functools
+import hashlib
+import io
+import json
+import sys
+import os
+
+import pytest
+from PIL import Image
+from fastapi.testclient import TestClient
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api.main as api_main
+from engine.utils import EncodedImage
+
+
+def make_image_base64(size=(64, 48), color=(200, 150, 120)) -> str:
+    """Create a small base64 encoded test photo."""
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color=color).save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    """Replace the Gemini call with a stand-in that tints the image by volume."""
+    calls = []
+
+    async def fake_call(input_image, volume_ml, area, img_bytes=None):
+        calls.append({"volume_ml": volume_ml, "area": area, "img_bytes": img_bytes})
+        # Larger volumes finish first so completion order differs from request order
+        await asyncio.sleep(0.01 * (5 - volume_ml))
+        shade = int(40 * volume_ml)
+        buffer = io.BytesIO()
+        Image.new('RGB', input_image.size, color=(shade, shade, shade)).save(buffer, format='PNG')
+        return EncodedImage(data=buffer.getvalue(), mime_type='image/png')
+
+    monkeypatch.setattr(api_main, "_direct_gemini_call_working", fake_call)
+    return calls
+
+
+@pytest.fixture
+def client():
+    with TestClient(api_main.app) as test_client:
+        yield test_client
+
+
+class TestSimulateEndpoint:
+    """Test suite for /simulate/filler."""
+
+    def test_gemini_png_is_served_unchanged(self, client, monkeypatch):
+        """A PNG from Gemini is passed through byte for byte and hashed once."""
+        gemini_png = make_image_bytes(color=(10, 20, 30), format='PNG')
+
+        async def fake_call(input_image, volume_ml, area, img_bytes=None):
+            return EncodedImage(data=gemini_png, mime_type='image/png')
+
+        monkeypatch.setattr(api_main, "_direct_gemini_call_working", fake_call)
+        response = client.post("/simulate/filler", json={
+            "image": make_image_base64(), "area": "lips", "strength": 1.0
+        })
+
+        assert response.status_code == 200
+        body = response.json()
+        assert base64.b64decode(body["result_png"]) == gemini_png
+        assert body["qc"]["result_hash"] == hashlib.sha256(gemini_png).hexdigest()
+
+    def test_png_original_is_echoed_unchanged(self, client, fake_gemini):
+        """A PNG upload is returned as original_png without re-encoding."""
+        original_base64 = make_image_base64()
+        response = client.post("/simulate/filler", json={
+            "image": original_base64, "area": "chin", "strength": 2.0
+        })
+
+        assert response.json()["original_png"] == original_base64
+
+    def test_jpeg_result_is_converted_to_png(self, client, monkeypatch):
+        """Non-PNG Gemini output is re-encoded once so result_png stays a PNG."""
+        async def fake_call(input_image, volume_ml, area, img_bytes=None):
+            return EncodedImage(data=make_image_bytes(format='JPEG'), mime_type='image/jpeg')
+
+        monkeypatch.setattr(api_main, "_direct_gemini_call_working", fake_call)
+        response = client.post("/simulate/filler", json={
+            "image": make_image_base64(), "area": "lips", "strength": 1.0
+        })
+
+        assert base64.b64decode(response.json()["result_png"]).startswith(b'\x89PNG\r\n\x1a\n')
+
+
+class TestOutputFormats:
+    """Test suite for output codec selection."""
+
+    def test_webp_requested_in_body(self, client, fake_gemini):
+        """output_format=webp encodes result and original as WebP."""
+        response = client.post("/simulate/filler", json={
+            "image": make_image_base64(), "area": "lips", "strength": 1.0,
+            "output_format": "webp", "quality": 70
+        })
+
+        body = response.json()
+        assert body["image_format"] == "webp"
+        for key in ("result_png", "original_png"):
+            data = base64.b64decode(body[key])
+            assert data[:4] == b'RIFF' and data[8:12] == b'WEBP'
+        assert base64.b64decode(body["mask_png"]).startswith(b'\x89PNG\r\n\x1a\n')
+
+    def test_binary_negotiates_from_accept_header(self, client, fake_gemini):
+        """Without output_format the binary endpoint honours the Accept header."""
+        response = client.post(
+            "/simulate/filler/binary",
+            files={"image": ("face.jpg", make_image_bytes(), "image/jpeg")},
+            data={"area": "lips", "strength": "1.0"},
+            headers={"Accept": "image/webp;q=0.5, image/jpeg"},
+        )
+
+        assert response.headers["content-type"] == "image/jpeg"
+        assert response.content.startswith(b'\xff\xd8\xff')
+
+    @pytest.mark.parametrize("accept,expected", [
+        (None, "png"),
+        ("*/*", "png"),
+        ("application/json", "png"),
+        ("image/webp,image/png;q=0.9", "webp"),
+        ("image/webp;q=0, image/jpeg;q=0.4", "jpeg"),
+    ])
+    def test_negotiate_output_format(self, accept, expected):
+        """Accept parsing picks the highest-q supported image type."""
+        from api.codecs import negotiate_output_format
+        assert negotiate_output_format(None, accept).value == expected
+
+    def test_explicit_format_wins_over_accept(self):
+        from api.codecs import negotiate_output_format
+        from api.schemas import OutputFormat
+        assert negotiate_output_format(OutputFormat.JPEG, "image/webp") == OutputFormat.JPEG
+
+    @pytest.mark.parametrize("mode", ["RGBA", "LA", "P"])
+    @pytest.mark.parametrize("output_format", ["jpeg", "webp"])
+    def test_lossy_formats_accept_any_mode(self, mode, output_format):
+        """Transparent or palette results are flattened to RGB instead of failing to encode."""
+        from api.codecs import encode_output
+        from api.schemas import OutputFormat
+
+        image = Image.new(mode, (16, 12))  # Fully transparent for the alpha modes
+        data = encode_output(EncodedImage.from_image(image), OutputFormat(output_format))
+
+        decoded = Image.open(io.BytesIO(data))
+        assert decoded.mode == "RGB"
+        if mode != "P":
+            assert decoded.getpixel((0, 0)) >= (250, 250, 250)
+
+
+class TestImageHandles:
+    """Test suite for POST /images and image_id requests."""
+
+    def upload(self, client) -> str:
+        response = client.post("/images", files={"image": ("face.jpg", make_image_bytes(), "image/jpeg")})
+        assert response.status_code == 200
+        assert response.json()["width"] == 64
+        return response.json()["image_id"]
+
+    def test_simulate_with_image_id_reuses_payload(self, client, fake_gemini):
+        """Repeated simulations on one handle share the stored Gemini JPEG payload."""
+        image_id = self.upload(client)
+        for area in ("lips", "chin"):
+            response = client.post("/simulate/filler", json={"image_id": image_id, "area": area, "strength": 1.0})
+            assert response.status_code == 200
+
+        assert len(fake_gemini) == 2
+        assert fake_gemini[0]["img_bytes"] is fake_gemini[1]["img_bytes"]
+
+    def test_sweep_with_image_id(self, client, fake_gemini):
+        image_id = self.upload(client)
+        response = client.post("/simulate/filler/sweep", json={"image_id": image_id, "area": "lips", "volumes": [1.0, 2.0]})
+        assert len(response.text.splitlines()) == 2
+
+    def test_unknown_image_id_is_404(self, client, fake_gemini):
+        response = client.post("/simulate/filler", json={"image_id": "nope", "area": "lips", "strength": 1.0})
+        assert response.status_code == 404
+        assert fake_gemini == []
+
+    def test_image_and_image_id_are_exclusive(self, client, fake_gemini):
+        response = client.post("/simulate/filler", json={
+            "image": make_image_base64(), "image_id": "x", "area": "lips", "strength": 1.0
+        })
+        assert response.status_code == 422
+        response = client.post("/simulate/filler", json={"area": "lips", "strength": 1.0})
+        assert response.status_code == 422
+
+    def test_delete_image(self, client):
+        image_id = self.upload(client)
+        assert client.delete(f"/images/{image_id}").status_code == 204
+        assert client.delete(f"/images/{image_id}").status_code == 404
+
+
+class TestSweepEndpoint:
+    """Test suite for /simulate/filler/sweep."""
+
+    def test_sweep_streams_one_line_per_volume(self, client, fake_gemini):
+        """Every requested volume comes back as its own NDJSON line."""
+        volumes = [0.5, 1.0, 2.0, 3.0]
+        response = client.post("/simulate/filler/sweep", json={
+            "image": make_image_base64(), "area": "lips", "volumes": volumes
+        })
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        items = [json.loads(line) for line in response.text.splitlines() if line]
+        assert sorted(item["volume_ml"] for item in items) == volumes
+        assert all(item["error"] is None and item["result_png"] for item in items)
+        assert len({item["result_hash"] for item in items}) == len(volumes)
+
+    def test_sweep_streams_in_completion_order(self, client, fake_gemini):
+        """Results are emitted as they complete, not in request order."""
+        response = client.post("/simulate/filler/sweep", json={
+            "image": make_image_base64(), "area": "chin", "volumes": [0.5, 4.0]
+        })
+
+        items = [json.loads(line) for line in response.text.splitlines() if line]
+        assert [item["volume_ml"] for item in items] == [4.0, 0.5]
+
+    def test_sweep_encodes_image_once(self, client, fake_gemini):
+        """All Gemini calls share the same encoded JPEG payload."""
+        client.post("/simulate/filler/sweep", json={
+            "image": make_image_base64(), "area": "lips", "volumes": [1.0, 2.0, 3.0]
+        })
+
+        payloads = {id(call["img_bytes"]) for call in fake_gemini}
+        assert len(fake_gemini) == 3
+        assert len(payloads) == 1
+        assert fake_gemini[0]["img_bytes"][:3] == b'\xff\xd8\xff'
+
+    def test_sweep_reports_item_errors(self, client, monkeypatch):
+        """A failing volume yields an error line without failing the others."""
+        async def flaky_call(input_image, volume_ml, area, img_bytes=None):
+            if volume_ml == 2.0:
+                raise RuntimeError("SERVER_OVERLOAD")
+            return EncodedImage.from_image(input_image.copy())
+
+        monkeypatch.setattr(api_main, "_direct_gemini_call_working", flaky_call)
+        response = client.post("/simulate/filler/sweep", json={
+            "image": make_image_base64(), "area": "lips", "volumes": [1.0, 2.0]
+        })
+
+        items = {item["volume_ml"]: item for item in map(json.loads, response.text.splitlines())}
+        assert items[1.0]["error"] is None
+        assert "SERVER_OVERLOAD" in items[2.0]["error"]
+
+    def test_sweep_rejects_out_of_range_volume(self, client, fake_gemini):
+        """Volumes outside 0-5 ml are rejected by validation."""
+        response = client.post("/simulate/filler/sweep", json={
+            "image": make_image_base64(), "area": "lips", "volumes": [1.0, 7.5]
+        })
+        assert response.status_code == 422
+
+
+class TestBatchEndpoint:
+    """Test suite for /simulate/batch."""
+
+    def test_items_stream_with_their_own_area_and_volume(self, client, fake_gemini):
+        """Every item comes back as one NDJSON line carrying its index and client reference."""
+        response = client.post("/simulate/batch", json={"items": [
+            {"image": make_image_base64(), "area": "lips", "strength": 1.0, "item_id": "a.jpg"},
+            {"image": make_image_base64(), "area": "chin", "strength": 3.0, "item_id": "b.jpg"},
+        ]})
+
+        assert response.status_code == 200
+        assert response.headers["x-batch-id"]
+        items = {item["index"]: item for item in map(json.loads, response.text.splitlines())}
+        assert (items[0]["item_id"], items[0]["area"], items[0]["volume_ml"]) == ("a.jpg", "lips", 1.0)
+        assert (items[1]["item_id"], items[1]["area"], items[1]["volume_ml"]) == ("b.jpg", "chin", 3.0)
+        assert all(item["error"] is None and item["result_png"] for item in items.values())
+        assert sorted((call["area"], call["volume_ml"]) for call in fake_gemini) == [("chin", 3.0), ("lips", 1.0)]
+
+    def test_item_errors_do_not_fail_the_batch(self, client, fake_gemini):
+        """Bad images and unknown handles are reported per item with their HTTP status."""
+        response = client.post("/simulate/batch", json={"items": [
+            {"image": make_image_base64(), "area": "lips", "strength": 1.0},
+            {"image": "not-an-image", "area": "lips", "strength": 1.0},
+            {"image_id": "missing", "area": "chin", "strength": 1.0},
+        ]})
+
+        items = {item["index"]: item for item in map(json.loads, response.text.splitlines())}
+        assert items[0]["error"] is None
+        assert items[1]["status_code"] == 400
+        assert items[2]["status_code"] == 404
+        assert len(fake_gemini) == 1
+
+    def test_items_are_decoded_in_their_slot_off_the_event_loop(self, client, fake_gemini, monkeypatch):
+        """Decoding waits for the item's scheduler slot and runs in a thread."""
+        seen = []
+        resolve_image = api_main._resolve_image
+
+        def recording_resolve(*args):
+            try:
+                asyncio.get_running_loop()
+                on_loop = True
+            except RuntimeError:
+                on_loop = False
+            seen.append((on_loop, api_main.batch_scheduler._running))
+            return resolve_image(*args)
+
+        monkeypatch.setattr(api_main, "_resolve_image", recording_resolve)
+        item = {"image": make_image_base64(), "area": "lips", "strength": 1.0}
+        response = client.post("/simulate/batch", json={"items": [item, item]})
+
+        assert response.status_code == 200
+        assert seen and all(not on_loop and running >= 1 for on_loop, running in seen)
+
+    def test_too_many_items_is_413(self, client, monkeypatch):
+        monkeypatch.setattr(api_main, "BATCH_MAX_ITEMS", 1)
+        item = {"image": make_image_base64(), "area": "lips", "strength": 1.0}
+        response = client.post("/simulate/batch", json={"items": [item, item]})
+        assert response.status_code == 413
+
+    def test_oversized_body_is_413_before_parsing(self, client, fake_gemini, monkeypatch):
+        for middleware in api_main.app.user_middleware:
+            if "/simulate/batch" in middleware.kwargs.get("paths", ()):
+                monkeypatch.setitem(middleware.kwargs, "max_bytes", 1024)
+        api_main.app.middleware_stack = None
+
+        with TestClient(api_main.app) as limited_client:
+            item = {"image": make_image_base64(size=(256, 256)), "area": "lips", "strength": 1.0}
+            response = limited_client.post("/simulate/batch", json={"items": [item]})
+
+        api_main.app.middleware_stack = None
+        assert response.status_code == 413
+        assert fake_gemini == []
+
+
+class TestCombinedEndpoint:
+    """Test suite for /simulate/combined."""
+
+    TREATMENTS = [{"area": "lips", "volume_ml": 1.0}, {"area": "chin", "volume_ml": 2.0}]
+
+    @pytest.fixture
+    def combined_calls(self, monkeypatch):
+        calls = []
+
+        async def fake_combined(input_image, treatments, img_bytes=None):
+            calls.append(treatments)
+            return EncodedImage.from_image(Image.new('RGB', input_image.size, color=(10, 20, 30)))
+
+        monkeypatch.setattr(api_main, "_direct_gemini_call_combined", fake_combined)
+        return calls
+
+    def test_single_gemini_call(self, client, fake_gemini, combined_calls):
+        """All areas are simulated by one combined call."""
+        response = client.post("/simulate/combined", json={
+            "image": make_image_base64(), "treatments": self.TREATMENTS
+        })
+
+        assert response.status_code == 200
+        body = response.json()
+        assert body["strategy"] == "combined"
+        assert body["gemini_calls"] == 1
+        assert body["qc"]["quality_passed"] is True
+        assert body["params"]["strength_ml"] == 3.0
+        assert combined_calls == [[("lips", 1.0), ("chin", 2.0)]]
+        assert fake_gemini == []
+
+    def test_unchanged_result_falls_back_to_sequential(self, client, fake_gemini, monkeypatch):
+        """A combined result identical to the input is redone area by area, chaining the outputs."""
+        async def unchanged(input_image, treatments, img_bytes=None):
+            return EncodedImage.from_image(input_image.copy())
+
+        monkeypatch.setattr(api_main, "_direct_gemini_call_combined", unchanged)
+        response = client.post("/simulate/combined", json={
+            "image": make_image_base64(), "treatments": self.TREATMENTS
+        })
+
+        body = response.json()
+        assert body["strategy"] == "sequential"
+        assert body["gemini_calls"] == 3
+        assert body["qc"]["quality_passed"] is False
+        assert "identical" in body["warnings"][0]
+        assert [(call["area"], call["volume_ml"]) for call in fake_gemini] == [("lips", 1.0), ("chin", 2.0)]
+        # The second call edits the first call's output, not the original upload
+        assert fake_gemini[0]["img_bytes"] is not None and fake_gemini[1]["img_bytes"] is None
+
+    def test_combined_call_without_image_falls_back(self, client, fake_gemini, monkeypatch):
+        """A combined response without an image also triggers the sequential fallback."""
+        async def failing(input_image, treatments, img_bytes=None):
+            raise RuntimeError("No image data in Gemini response")
+
+        monkeypatch.setattr(api_main, "_direct_gemini_call_combined", failing)
+        response = client.post("/simulate/combined", json={
+            "image": make_image_base64(), "treatments": self.TREATMENTS
+        })
+
+        assert response.status_code == 200
+        assert response.json()["strategy"] == "sequential"
+        assert len(fake_gemini) == 2
+
+    @pytest.mark.parametrize("error", [
+        "429 RESOURCE_EXHAUSTED: quota exceeded",
+        "503 UNAVAILABLE: The model is overloaded",
+        "Gemini call timed out",
+    ])
+    def test_call_errors_do_not_fall_back(self, client, fake_gemini, monkeypatch, error):
+        """Overload, rate-limit and timeout errors are raised instead of multiplying the calls."""
+        async def failing(input_image, treatments, img_bytes=None):
+            raise RuntimeError(error)
+
+        monkeypatch.setattr(api_main, "_direct_gemini_call_combined", failing)
+        response = client.post("/simulate/combined", json={
+            "image": make_image_base64(), "treatments": self.TREATMENTS
+        })
+
+        assert response.status_code == 500
+        assert fake_gemini == []
+
+    @pytest.mark.parametrize("treatments", [
+        [{"area": "lips", "volume_ml": 1.0}],
+        [{"area": "lips", "volume_ml": 1.0}, {"area": "lips", "volume_ml": 2.0}],
+    ])
+    def test_rejects_single_or_duplicate_areas(self, client, treatments):
+        response = client.post("/simulate/combined", json={
+            "image": make_image_base64(), "treatments": treatments
+        })
+        assert response.status_code == 422
+
+    def test_combined_prompt_contains_every_area(self):
+        prompt = api_main.get_combined_prompt([("lips", 1.0), ("forehead", 2.0)])
+
+        assert "TREATMENT 1 OF 2: LIPS" in prompt
+        assert "TREATMENT 2 OF 2: FOREHEAD" in prompt
+        assert api_main.get_prompt_for_lips(1.0) in prompt
+        assert "forehead (frontalis)" in prompt
+
+
+def make_image_bytes(size=(64, 48), color=(200, 150, 120), format='JPEG') -> bytes:
+    """Create a small encoded test photo."""
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color=color).save(buffer, format=format)
+    return buffer.getvalue()
+
+
+class TestBinaryEndpoints:
+    """Test suite for the multipart /simulate/filler/binary and /segment/binary endpoints."""
+
+    def test_simulate_binary_returns_raw_png(self, client, fake_gemini):
+        """The result comes back as raw PNG bytes with JSON metadata in a header."""
+        response = client.post(
+            "/simulate/filler/binary",
+            files={"image": ("face.jpg", make_image_bytes(), "image/jpeg")},
+            data={"area": "lips", "strength": "2.0"},
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/png"
+        assert response.content.startswith(b'\x89PNG\r\n\x1a\n')
+        metadata = json.loads(response.headers["X-NuvaFace-Metadata"])
+        assert metadata["params"]["strength_ml"] == 2.0
+        assert len(metadata["qc"]["result_hash"]) == 64
+        assert fake_gemini[0]["area"] == "lips"
+
+    def test_simulate_binary_validates_strength(self, client, fake_gemini):
+        """Form fields are validated like the JSON request."""
+        response = client.post(
+            "/simulate/filler/binary",
+            files={"image": ("face.jpg", make_image_bytes(), "image/jpeg")},
+            data={"area": "lips", "strength": "9"},
+        )
+        assert response.status_code == 422
+
+    def test_simulate_binary_rejects_oversized_upload(self, client, fake_gemini, monkeypatch):
+        """Uploads above the limit are answered with 413 before reaching Gemini."""
+        for middleware in api_main.app.user_middleware:
+            if middleware.cls is api_main.UploadSizeLimitMiddleware:
+                monkeypatch.setitem(middleware.kwargs, "max_bytes", 1024)
+        api_main.app.middleware_stack = None
+
+        with TestClient(api_main.app) as limited_client:
+            response = limited_client.post(
+                "/simulate/filler/binary",
+                files={"image": ("face.png", make_image_bytes(size=(256, 256), format='PNG') * 4, "image/png")},
+                data={"area": "lips", "strength": "1.0"},
+            )
+
+        api_main.app.middleware_stack = None
+        assert response.status_code == 413
+        assert fake_gemini == []
+
+    def test_oversized_upload_rejection_has_cors_headers(self, client, monkeypatch):
+        """Browsers only see the 413 (not a CORS failure) if the rejection carries CORS headers."""
+        for middleware in api_main.app.user_middleware:
+            if middleware.cls is api_main.UploadSizeLimitMiddleware:
+                monkeypatch.setitem(middleware.kwargs, "max_bytes", 1024)
+        api_main.app.middleware_stack = None
+
+        with TestClient(api_main.app) as limited_client:
+            response = limited_client.post(
+                "/simulate/filler/binary",
+                files={"image": ("face.png", make_image_bytes(size=(256, 256), format='PNG') * 4, "image/png")},
+                data={"area": "lips", "strength": "1.0"},
+                headers={"Origin": "https://app.example.com"},
+            )
+
+        api_main.app.middleware_stack = None
+        assert response.status_code == 413
+        assert response.headers["access-control-allow-origin"]
+
+    def test_segment_binary_rejects_non_lip_area(self, client):
+        """The lips-only segmentation policy applies to the binary variant too."""
+        response = client.post(
+            "/segment/binary",
+            files={"image": ("face.jpg", make_image_bytes(), "image/jpeg")},
+            data={"area": "chin"},
+        )
+        assert response.status_code == 400
+
+    def test_segment_binary_returns_raw_mask(self, client, monkeypatch):
+        """The mask comes back as raw PNG bytes with bbox and confidence in a header."""
+        def fake_segment(image, area):
+            return Image.new('L', image.size, 255), {
+                'bbox': {'x': 1, 'y': 2, 'width': 3, 'height': 4}, 'confidence': 0.9
+            }
+
+        monkeypatch.setattr(api_main, "_segment_image", fake_segment)
+        response = client.post(
+            "/segment/binary",
+            files={"image": ("face.jpg", make_image_bytes(), "image/jpeg")},
+            data={"area": "lips"},
+        )
+
+        assert response.status_code == 200
+        assert response.content.startswith(b'\x89PNG\r\n\x1a\n')
+        metadata = json.loads(response.headers["X-NuvaFace-Metadata"])
+        assert metadata["bbox"] == {'x': 1, 'y': 2, 'width': 3, 'height': 4}
+        assert metadata["confidence"] == 0.9
+
+
+class TestUploadSizeLimitMiddleware:
+    """Test suite for the streaming upload size limit."""
+
+    def test_chunked_body_is_aborted(self):
+        """Bodies without Content-Length are counted as they stream in."""
+        from api.uploads import UploadSizeLimitMiddleware
+        from fastapi import FastAPI, Request
+
+        app = FastAPI()
+
+        @app.post("/upload")
+        async def upload(request: Request):
+            return {"size": len(await request.body())}
+
+        limited = UploadSizeLimitMiddleware(app, max_bytes=10, paths=["/upload"])
+        chunks = [b"x" * 6, b"x" * 6]
+        sent = []
+
+        async def receive():
+            body = chunks.pop(0)
+            return {"type": "http.request", "body": body, "more_body": bool(chunks)}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": "/upload", "headers": [],
+                 "query_string": b"", "root_path": ""}
+        asyncio.run(limited(scope, receive, send))
+        assert sent[0]["status"] == 413
+
+
+class TestCropMode:
+    """Test suite for crop_mode (face-crop round trip)."""
+
+    @pytest.fixture
+    def landmarks(self, monkeypatch):
+        from tests.test_face_crop import make_landmarks
+        calls = []
+
+        def fake_detect(image):
+            calls.append(image.size)
+            return make_landmarks()
+
+        monkeypatch.setattr(api_main, "detect_landmarks", fake_detect)
+        return calls
+
+    def test_face_crop_is_sent_and_composited(self, client, fake_gemini, landmarks):
+        response = client.post("/simulate/filler", json={
+            "image": make_image_base64(size=(600, 500)), "area": "lips", "strength": 2.0, "crop_mode": "face"
+        })
+
+        body = response.json()
+        x1, y1, x2, y2 = body["params"]["crop_box"]
+        result = Image.open(io.BytesIO(base64.b64decode(body["result_png"])))
+        assert result.size == (600, 500)
+        assert result.getpixel((5, 5)) == (200, 150, 120)
+        assert Image.open(io.BytesIO(fake_gemini[0]["img_bytes"])).size == (x2 - x1, y2 - y1)
+        assert body["params"]["upload"]["face_px"] is not None
+
+    def test_large_photo_is_downscaled_for_upload(self, client, fake_gemini, monkeypatch):
+        monkeypatch.setattr(api_main, "encode_for_upload",
+                            functools.partial(api_main.encode_for_upload, max_pixels=200 * 150))
+        response = client.post("/simulate/filler", json={
+            "image": make_image_base64(size=(800, 600)), "area": "lips", "strength": 1.0
+        })
+
+        upload = response.json()["params"]["upload"]
+        assert (upload["width"], upload["height"], upload["source_width"]) == (200, 150, 800)
+        assert upload["budget_met"] is True
+        assert Image.open(io.BytesIO(fake_gemini[0]["img_bytes"])).size == (200, 150)
+
+    def test_landmarks_are_detected_once_per_handle(self, client, fake_gemini, landmarks):
+        upload = client.post("/images", files={"image": ("face.png", make_image_bytes(size=(600, 500), format='PNG'), "image/png")})
+        image_id = upload.json()["image_id"]
+        for area in ("lips", "chin"):
+            response = client.post("/simulate/filler", json={"image_id": image_id, "area": area, "strength": 1.0, "crop_mode": "area"})
+            assert response.status_code == 200
+        assert len(landmarks) == 1
+
+    def test_no_face_falls_back_to_full_photo(self, client, fake_gemini, monkeypatch):
+        monkeypatch.setattr(api_main, "detect_landmarks", lambda image: None)
+        response = client.post("/simulate/filler", json={
+            "image": make_image_base64(), "area": "lips", "strength": 1.0, "crop_mode": "face"
+        })
+        assert response.status_code == 200
+        assert response.json()["params"]["crop_box"] is None
+
+
+def parse_sse(text: str):
+    """Split an SSE body into (event, data) pairs, skipping comments."""
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = [line for line in block.splitlines() if not line.startswith(":")]
+        if not lines:
+            continue
+        fields = dict(line.split(": ", 1) for line in lines)
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+class TestStreamEndpoint:
+    """Test suite for /simulate/filler/stream (Server-Sent Events)."""
+
+    def test_stages_then_result(self, client, fake_gemini):
+        response = client.post("/simulate/filler/stream", json={
+            "image": make_image_base64(), "area": "lips", "strength": 1.0
+        })
+
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = parse_sse(response.text)
+        assert [data["stage"] for event, data in events[:-1]] == [
+            "decoded", "prepared", "submitted", "received", "encoded"
+        ]
+        event, result = events[-1]
+        assert event == "result"
+        assert result["params"]["strength_ml"] == 1.0
+        assert events[-2][1]["elapsed_ms"] >= events[0][1]["elapsed_ms"]
+
+    def test_gemini_failure_is_error_event(self, client, monkeypatch):
+        async def failing_call(input_image, volume_ml, area, img_bytes=None):
+            raise RuntimeError("quota exceeded")
+
+        monkeypatch.setattr(api_main, "_direct_gemini_call_working", failing_call)
+        response = client.post("/simulate/filler/stream", json={
+            "image": make_image_base64(), "area": "lips", "strength": 1.0
+        })
+
+        event, data = parse_sse(response.text)[-1]
+        assert event == "error"
+        assert data["status_code"] == 500 and "quota exceeded" in data["detail"]
+
+    def test_keepalive_while_waiting(self, client, monkeypatch):
+        async def slow_call(input_image, volume_ml, area, img_bytes=None):
+            await asyncio.sleep(0.05)
+            return EncodedImage.from_image(input_image)
+
+        monkeypatch.setattr(api_main, "_direct_gemini_call_working", slow_call)
+        monkeypatch.setattr(api_main, "SSE_KEEPALIVE_S", 0.01)
+        response = client.post("/simulate/filler/stream", json={
+            "image": make_image_base64(), "area": "lips", "strength": 1.0
+        })
+
+        assert ": keepalive" in response.text
+        assert parse_sse(response.text)[-1][0] == "result"
+
+
+class TestJobQueue:
+    """Test suite for /jobs/simulate and /jobs/{job_id}."""
+
+    def test_job_runs_and_long_poll_returns_result(self, client, fake_gemini):
+        response = client.post("/jobs/simulate", json={"image": make_image_base64(), "area": "lips", "strength": 1.0})
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] in ("queued", "running")
+
+        response = client.get(f"/jobs/{job['job_id']}", params={"wait": 5})
+        body = response.json()
+        assert body["status"] == "succeeded"
+        assert body["result"]["params"]["strength_ml"] == 1.0
+        assert body["processing_time_ms"] is not None
+
+    def test_failed_job_reports_error(self, client, monkeypatch):
+        async def failing_call(input_image, volume_ml, area, img_bytes=None):
+            raise RuntimeError("quota exceeded")
+
+        monkeypatch.setattr(api_main, "_direct_gemini_call_working", failing_call)
+        job_id = client.post("/jobs/simulate", json={"image": make_image_base64(), "area": "lips", "strength": 1.0}).json()["job_id"]
+
+        body = client.get(f"/jobs/{job_id}", params={"wait": 5}).json()
+        assert body["status"] == "failed"
+        assert body["status_code"] == 500
+
+    def test_full_queue_is_429_with_retry_after(self, client, monkeypatch):
+        from api.jobs import JobQueue
+        release = asyncio.Event()
+
+        async def blocked_call(input_image, volume_ml, area, img_bytes=None):
+            await release.wait()
+            return EncodedImage.from_image(input_image)
+
+        queue = JobQueue(workers=1, max_queued=1)
+        monkeypatch.setattr(api_main, "job_queue", queue)
+        monkeypatch.setattr(api_main, "_direct_gemini_call_working", blocked_call)
+        payload = {"image": make_image_base64(), "area": "lips", "strength": 1.0}
+
+        statuses = [client.post("/jobs/simulate", json=payload).status_code for _ in range(4)]
+
+        assert statuses[:2] == [202, 202]  # one running, one queued
+        assert 429 in statuses[2:]
+        rejected = client.post("/jobs/simulate", json=payload)
+        assert rejected.status_code == 429
+        assert int(rejected.headers["Retry-After"]) >= 1
+        assert rejected.json()["detail"]["queue_length"] == 1
+
+    def test_unknown_job_is_404(self, client):
+        assert client.get("/jobs/nope").status_code == 404
+
+
+class TestOverload:
+    """Test suite for fast-fail responses while the Gemini circuit is open."""
+
+    def test_open_circuit_is_503_with_retry_after(self, client, monkeypatch):
+        from engine.circuit_breaker import CircuitOpenError
+
+        async def open_circuit(input_image, volume_ml, area, img_bytes=None):
+            raise CircuitOpenError("gemini", 12.3)
+
+        monkeypatch.setattr(api_main, "_direct_gemini_call_working", open_circuit)
+        response = client.post("/simulate/filler", json={"image": make_image_base64(), "area": "lips", "strength": 1.0})
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "12"
+        assert response.json()["detail"]["error"] == "SERVER_OVERLOAD"
+
+
+class TestUsageEndpoint:
+    def test_usage_summary(self, client, monkeypatch):
+        from engine.gemini_usage import UsageLedger, GeminiCallRecord
+        ledger = UsageLedger()
+        ledger.record(GeminiCallRecord(model="m", area="lips", volume_ml=2.0, total_tokens=1000, wall_time_ms=8000))
+        monkeypatch.setattr(api_main, "usage_ledger", ledger)
+
+        body = client.get("/usage/gemini", params={"recent": 5}).json()
+
+        assert body["by_area"]["lips"]["p50_wall_time_ms"] == 8000
+        assert body["recent"][0]["model"] == "m"
+
+
+class TestMetrics:
+    """Test suite for GET /metrics."""
+
+    def test_stage_histograms_and_route_labels(self, client, fake_gemini):
+        client.post("/simulate/filler", json={"image": make_image_base64(), "area": "chin", "strength": 1.0})
+
+        text = client.get("/metrics").text
+
+        for stage in ("decode", "load_image", "gemini_call", "encode", "serialize"):
+            assert f'nuvaface_stage_duration_seconds_count{{area="chin",stage="{stage}"}}' in text
+        assert 'route="/simulate/filler"' in text
+        assert 'nuvaface_payload_bytes_count{area="chin",kind="result_image"}' in text
+
+    def test_degraded_results_are_counted(self, client, monkeypatch):
+        """The input echoed back and one result served for other photos are both flagged."""
+        from engine.perceptual_hash import RecentResults
+        from api.metrics import DEGRADED_RESULTS
+
+        echo = make_image_bytes(color=(200, 150, 120), format='PNG')  # The input photo
+        edited = make_image_bytes(color=(90, 60, 50), format='PNG')
+        results = iter([echo, edited, edited, edited, edited])
+
+        async def fake_call(input_image, volume_ml, area, img_bytes=None):
+            return EncodedImage(data=next(results), mime_type='image/png')
+
+        monkeypatch.setattr(api_main, "_direct_gemini_call_working", fake_call)
+        monkeypatch.setattr(api_main, "recent_results", RecentResults(capacity=8))
+        identical = DEGRADED_RESULTS.labels(kind="identical_input", area="forehead")
+        replay = DEGRADED_RESULTS.labels(kind="replay", area="forehead")
+        before = (identical._value.get(), replay._value.get())
+
+        # The same photo at two volumes may look alike; the same result for other photos may not
+        photos = [(200, 150, 120), (200, 150, 120), (200, 150, 120), (250, 250, 250), (60, 120, 60)]
+        for volume_ml, color in zip((1.0, 1.0, 1.5, 2.0, 3.0), photos):
+            response = client.post("/simulate/filler", json={
+                "image": make_image_base64(color=color), "area": "forehead", "strength": volume_ml
+            })
+            assert response.status_code == 200
+
+        assert identical._value.get() - before[0] == 1
+        assert replay._value.get() - before[1] == 2
+
+    def test_errors_are_counted_by_type(self, client, monkeypatch):
+        async def no_image(input_image, volume_ml, area, img_bytes=None):
+            raise Exception("Working Gemini call failed: No image data in Gemini response")
+
+        monkeypatch.setattr(api_main, "_direct_gemini_call_working", no_image)
+        client.post("/simulate/filler", json={"image": make_image_base64(), "area": "cheeks", "strength": 1.0})
+
+        assert 'nuvaface_errors_total{area="cheeks",type="no_image"}' in client.get("/metrics").text
+
+
+class TestHealthProbes:
+    """Test suite for /health/live and /health/ready."""
+
+    def test_not_ready_until_warmup_finished(self, monkeypatch):
+        from api.warmup import Warmup
+        gate = {}
+
+        async def slow_step():
+            gate["event"] = asyncio.Event()
+            await gate["event"].wait()
+
+        warmup = Warmup(enabled=True)
+        warmup.add("slow", slow_step)
+        monkeypatch.setattr(api_main, "warmup", warmup)
+
+        with TestClient(api_main.app) as client:
+            assert client.get("/health/live").json() == {"status": "alive"}
+            response = client.get("/health/ready")
+            assert response.status_code == 503
+            assert response.json()["steps"][0]["status"] == "running"
+
+            client.portal.call(gate["event"].set)
+            for _ in range(50):
+                response = client.get("/health/ready")
+                if response.status_code == 200:
+                    break
+            assert response.status_code == 200
+            assert response.json()["steps"][0]["status"] == "ok"
+
+
+class TestTempArtifactUsage:
+    def test_usage_endpoint(self, client):
+        body = client.get("/usage/temp-artifacts").json()
+        assert {"sweep_enabled", "files", "bytes", "removed_total"} <= body.keys()
@@ -0,0 +1,79 @@
+"""
+Test suite for the fair batch scheduler (api/batch.py).
+"""
+
+import sys
+import os
+import asyncio
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.batch import FairScheduler
+
+
+class TestFairScheduler:
+    def test_concurrency_is_bounded(self):
+        scheduler = FairScheduler(slots=2)
+        running, peak = 0, 0
+
+        async def item():
+            nonlocal running, peak
+            async with scheduler.slot("a"):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        async def main():
+            await asyncio.gather(*(item() for _ in range(6)))
+
+        asyncio.run(main())
+        assert peak == 2
+        assert scheduler.stats()["running"] == 0
+
+    def test_small_batch_is_not_starved_by_large_one(self):
+        scheduler = FairScheduler(slots=1)
+        order = []
+
+        async def item(batch_id, index):
+            async with scheduler.slot(batch_id):
+                order.append(f"{batch_id}{index}")
+                await asyncio.sleep(0.001)
+
+        async def main():
+            large = [asyncio.create_task(item("L", i)) for i in range(5)]
+            await asyncio.sleep(0)  # The large batch queues first
+            small = [asyncio.create_task(item("S", i)) for i in range(2)]
+            await asyncio.gather(*large, *small)
+
+        asyncio.run(main())
+        # Slots alternate between the batches instead of draining the large one first
+        assert order == ["L0", "S0", "L1", "S1", "L2", "L3", "L4"]
+
+    def test_cancelled_waiter_does_not_leak_a_slot(self):
+        scheduler = FairScheduler(slots=1)
+
+        async def main():
+            release = asyncio.Event()
+
+            async def holder():
+                async with scheduler.slot("a"):
+                    await release.wait()
+
+            async def waiter():
+                async with scheduler.slot("b"):
+                    pass
+
+            held = asyncio.create_task(holder())
+            await asyncio.sleep(0)
+            cancelled = asyncio.create_task(waiter())
+            await asyncio.sleep(0)
+            cancelled.cancel()
+            release.set()
+            await held
+            await asyncio.gather(cancelled, return_exceptions=True)
+            await asyncio.wait_for(waiter(), 1)
+
+        asyncio.run(main())
+        assert scheduler.stats() == {"slots": 1, "running": 0, "waiting": 0, "batches": 0}
@@ -0,0 +1,127 @@
+"""
+Test suite for the offline batch CLI (batch_process.py).
+Gemini and segmentation are replaced by local stand-ins.
+"""
+
+import sys
+import os
+import json
+import time
+import asyncio
+
+from PIL import Image
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_process import (
+    BatchRunner, MANIFEST_NAME, build_report, find_images, load_checkpoint, percentile, plan_tasks,
+)
+
+
+def make_photos(directory, names):
+    for name in names:
+        path = directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        Image.new("RGB", (32, 24), color=(200, 150, 120)).save(path)
+
+
+async def fake_simulate(image, volume_ml, area):
+    await asyncio.sleep(0.001)
+    return Image.new("RGB", image.size, color=(int(40 * volume_ml), 0, 0))
+
+
+def fake_segment(image, area):
+    return Image.new("L", image.size, color=255)
+
+
+class TestPlanning:
+    def test_finds_images_recursively(self, tmp_path):
+        make_photos(tmp_path, ["a.jpg", "clinic/b.png"])
+        (tmp_path / "notes.txt").write_text("not a photo")
+
+        assert find_images(tmp_path) == ["a.jpg", os.path.join("clinic", "b.png")]
+
+    def test_plans_segmentation_and_simulations(self):
+        tasks = plan_tasks(["a.jpg"], ["lips", "chin"], [1.0, 2.0], segment=True, simulate=True)
+
+        assert len(tasks) == 6
+        assert tasks[0].key == "a.jpg|segment|lips|"
+        assert tasks[1].key == "a.jpg|simulate|lips|1"
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 95) == 95
+        assert percentile([], 50) is None
+
+
+class TestBatchRunner:
+    def test_writes_outputs_manifest_and_report(self, tmp_path):
+        make_photos(tmp_path / "in", ["a.jpg", "b.jpg"])
+        tasks = plan_tasks(["a.jpg", "b.jpg"], ["lips"], [1.0, 2.0], segment=True, simulate=True)
+        runner = BatchRunner(tmp_path / "in", tmp_path / "out", workers=3,
+                             simulate=fake_simulate, segment=fake_segment)
+
+        stats = asyncio.run(runner.run(tasks))
+
+        assert (tmp_path / "out" / "a_jpg" / "lips_1ml.png").exists()
+        assert (tmp_path / "out" / "b_jpg" / "lips_mask.png").exists()
+        assert len(load_checkpoint(tmp_path / "out" / MANIFEST_NAME)) == 6
+        report = build_report(stats)
+        assert report["tasks_ok"] == 6 and report["images_completed"] == 2
+        assert report["latency_ms"]["simulate"]["count"] == 4
+        assert report["latency_ms"]["all"]["p95"] is not None
+
+    def test_same_name_with_other_extension_gets_own_directory(self, tmp_path):
+        make_photos(tmp_path / "in", ["a.jpg", "a.png"])
+        tasks = plan_tasks(["a.jpg", "a.png"], ["lips"], [1.0], segment=False, simulate=True)
+        runner = BatchRunner(tmp_path / "in", tmp_path / "out", workers=2, simulate=fake_simulate)
+
+        asyncio.run(runner.run(tasks))
+
+        assert (tmp_path / "out" / "a_jpg" / "lips_1ml.png").exists()
+        assert (tmp_path / "out" / "a_png" / "lips_1ml.png").exists()
+
+    def test_resume_skips_succeeded_and_retries_failed(self, tmp_path):
+        make_photos(tmp_path / "in", ["a.jpg"])
+        tasks = plan_tasks(["a.jpg"], ["lips"], [1.0, 2.0], segment=False, simulate=True)
+        calls = []
+
+        async def flaky(image, volume_ml, area):
+            calls.append(volume_ml)
+            if volume_ml == 2.0 and calls.count(2.0) == 1:
+                raise RuntimeError("SERVER_OVERLOAD: try again later")
+            return await fake_simulate(image, volume_ml, area)
+
+        runner = BatchRunner(tmp_path / "in", tmp_path / "out", workers=1, simulate=flaky)
+        first = asyncio.run(runner.run(tasks))
+        assert (first.ok, first.failed, dict(first.errors)) == (1, 1, {"overload": 1})
+
+        second = asyncio.run(runner.run(tasks))
+        assert (second.ok, second.failed, second.skipped) == (1, 0, 1)
+        assert sorted(calls) == [1.0, 2.0, 2.0]
+
+    def test_truncated_manifest_line_is_ignored(self, tmp_path):
+        manifest = tmp_path / MANIFEST_NAME
+        manifest.write_text(json.dumps({"key": "a.jpg|segment|lips|", "status": "ok"}) + "\n{\"key\": \"a.jp")
+
+        assert load_checkpoint(manifest) == {"a.jpg|segment|lips|"}
+
+    def test_segmentations_never_overlap(self, tmp_path):
+        make_photos(tmp_path / "in", ["a.jpg", "b.jpg", "c.jpg"])
+        tasks = plan_tasks(["a.jpg", "b.jpg", "c.jpg"], ["lips", "chin"], [], segment=True, simulate=False)
+        running, overlaps = [], []
+
+        def exclusive_segment(image, area):
+            running.append(area)
+            overlaps.append(len(running))
+            time.sleep(0.01)
+            running.remove(area)
+            return fake_segment(image, area)
+
+        runner = BatchRunner(tmp_path / "in", tmp_path / "out", workers=4, segment=exclusive_segment)
+        stats = asyncio.run(runner.run(tasks))
+
+        assert stats.ok == 6
+        assert max(overlaps) == 1
@@ -0,0 +1,111 @@
+"""
+Test suite for the Gemini circuit breaker (engine/circuit_breaker.py).
+"""
+
+import sys
+import os
+
+import pytest
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import circuit_breaker
+from engine.circuit_breaker import CircuitBreaker, CircuitOpenError, is_overload_error, CLOSED, OPEN, HALF_OPEN
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", fake)
+    return fake
+
+
+def make_breaker(**kwargs):
+    params = dict(window=10, min_calls=4, error_rate=0.5, slow_call_s=10, open_s=30, probes=2)
+    params.update(kwargs)
+    return CircuitBreaker("test", **params)
+
+
+def fail(breaker, times, latency_s=0.0):
+    for _ in range(times):
+        breaker.before_call()
+        breaker.record(True, latency_s)
+
+
+class TestCircuitBreaker:
+    """Test suite for the breaker state machine."""
+
+    def test_opens_on_error_rate(self, clock):
+        breaker = make_breaker()
+        breaker.before_call()
+        breaker.record(False)
+        fail(breaker, 3)
+        assert breaker.state == OPEN
+        with pytest.raises(CircuitOpenError) as info:
+            breaker.before_call()
+        assert info.value.retry_after_s == pytest.approx(30)
+
+    def test_slow_calls_count_as_failures(self, clock):
+        breaker = make_breaker()
+        for _ in range(4):
+            breaker.before_call()
+            breaker.record(False, latency_s=12)
+        assert breaker.state == OPEN
+
+    def test_stays_closed_below_min_calls(self, clock):
+        breaker = make_breaker()
+        fail(breaker, 3)
+        assert breaker.state == CLOSED
+
+    def test_half_open_probes_close_it_again(self, clock):
+        breaker = make_breaker()
+        fail(breaker, 4)
+        clock.now += 31
+
+        breaker.before_call()
+        assert breaker.state == HALF_OPEN
+        breaker.before_call()
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()  # only two probes at a time
+        breaker.record(False, 1.0)
+        breaker.record(False, 1.0)
+        assert breaker.state == CLOSED
+
+    def test_failed_probe_reopens(self, clock):
+        breaker = make_breaker()
+        fail(breaker, 4)
+        clock.now += 31
+        breaker.before_call()
+        breaker.record(True)
+        assert breaker.state == OPEN
+
+    def test_released_probe_frees_its_slot(self, clock):
+        breaker = make_breaker()
+        fail(breaker, 4)
+        clock.now += 31
+        breaker.before_call()
+        breaker.before_call()
+
+        breaker.release()
+
+        breaker.before_call()  # the cancelled probe's slot is free again
+        assert breaker.state == HALF_OPEN
+
+    def test_overload_classification(self):
+        class ApiError(Exception):
+            def __init__(self, code):
+                self.code = code
+
+        assert is_overload_error(ApiError(503))
+        assert is_overload_error(TimeoutError())
+        assert not is_overload_error(ApiError(400))
+        assert not is_overload_error(ValueError("GOOGLE_API_KEY environment variable not set"))
@@ -0,0 +1,62 @@
+"""
+Cold-start budget for the API process: importing api.main in a fresh interpreter
+must stay under COLD_START_BUDGET_S and must not load the heavy modules that are
+only needed by some endpoints.
+"""
+
+import sys
+import os
+import json
+import subprocess
+
+import pytest
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from profile_imports import PROJECT_ROOT, measure_imports, by_package
+
+COLD_START_BUDGET_S = float(os.getenv("COLD_START_BUDGET_S", "3.0"))
+
+# Loaded on first use by segmentation, face cropping or the first Gemini call
+LAZY_MODULES = ["mediapipe", "cv2", "engine.parsing", "google.genai", "matplotlib"]
+
+# The result goes to a file: the API's JSON logs are written to stdout
+COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import api.main
+seconds = time.perf_counter() - start
+with open(sys.argv[1], "w") as f:
+    json.dump({"seconds": seconds, "modules": sorted(sys.modules)}, f)
+"""
+
+
+@pytest.fixture(scope="module")
+def cold_start(tmp_path_factory):
+    result = tmp_path_factory.mktemp("cold_start") / "result.json"
+    process = subprocess.run(
+        [sys.executable, "-c", COLD_START_SCRIPT, str(result)], cwd=PROJECT_ROOT, capture_output=True, text=True
+    )
+    assert process.returncode == 0, process.stderr[-2000:]
+    return json.loads(result.read_text())
+
+
+class TestColdStart:
+    def test_import_within_budget(self, cold_start):
+        assert cold_start["seconds"] < COLD_START_BUDGET_S, (
+            f"Importing api.main took {cold_start['seconds']:.2f}s (budget {COLD_START_BUDGET_S}s); "
+            f"run `python profile_imports.py` for a breakdown"
+        )
+
+    @pytest.mark.parametrize("module", LAZY_MODULES)
+    def test_heavy_modules_are_lazy(self, cold_start, module):
+        assert module not in cold_start["modules"]
+
+
+class TestProfileImports:
+    def test_breakdown_per_package(self):
+        entries = measure_imports("engine.rate_limit")
+        names = [name for name, _, _ in entries]
+        assert "engine.rate_limit" in names
+        assert "engine" in by_package(entries)
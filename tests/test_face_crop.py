@@ -0,0 +1,75 @@
+"""
+Test suite for the face-crop round trip (engine/face_crop.py).
+Landmarks are synthetic, so FaceMesh is not needed.
+"""
+
+import sys
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine.face_crop import FaceCrop, compute_crop_box, prepare_face_crop, composite_face_crop
+from engine.parsing import LIPS_COMPLETE_CORRECT
+
+
+def make_landmarks(face_box=(200, 150, 400, 450), lips_box=(260, 360, 340, 400)) -> np.ndarray:
+    """468 FaceMesh points spread over the face box, with the lip points inside lips_box."""
+    rng = np.random.default_rng(0)
+    x1, y1, x2, y2 = face_box
+    landmarks = np.column_stack([rng.uniform(x1, x2, 468), rng.uniform(y1, y2, 468)])
+    landmarks[[0, 1]] = [[x1, y1], [x2, y2]]
+    lx1, ly1, lx2, ly2 = lips_box
+    lips = rng.uniform([lx1, ly1], [lx2, ly2], (len(LIPS_COMPLETE_CORRECT), 2))
+    landmarks[LIPS_COMPLETE_CORRECT] = lips
+    landmarks[LIPS_COMPLETE_CORRECT[:2]] = [[lx1, ly1], [lx2, ly2]]
+    return landmarks
+
+
+class TestCropBox:
+    """Test suite for crop box computation."""
+
+    def test_face_box_is_padded_and_clipped(self):
+        box = compute_crop_box((600, 500), make_landmarks())
+        x1, y1, x2, y2 = box
+        assert x1 < 200 and y1 < 150 and x2 > 400
+        assert y2 == 500  # clipped to the image
+
+    def test_area_box_is_smaller_than_face_box(self):
+        landmarks = make_landmarks()
+        face = compute_crop_box((600, 500), landmarks)
+        lips = compute_crop_box((600, 500), landmarks, area="lips")
+        assert (lips[2] - lips[0]) < (face[2] - face[0])
+        assert lips[0] <= 260 and lips[2] >= 340
+
+
+class TestRoundTrip:
+    """Test suite for preparing and compositing crops."""
+
+    def test_crop_is_downscaled_to_working_size(self):
+        image = Image.new('RGB', (600, 500), (120, 100, 90))
+        face_crop = prepare_face_crop(image, working_size=128, landmarks=make_landmarks())
+        assert max(face_crop.image.size) == 128
+
+    def test_small_crop_is_not_upscaled(self):
+        image = Image.new('RGB', (600, 500), (120, 100, 90))
+        face_crop = prepare_face_crop(image, area="lips", working_size=4096, landmarks=make_landmarks())
+        x1, y1, x2, y2 = face_crop.box
+        assert face_crop.image.size == (x2 - x1, y2 - y1)
+
+    def test_composite_keeps_original_outside_box(self):
+        original = Image.new('RGB', (300, 200), (100, 100, 100))
+        face_crop = FaceCrop(box=(100, 50, 200, 150), image=original.crop((100, 50, 200, 150)).resize((50, 50)))
+        edited = Image.new('RGB', (50, 50), (250, 0, 0))
+
+        result = composite_face_crop(original, edited, face_crop)
+
+        assert result.size == original.size
+        assert result.getpixel((10, 10)) == (100, 100, 100)
+        assert result.getpixel((100, 50)) == (100, 100, 100)  # feathered edge shows the original
+        r, g, b = result.getpixel((150, 100))
+        assert r > 200 and g < 50  # centre shows the edit
@@ -0,0 +1,177 @@
+"""
+Test suite for the shared Gemini client.
+Tests client reuse and the concurrency bound on in-flight calls.
+"""
+
+import asyncio
+import sys
+import os
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import gemini_client, rate_limit, circuit_breaker, gemini_usage, edit_gemini
+
+
+class FakeModels:
+    """Stand-in for client.aio.models that tracks concurrent calls."""
+
+    def __init__(self, delay: float = 0.02):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+
+    async def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        return SimpleNamespace(model=model, contents=contents)
+
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    """Install a fake shared client and reset global state afterwards."""
+    models = FakeModels()
+    fake_client = SimpleNamespace(aio=SimpleNamespace(models=models))
+    monkeypatch.setattr(gemini_client, "_client", fake_client)
+    monkeypatch.setattr(gemini_client, "_semaphore", None)
+    monkeypatch.setattr(gemini_client, "_semaphore_loop", None)
+    # Generous limits so only the concurrency bound is exercised
+    monkeypatch.setattr(rate_limit, "_limiter", rate_limit.RateLimiter(rpm=60000, burst=100))
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    monkeypatch.setattr(gemini_client, "usage_ledger", gemini_usage.UsageLedger())
+    yield models
+    gemini_client._client = None
+    gemini_client._semaphore = None
+    gemini_client._semaphore_loop = None
+
+
+class TestGeminiClient:
+    """Test suite for engine.gemini_client."""
+
+    def test_missing_api_key_raises(self, monkeypatch):
+        """Client creation fails clearly without an API key."""
+        monkeypatch.setattr(gemini_client, "_client", None)
+        monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+        with pytest.raises(ValueError):
+            gemini_client.get_gemini_client()
+
+    def test_client_is_reused(self, fake_models):
+        """The same client object is returned on every call."""
+        assert gemini_client.get_gemini_client() is gemini_client.get_gemini_client()
+
+    def test_concurrency_is_bounded(self, fake_models, monkeypatch):
+        """No more than GEMINI_MAX_CONCURRENCY calls run at once."""
+        monkeypatch.setattr(gemini_client, "GEMINI_MAX_CONCURRENCY", 3)
+
+        async def run():
+            await asyncio.gather(*[
+                gemini_client.generate_content(model="m", contents=[i]) for i in range(10)
+            ])
+
+        asyncio.run(run())
+        assert fake_models.calls == 10
+        assert fake_models.max_in_flight == 3
+
+    def test_calls_run_concurrently(self, fake_models, monkeypatch):
+        """Calls overlap instead of running one after another."""
+        monkeypatch.setattr(gemini_client, "GEMINI_MAX_CONCURRENCY", 8)
+
+        async def run():
+            await asyncio.gather(*[
+                gemini_client.generate_content(model="m", contents=[i]) for i in range(8)
+            ])
+
+        asyncio.run(run())
+        assert fake_models.max_in_flight == 8
+
+    def test_open_circuit_fails_fast(self, fake_models, monkeypatch):
+        """Overload errors open the circuit; further calls never reach Gemini."""
+        class Overloaded(Exception):
+            code = 503
+
+        async def overloaded(model, contents, config=None):
+            fake_models.calls += 1
+            raise Overloaded("model is overloaded")
+
+        monkeypatch.setattr(fake_models, "generate_content", overloaded)
+        monkeypatch.setattr(rate_limit, "_limiter", rate_limit.RateLimiter(rpm=60000, burst=100, max_retries=0))
+
+        async def run():
+            for _ in range(circuit_breaker.GEMINI_BREAKER_MIN_CALLS):
+                with pytest.raises(Overloaded):
+                    await gemini_client.generate_content(model="m", contents=[])
+            with pytest.raises(circuit_breaker.CircuitOpenError):
+                await gemini_client.generate_content(model="m", contents=[])
+
+        asyncio.run(run())
+        assert fake_models.calls == circuit_breaker.GEMINI_BREAKER_MIN_CALLS
+
+    def test_breaker_ignores_local_queueing(self, fake_models, monkeypatch):
+        """Calls that only wait long for a concurrency slot are not slow calls."""
+        breaker = circuit_breaker.CircuitBreaker("m", min_calls=2, slow_call_s=0.05)
+        monkeypatch.setattr(circuit_breaker, "_breakers", {"m": breaker})
+        monkeypatch.setattr(gemini_client, "GEMINI_MAX_CONCURRENCY", 1)
+
+        async def run():
+            await asyncio.gather(*[gemini_client.generate_content(model="m", contents=[i]) for i in range(6)])
+
+        asyncio.run(run())
+        assert breaker.state == circuit_breaker.CLOSED
+        assert breaker.stats()["recent_failures"] == 0
+
+    def test_cancelled_probe_does_not_close_circuit(self, fake_models, monkeypatch):
+        """A half-open probe cancelled by a client disconnect counts as neither success nor failure."""
+        breaker = circuit_breaker.CircuitBreaker("m", probes=1)
+        breaker.state = circuit_breaker.HALF_OPEN
+        monkeypatch.setattr(circuit_breaker, "_breakers", {"m": breaker})
+        fake_models.delay = 1.0
+
+        async def run():
+            task = asyncio.create_task(gemini_client.generate_content(model="m", contents=[]))
+            await asyncio.sleep(0.02)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+        assert breaker.state == circuit_breaker.HALF_OPEN
+        breaker.before_call()  # its probe slot was released
+
+    def test_cancelled_worker_probe_does_not_close_circuit(self, monkeypatch):
+        """Same for the worker path: a cancelled job leaves the half-open worker breaker untouched."""
+        breaker = circuit_breaker.CircuitBreaker("gemini_worker", probes=1)
+        breaker.state = circuit_breaker.HALF_OPEN
+        monkeypatch.setattr(edit_gemini, "worker_breaker", breaker)
+
+        async def slow_submit(header, blobs):
+            await asyncio.sleep(1.0)
+
+        monkeypatch.setattr(edit_gemini, "worker_pool", SimpleNamespace(submit=slow_submit))
+
+        async def run():
+            task = asyncio.create_task(edit_gemini.generate_gemini_simulation(Image.new("RGB", (8, 8)), 2.0, "lips"))
+            await asyncio.sleep(0.02)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+        assert breaker.state == circuit_breaker.HALF_OPEN
+        breaker.before_call()  # its probe slot was released
+
+    def test_calls_are_recorded(self, fake_models):
+        """Each call lands in the usage ledger with its labels and prompt size."""
+        async def run():
+            await gemini_client.generate_content(model="m", contents=["hello"], area="lips", volume_ml=2.0)
+
+        asyncio.run(run())
+        [record] = gemini_client.usage_ledger.records()
+        assert (record.area, record.volume_ml, record.prompt_chars, record.ok) == ("lips", 2.0, 5, True)
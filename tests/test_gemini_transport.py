@@ -0,0 +1,180 @@
+"""
+Test suite for the Gemini record/replay transport (engine/gemini_transport.py).
+"""
+
+import sys
+import os
+import io
+import json
+import time
+import base64
+import asyncio
+
+import httpx
+import pytest
+from PIL import Image
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import gemini_transport
+from engine.gemini_transport import (
+    AsyncRecordReplayTransport, Cassette, CassetteMiss, RecordReplayTransport,
+    RECORD, REPLAY, fingerprint, transport_client_args,
+)
+from loadtest.fake_gemini import FakeGeminiConfig, create_app
+
+MODEL = "gemini-2.5-flash-image-preview"
+# Recorded with GEMINI_TRANSPORT=record and GEMINI_BASE_URL pointing at loadtest/fake_gemini.py, by posting
+# cassette_photo() to /simulate/filler for lips at 1 ml; re-record when the Gemini request for it changes
+SIMULATE_CASSETTE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cassettes", "simulate_lips.jsonl")
+URL = f"http://gemini.test/v1beta/models/{MODEL}:generateContent"
+
+
+def prompt_body(token: str) -> bytes:
+    text = f"Lip enhancement 1ml\nREQUEST_ID: {token}\nRANDOM_TOKEN: {token[::-1]}"
+    return json.dumps({"contents": [{"parts": [{"text": text}]}]}).encode("utf-8")
+
+
+def cassette_photo() -> str:
+    """The low-contrast 64x48 photo the simulate cassette was recorded with (base64 PNG)."""
+    buffer = io.BytesIO()
+    Image.linear_gradient("L").resize((64, 48)).point(lambda v: 100 + v // 5).convert("RGB").save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def echo_transport(delay_s: float = 0.0) -> httpx.MockTransport:
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        time.sleep(delay_s)
+        return httpx.Response(200, json={"call": len(calls)})
+
+    transport = httpx.MockTransport(handler)
+    transport.calls = calls
+    return transport
+
+
+def genai_client(transport: httpx.AsyncBaseTransport):
+    from google import genai
+    from google.genai import types
+
+    options = types.HttpOptions(base_url="http://gemini.test", async_client_args={"transport": transport})
+    return genai.Client(api_key="test-key", http_options=options)
+
+
+class TestFingerprint:
+    def test_volatile_prompt_lines_are_masked(self):
+        assert fingerprint("POST", "/m", prompt_body("aaaa-1111")) == fingerprint("POST", "/m", prompt_body("bbbb-2222"))
+
+    def test_path_and_content_matter(self):
+        body = prompt_body("x")
+        assert fingerprint("POST", "/m", body) != fingerprint("POST", "/other", body)
+        assert fingerprint("POST", "/m", body) != fingerprint("POST", "/m", body.replace(b"1ml", b"2ml"))
+
+    def test_key_order_is_irrelevant(self):
+        assert fingerprint("POST", "/m", b'{"a": 1, "b": 2}') == fingerprint("POST", "/m", b'{"b":2,"a":1}')
+
+
+class TestRecordReplay:
+    def test_record_then_replay_offline(self, tmp_path):
+        path = tmp_path / "cassette.jsonl"
+        inner = echo_transport(delay_s=0.05)
+        with httpx.Client(transport=RecordReplayTransport(Cassette(path), RECORD, inner=inner)) as client:
+            recorded = [client.post(URL, content=prompt_body(f"rec-{i}")).json() for i in range(2)]
+
+        replayer = RecordReplayTransport(Cassette(path), REPLAY, latency_scale=0, inner=echo_transport())
+        with httpx.Client(transport=replayer) as client:
+            replayed = [client.post(URL, content=prompt_body(f"new-{i}")).json() for i in range(3)]
+
+        assert recorded == [{"call": 1}, {"call": 2}]
+        # Same fingerprint: recordings come back in order, then cycle
+        assert replayed == [{"call": 1}, {"call": 2}, {"call": 1}]
+        assert replayer.inner.calls == []
+        assert len(path.read_text().splitlines()) == 2
+
+    def test_replay_latency_is_scaled(self, tmp_path):
+        path = tmp_path / "cassette.jsonl"
+        with httpx.Client(transport=RecordReplayTransport(Cassette(path), RECORD, inner=echo_transport(0.2))) as client:
+            client.post(URL, content=prompt_body("x"))
+
+        async def replay():
+            transport = AsyncRecordReplayTransport(Cassette(path), REPLAY, latency_scale=0.25)
+            async with httpx.AsyncClient(transport=transport) as client:
+                start = time.perf_counter()
+                await client.post(URL, content=prompt_body("y"))
+                return time.perf_counter() - start
+
+        assert 0.04 <= asyncio.run(replay()) < 0.2
+
+    def test_miss_is_a_clear_error(self, tmp_path):
+        transport = RecordReplayTransport(Cassette(tmp_path / "empty.jsonl"), REPLAY, latency_scale=0)
+        with httpx.Client(transport=transport) as client:
+            with pytest.raises(CassetteMiss, match="No recorded Gemini response"):
+                client.post(URL, content=prompt_body("x"))
+
+    def test_genai_client_replays_recorded_image(self, tmp_path):
+        """Full SDK path: record against the fake Gemini server, replay without it."""
+        from google.genai import types
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (40, 30), color=(150, 110, 100)).save(buffer, format="JPEG")
+        contents = ["Lip enhancement\nRANDOM_TOKEN: abc", types.Part.from_bytes(data=buffer.getvalue(), mime_type="image/jpeg")]
+        path = tmp_path / "cassette.jsonl"
+
+        async def generate(transport):
+            response = await genai_client(transport).aio.models.generate_content(model=MODEL, contents=contents)
+            return next(part.inline_data.data for part in response.candidates[0].content.parts if part.inline_data)
+
+        fake = httpx.ASGITransport(app=create_app(FakeGeminiConfig(latency_ms=30)))
+        recorded = asyncio.run(generate(AsyncRecordReplayTransport(Cassette(path), RECORD, inner=fake)))
+        contents[0] = "Lip enhancement\nRANDOM_TOKEN: xyz"
+        replayed = asyncio.run(generate(AsyncRecordReplayTransport(Cassette(path), REPLAY, latency_scale=0)))
+
+        assert replayed == recorded
+        assert Image.open(io.BytesIO(replayed)).size == (40, 30)
+
+
+class TestClientArgs:
+    def test_passthrough_installs_nothing(self):
+        assert transport_client_args("passthrough") == (None, None)
+
+    def test_replay_mode_shares_one_cassette(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(gemini_transport, "GEMINI_CASSETTE", str(tmp_path / "c.jsonl"))
+
+        sync_args, async_args = transport_client_args("replay")
+
+        assert isinstance(sync_args["transport"], RecordReplayTransport)
+        assert isinstance(async_args["transport"], AsyncRecordReplayTransport)
+        assert sync_args["transport"].cassette is async_args["transport"].cassette
+
+    def test_unknown_mode_is_rejected(self):
+        with pytest.raises(ValueError):
+            transport_client_args("live")
+
+
+class TestReplaySimulate:
+    def test_simulate_endpoint_replays_without_api_key(self, monkeypatch):
+        """/simulate/filler end to end (prompt, upload encoding, genai client) served from the cassette."""
+        from fastapi.testclient import TestClient
+        import api.main as api_main
+        from engine import gemini_client
+        from engine.perceptual_hash import RecentResults
+
+        monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+        monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+        monkeypatch.setattr(gemini_transport, "GEMINI_TRANSPORT", REPLAY)
+        monkeypatch.setattr(gemini_transport, "GEMINI_CASSETTE", SIMULATE_CASSETTE)
+        monkeypatch.setattr(gemini_client, "GEMINI_BASE_URL", "")
+        monkeypatch.setattr(gemini_client, "_client", None)
+        monkeypatch.setattr(api_main, "recent_results", RecentResults(capacity=8))
+
+        with TestClient(api_main.app) as client:
+            response = client.post("/simulate/filler", json={"image": cassette_photo(), "area": "lips", "strength": 1.0})
+
+        assert response.status_code == 200, response.text
+        body = response.json()
+        assert body["qc"]["quality_passed"]
+        assert body["result_png"] != body["original_png"]
+        assert Image.open(io.BytesIO(base64.b64decode(body["result_png"]))).size == (64, 48)
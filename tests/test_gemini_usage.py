@@ -0,0 +1,82 @@
+"""
+Test suite for Gemini call accounting (engine/gemini_usage.py).
+"""
+
+import sys
+import os
+from types import SimpleNamespace
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.genai import types
+
+from engine.gemini_usage import (
+    GeminiCallRecord, UsageLedger, record_from_response, measure_contents,
+    volume_bucket, emit_usage_record, parse_usage_records,
+)
+
+
+def make_response(image_bytes=b"\x89PNG...", prompt_tokens=1300, output_tokens=1290):
+    part = SimpleNamespace(text=None, inline_data=SimpleNamespace(data=image_bytes, mime_type="image/png"))
+    return SimpleNamespace(
+        candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))],
+        usage_metadata=SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        ),
+    )
+
+
+class TestRecords:
+    """Test suite for building records."""
+
+    def test_record_from_response(self):
+        record = record_from_response("m", make_response(image_bytes=b"x" * 50), area="lips", volume_ml=2.0)
+        assert record.total_tokens == 2590
+        assert record.image_bytes_down == 50
+
+    def test_measure_contents(self):
+        content = types.Content(parts=[
+            types.Part(text="prompt"),
+            types.Part(inline_data=types.Blob(mime_type="image/jpeg", data=b"12345")),
+        ])
+        assert measure_contents([content]) == (6, 5)
+        assert measure_contents([{"parts": ["ab", types.Part.from_bytes(data=b"123", mime_type="image/jpeg")]}]) == (2, 3)
+
+    def test_volume_buckets(self):
+        assert volume_bucket(0.5) == "0-1ml"
+        assert volume_bucket(1.0) == "1-2ml"
+        assert volume_bucket(5.0) == "4-5ml"
+
+    def test_worker_records_round_trip(self, capsys):
+        emit_usage_record(GeminiCallRecord(model="m", prompt_chars=10, wall_time_ms=1234))
+        records = parse_usage_records(capsys.readouterr().err + "\nunrelated line")
+        assert len(records) == 1
+        assert records[0].wall_time_ms == 1234
+
+
+class TestLedger:
+    """Test suite for UsageLedger aggregation."""
+
+    def test_summary_by_area_and_volume(self):
+        ledger = UsageLedger(size=10)
+        ledger.record(GeminiCallRecord(model="m", area="lips", volume_ml=1.0, total_tokens=100, wall_time_ms=1000))
+        ledger.record(GeminiCallRecord(model="m", area="lips", volume_ml=1.5, total_tokens=300, wall_time_ms=3000))
+        ledger.record(GeminiCallRecord(model="m", area="chin", volume_ml=3.0, ok=False, error="quota"))
+
+        summary = ledger.summary(recent=2)
+
+        assert summary["calls"] == 3
+        assert summary["by_area"]["lips"]["avg_total_tokens"] == 200
+        assert summary["by_area"]["lips"]["avg_wall_time_ms"] == 2000
+        assert summary["by_area"]["chin"]["errors"] == 1
+        assert summary["by_volume"]["1-2ml"]["calls"] == 2
+        assert len(summary["recent"]) == 2
+
+    def test_ring_buffer_keeps_latest(self):
+        ledger = UsageLedger(size=2)
+        for volume in (1.0, 2.0, 3.0):
+            ledger.record(GeminiCallRecord(model="m", volume_ml=volume))
+        assert [r.volume_ml for r in ledger.records()] == [2.0, 3.0]
@@ -0,0 +1,75 @@
+"""
+Test suite for the upload-once image store.
+Tests LRU eviction by count and size, and idle TTL expiry.
+"""
+
+import sys
+import os
+
+import pytest
+from PIL import Image
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import image_store as image_store_module
+from api.image_store import ImageStore
+from engine.utils import EncodedImage
+
+
+def make_encoded(size=(10, 10)) -> EncodedImage:
+    return EncodedImage.from_image(Image.new('RGB', size))
+
+
+class TestImageStore:
+    """Test suite for ImageStore."""
+
+    def test_put_and_get(self):
+        store = ImageStore()
+        entry = store.put(make_encoded(), gemini_bytes=b"jpeg")
+        assert store.get(entry.image_id) is entry
+        assert store.get("missing") is None
+
+    def test_evicts_least_recently_used_by_count(self):
+        store = ImageStore(max_items=2)
+        first = store.put(make_encoded())
+        second = store.put(make_encoded())
+        store.get(first.image_id)  # first is now more recent than second
+        store.put(make_encoded())
+
+        assert store.get(first.image_id) is not None
+        assert store.get(second.image_id) is None
+        assert store.stats()["items"] == 2
+
+    def test_evicts_by_memory_budget(self):
+        # Each 10x10 RGB entry is 300 bytes of pixels
+        store = ImageStore(max_bytes=700)
+        entries = [store.put(make_encoded()) for _ in range(3)]
+
+        assert store.get(entries[0].image_id) is None
+        assert store.stats()["bytes"] <= 700
+
+    def test_rejects_image_larger_than_budget(self):
+        store = ImageStore(max_bytes=100)
+        with pytest.raises(ValueError):
+            store.put(make_encoded())
+
+    def test_idle_entries_expire(self, monkeypatch):
+        clock = [1000.0]
+        monkeypatch.setattr(image_store_module.time, "time", lambda: clock[0])
+        store = ImageStore(ttl_s=60)
+        entry = store.put(make_encoded())
+
+        clock[0] += 50
+        assert store.get(entry.image_id) is not None  # refreshes last access
+        clock[0] += 50
+        assert store.get(entry.image_id) is not None
+        clock[0] += 61
+        assert store.get(entry.image_id) is None
+        assert store.stats()["bytes"] == 0
+
+    def test_delete(self):
+        store = ImageStore()
+        entry = store.put(make_encoded())
+        assert store.delete(entry.image_id)
+        assert not store.delete(entry.image_id)
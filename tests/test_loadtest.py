@@ -0,0 +1,112 @@
+"""
+Test suite for the load-test harness (loadtest/) and the event-loop lag monitor.
+"""
+
+import sys
+import os
+import io
+import math
+import time
+import base64
+import asyncio
+
+import pytest
+from PIL import Image
+from fastapi.testclient import TestClient
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loadtest.fake_gemini import FakeGeminiConfig, create_app
+from loadtest.harness import ManagedServer, free_port, histogram_quantile, loop_lag_report, parse_mix
+from api.metrics import EVENT_LOOP_LAG, LoopLagMonitor
+
+MODEL_URL = "/v1beta/models/gemini-2.5-flash-image-preview"
+
+
+def generate_body() -> dict:
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 24), color=(120, 100, 90)).save(buffer, format="JPEG")
+    # google-genai sends URL-safe base64 without padding
+    data = base64.urlsafe_b64encode(buffer.getvalue()).decode("ascii").rstrip("=")
+    return {"contents": [{"parts": [{"text": "lips 1ml"}, {"inlineData": {"mimeType": "image/jpeg", "data": data}}]}]}
+
+
+class TestFakeGemini:
+    def test_returns_edited_copy_of_input(self):
+        client = TestClient(create_app(FakeGeminiConfig(latency_ms=0)))
+
+        response = client.post(MODEL_URL + ":generateContent", json=generate_body())
+
+        parts = response.json()["candidates"][0]["content"]["parts"]
+        image = Image.open(io.BytesIO(base64.b64decode(parts[1]["inlineData"]["data"])))
+        assert image.size == (32, 24)
+        assert client.get(MODEL_URL).json()["name"] == "models/gemini-2.5-flash-image-preview"
+
+    def test_error_mix_and_latency(self):
+        config = FakeGeminiConfig(latency_ms=50, rate_429=0.5, rate_503=0.5, seed=3)
+        client = TestClient(create_app(config))
+
+        start = time.perf_counter()
+        statuses = {client.post(MODEL_URL + ":generateContent", json=generate_body()).status_code for _ in range(8)}
+
+        assert statuses == {429, 503}
+        assert time.perf_counter() - start >= 8 * 0.05
+        body = client.post(MODEL_URL + ":generateContent", json=generate_body()).json()
+        assert body["error"]["status"] in ("RESOURCE_EXHAUSTED", "UNAVAILABLE")
+
+    def test_text_only_response(self):
+        client = TestClient(create_app(FakeGeminiConfig(latency_ms=0, rate_no_image=1.0)))
+
+        parts = client.post(MODEL_URL + ":generateContent", json=generate_body()).json()["candidates"][0]["content"]["parts"]
+
+        assert [list(part) for part in parts] == [["text"]]
+
+
+class TestLoopLag:
+    def test_blocking_call_is_recorded(self):
+        histogram = EVENT_LOOP_LAG.labels(app="test")
+
+        async def main():
+            monitor = LoopLagMonitor(app_name="test", interval_s=0.01)
+            monitor.start()
+            await asyncio.sleep(0.02)
+            time.sleep(0.15)  # Blocks the loop like sync work in an async handler
+            await asyncio.sleep(0.03)
+            await monitor.stop()
+
+        before = histogram._sum.get()
+        asyncio.run(main())
+        assert histogram._sum.get() - before >= 0.1
+
+    def test_quantiles_from_bucket_deltas(self):
+        before = {"api": {0.01: 10, 0.1: 10, 1.0: 10, math.inf: 10}}
+        after = {"api": {0.01: 108, 0.1: 109, 1.0: 110, math.inf: 110}}
+
+        report = loop_lag_report(before, after)["api"]
+
+        assert report == {"samples": 100, "p50_ms": 10.0, "p99_ms": 100.0, "max_bucket_ms": 1000.0}
+        assert histogram_quantile({math.inf: 0}, 0.5) is None
+
+    def test_parse_mix(self):
+        assert parse_mix("simulate=6, segment=3,risk_map") == {"simulate": 6.0, "segment": 3.0, "risk_map": 1.0}
+
+
+class TestManagedServer:
+    def test_chatty_server_does_not_block_on_stderr(self):
+        port = free_port()
+        # Far more than a pipe buffer of stderr before the server starts listening
+        code = ("import sys, http.server\n"
+                "for i in range(20000): sys.stderr.write(f'INFO log line {i}\\n')\n"
+                f"http.server.test(http.server.SimpleHTTPRequestHandler, port={port}, bind='127.0.0.1')")
+        server = ManagedServer("chatty", [sys.executable, "-c", code], port, ready_path="/")
+        try:
+            asyncio.run(server.start(timeout_s=20))
+        finally:
+            server.stop()
+
+    def test_exit_reports_stderr_tail(self):
+        server = ManagedServer("broken", [sys.executable, "-c", "import sys; sys.exit('boom: bad config')"], free_port())
+
+        with pytest.raises(RuntimeError, match="broken exited: boom: bad config"):
+            asyncio.run(server.start(timeout_s=20))
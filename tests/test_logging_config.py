@@ -0,0 +1,112 @@
+"""
+Test suite for the queued JSON logging pipeline (api/logging_config.py).
+"""
+
+import sys
+import os
+import io
+import json
+import queue
+import logging
+
+import pytest
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import logging_config
+from api.logging_config import (
+    DebugSamplingFilter, TruncatingQueueHandler, JsonFormatter, parse_sample_rates, configure_logging
+)
+
+
+def make_record(name="api.main", level=logging.INFO, msg="hello", args=None):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+class TestSampling:
+    def test_parse_sample_rates(self):
+        assert parse_sample_rates("api.main=0.5, engine=0") == {"api.main": 0.5, "engine": 0.0}
+        assert parse_sample_rates("") == {}
+
+    def test_warnings_and_plain_info_always_pass(self):
+        sampler = DebugSamplingFilter(default_rate=0.0)
+        assert sampler.filter(make_record(level=logging.WARNING, msg="DEBUG: still a warning"))
+        assert sampler.filter(make_record(msg="Starting NuvaFace API"))
+
+    def test_debug_chatter_is_dropped_at_rate_zero(self):
+        sampler = DebugSamplingFilter(default_rate=0.0)
+        assert not sampler.filter(make_record(level=logging.DEBUG))
+        assert not sampler.filter(make_record(msg="🔍 DEBUG: Stdout length = 10 chars"))
+        assert not sampler.filter(make_record(msg="DEBUG: Received request"))
+
+    def test_most_specific_logger_rate_wins(self):
+        sampler = DebugSamplingFilter(default_rate=0.0, rates={"engine": 0.0, "engine.edit_gemini": 1.0})
+        assert sampler.rate_for("engine.edit_gemini") == 1.0
+        assert sampler.rate_for("engine.gemini_client") == 0.0
+        assert sampler.rate_for("engine_other") == 0.0
+        assert sampler.filter(make_record(name="engine.edit_gemini", msg="DEBUG: kept"))
+
+    def test_partial_rate_samples(self, monkeypatch):
+        sampler = DebugSamplingFilter(default_rate=0.25)
+        monkeypatch.setattr(logging_config.random, "random", lambda: 0.2)
+        assert sampler.filter(make_record(level=logging.DEBUG))
+        monkeypatch.setattr(logging_config.random, "random", lambda: 0.3)
+        assert not sampler.filter(make_record(level=logging.DEBUG))
+
+
+class TestQueueHandler:
+    def test_message_is_capped_before_queueing(self):
+        handler = TruncatingQueueHandler(queue.Queue(), max_chars=10)
+        handler.handle(make_record(msg="x" * 1000))
+        record = handler.queue.get_nowait()
+        assert record.msg == "x" * 10 + "... [truncated 990 chars]"
+
+    def test_args_are_merged(self):
+        handler = TruncatingQueueHandler(queue.Queue())
+        handler.handle(make_record(msg="%s ml", args=(1.5,)))
+        record = handler.queue.get_nowait()
+        assert record.getMessage() == "1.5 ml"
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = TruncatingQueueHandler(queue.Queue(maxsize=1))
+        handler.handle(make_record())
+        handler.handle(make_record())
+        assert handler.dropped == 1
+
+
+class TestJsonFormatter:
+    def test_json_fields(self):
+        line = JsonFormatter().format(make_record(level=logging.WARNING, msg="Überlastet"))
+        entry = json.loads(line)
+        assert entry["severity"] == "WARNING"
+        assert entry["logger"] == "api.main"
+        assert entry["message"] == "Überlastet"
+
+    def test_exception_is_included(self):
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record = logging.LogRecord("api.main", logging.ERROR, __file__, 1, "failed", None, sys.exc_info())
+        entry = json.loads(JsonFormatter().format(record))
+        assert "ValueError: boom" in entry["exception"]
+
+
+class TestConfigureLogging:
+    def test_records_are_written_by_listener(self):
+        root = logging.getLogger()
+        previous_handlers, previous_level = list(root.handlers), root.level
+        previous_listener = logging_config._listener
+        stream = io.StringIO()
+        try:
+            configure_logging(level="INFO", log_format="json", stream=stream)
+            logging.getLogger("api.test").warning("queued")
+            logging_config._listener.stop()
+        finally:
+            logging_config._listener = previous_listener
+            root.handlers, root.level = previous_handlers, previous_level
+            if previous_listener is not None:
+                previous_listener.start()
+
+        entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert {"severity": "WARNING", "logger": "api.test", "message": "queued"}.items() <= entries[-1].items()
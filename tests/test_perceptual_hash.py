@@ -0,0 +1,118 @@
+"""
+Test suite for perceptual result hashing and the recent-results index (engine/perceptual_hash.py).
+"""
+
+import sys
+import os
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import perceptual_hash
+from engine.perceptual_hash import RecentResults, hamming, near_identical, signature
+
+
+def make_face(size=(600, 800), shift=0) -> Image.Image:
+    """Structured stand-in for a portrait: gradient background, face oval, eyes and lips."""
+    width, height = size
+    image = Image.linear_gradient('L').resize(size).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((width * 0.2 + shift, height * 0.15, width * 0.8 + shift, height * 0.85), fill=(210, 170, 150))
+    for x in (0.35, 0.6):
+        draw.ellipse((width * x + shift, height * 0.38, width * (x + 0.08) + shift, height * 0.43), fill=(60, 50, 40))
+    draw.rectangle((width * 0.4 + shift, height * 0.65, width * 0.6 + shift, height * 0.69), fill=(170, 90, 90))
+    return image
+
+
+def reencode(image: Image.Image, quality: int, scale: float = 1.0) -> Image.Image:
+    if scale != 1.0:
+        image = image.resize((int(image.width * scale), int(image.height * scale)), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return Image.open(io.BytesIO(buffer.getvalue()))
+
+
+def fuller_lips(image: Image.Image) -> Image.Image:
+    """A local edit like a lip filler result: the lips grow by a few percent of the face height."""
+    edited = image.copy()
+    width, height = image.size
+    ImageDraw.Draw(edited).ellipse((width * 0.38, height * 0.63, width * 0.62, height * 0.72), fill=(180, 80, 85))
+    return edited
+
+
+class TestSignature:
+    @pytest.mark.parametrize("quality,scale", [(95, 1.0), (80, 0.5), (70, 1.6)])
+    def test_reencoded_copies_are_near_identical(self, quality, scale):
+        face = make_face()
+        assert near_identical(signature(face), signature(reencode(face, quality, scale)))
+
+    def test_local_edit_is_a_real_change(self):
+        face = make_face()
+        edited = signature(reencode(fuller_lips(face), 90))
+
+        assert hamming(signature(face).dhash, edited.dhash) <= 8  # Same coarse picture ...
+        assert not near_identical(signature(face), edited)  # ... but the lips changed
+
+    def test_different_framing_is_not_identical(self):
+        assert not near_identical(signature(make_face()), signature(make_face(size=(800, 600))))
+
+
+class TestRecentResults:
+    def test_finds_replay_of_earlier_result(self):
+        index = RecentResults(capacity=8)
+        face = make_face()
+
+        assert index.check_and_add("a", signature(face), "lips", 1.0) is None
+        assert index.check_and_add("b", signature(fuller_lips(face)), "lips", 2.0) is None
+        match = index.check_and_add("c", signature(reencode(face, 85, 0.7)), "lips", 3.0)
+
+        assert match.key == "a" and match.volume_ml == 1.0
+
+    def test_results_of_the_same_input_are_not_replays(self):
+        index = RecentResults(capacity=8)
+        face, other = make_face(), make_face(shift=60)
+        # Adjacent volumes of one photo: nearly the same lips
+        first, second = fuller_lips(face), reencode(fuller_lips(face), 85)
+
+        assert index.check_and_add("a", signature(first), "lips", 1.0, source=signature(face)) is None
+        assert index.check_and_add("b", signature(second), "lips", 1.5, source=signature(reencode(face, 90))) is None
+        match = index.check_and_add("c", signature(second), "lips", 1.0, source=signature(other))
+
+        assert match is not None and match.key in ("a", "b")
+
+    def test_capacity_evicts_oldest_and_cleans_bands(self):
+        index = RecentResults(capacity=2)
+        faces = [make_face(shift=shift) for shift in (0, 60, 120)]
+        for key, face in zip("abc", faces):
+            index.add(key, signature(face), "chin", 1.0)
+
+        assert len(index) == 2
+        assert index.find(signature(faces[0])) is None
+        assert index.find(signature(faces[2])).key == "c"
+        live = {key for band in index._index for keys in band.values() for key in keys}
+        assert live == {"b", "c"}
+
+    def test_lookup_compares_a_bounded_number_of_results(self, monkeypatch):
+        """Many results with the same hash (blank images) do not make lookups scan the window."""
+        index = RecentResults(capacity=512)
+        blank = Image.new('RGB', (64, 64), (128, 128, 128))
+        sig = signature(blank)
+        for i in range(200):
+            index.add(str(i), sig, "lips", 1.0, source=sig)
+
+        comparisons = []
+
+        def counting_near_identical(*args):
+            comparisons.append(args)
+            return near_identical(*args)
+
+        monkeypatch.setattr(perceptual_hash, "near_identical", counting_near_identical)
+        # Same source: every candidate is skipped, so all of them are compared
+        assert index.find(sig, source=sig) is None
+
+        assert len(comparisons) <= perceptual_hash.MAX_CANDIDATES
+        assert all(len(keys) <= perceptual_hash.MAX_CANDIDATES for band in index._index for keys in band.values())
@@ -0,0 +1,169 @@
+"""
+Test suite for the Gemini rate limiter (engine/rate_limit.py).
+"""
+
+import asyncio
+import subprocess
+import sys
+import os
+from types import SimpleNamespace
+
+import pytest
+
+# Add parent directory to path for imports
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from engine import rate_limit
+from engine.rate_limit import RateLimiter, TokenBucket, RetryBudget, is_retryable, retry_after_from_error
+
+
+class QuotaError(Exception):
+    code = 429
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    """Record sleeps instead of waiting."""
+    sleeps = []
+    monkeypatch.setattr(rate_limit.time, "sleep", sleeps.append)
+    return sleeps
+
+
+class TestTokenBucket:
+    """Test suite for TokenBucket."""
+
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(rate_per_s=1.0, capacity=2)
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == pytest.approx(1.0, abs=0.05)
+
+    def test_retry_after_blocks_bucket(self):
+        bucket = TokenBucket(rate_per_s=100.0, capacity=10)
+        bucket.block_for(5)
+        assert bucket.reserve() == pytest.approx(5, abs=0.05)
+
+    def test_remaining_quota_header_limits_tokens(self):
+        limiter = RateLimiter(rpm=60, burst=10)
+        limiter.observe_headers("m", {"X-RateLimit-Remaining": "0"})
+        assert limiter.bucket("m").reserve() > 0
+
+
+class TestQuotaShare:
+    def test_processes_split_the_quota(self, monkeypatch):
+        monkeypatch.setattr(rate_limit, "_limiter", None)
+        monkeypatch.setattr(rate_limit, "GEMINI_RPM", 60.0)
+        monkeypatch.setattr(rate_limit, "GEMINI_BURST", 8)
+        monkeypatch.setattr(rate_limit, "GEMINI_RATE_PROCESSES", 3)
+
+        limiter = rate_limit.get_rate_limiter()
+
+        assert limiter.rpm == 20.0 and limiter.burst == 2
+        assert limiter.bucket("m").rate_per_s == pytest.approx(1 / 3)
+
+    def test_single_process_gets_the_full_quota_by_default(self):
+        """Scripts and an API without a running worker pool do not give away quota."""
+        env = {key: value for key, value in os.environ.items()
+               if key not in ("GEMINI_RATE_PROCESSES", "GEMINI_WORKER_POOL_SIZE", "GEMINI_RPM", "GEMINI_BURST")}
+        code = "from engine import rate_limit; limiter = rate_limit.get_rate_limiter(); print(limiter.rpm, limiter.burst)"
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        assert output.split() == ["60.0", "8"]
+
+    def test_share_rescales_the_running_limiter(self, monkeypatch):
+        monkeypatch.setattr(rate_limit, "_limiter", None)
+        monkeypatch.setattr(rate_limit, "_processes", None)
+        monkeypatch.setattr(rate_limit, "GEMINI_RPM", 60.0)
+        monkeypatch.setattr(rate_limit, "GEMINI_BURST", 8)
+        monkeypatch.setattr(rate_limit, "GEMINI_RATE_PROCESSES", 1)
+        bucket = rate_limit.get_rate_limiter().bucket("m")
+
+        rate_limit.set_rate_processes(4)
+        assert (bucket.rate_per_s, bucket.capacity) == (pytest.approx(0.25), 2)
+        assert bucket.reserve() == 0 and bucket.reserve() == 0
+        assert bucket.reserve() > 0
+
+        rate_limit.set_rate_processes(None)
+        assert (bucket.rate_per_s, bucket.capacity) == (pytest.approx(1.0), 8)
+
+
+class TestRetries:
+    """Test suite for RateLimiter.call and call_async."""
+
+    def test_quota_error_is_retried_then_succeeds(self, no_sleep):
+        limiter = RateLimiter(rpm=6000, burst=10)
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise QuotaError("RESOURCE_EXHAUSTED")
+            return "ok"
+
+        assert limiter.call("m", flaky) == "ok"
+        assert len(attempts) == 3
+        assert len(no_sleep) == 2
+
+    def test_non_retryable_error_is_raised_immediately(self, no_sleep):
+        limiter = RateLimiter(rpm=6000, burst=10)
+
+        def bad_request():
+            raise ValueError("invalid argument")
+
+        with pytest.raises(ValueError):
+            limiter.call("m", bad_request)
+        assert no_sleep == []
+
+    def test_retry_budget_stops_retry_storm(self, no_sleep):
+        limiter = RateLimiter(rpm=6000, burst=100, max_retries=5)
+        limiter.budget = RetryBudget(ratio=0.0, min_tokens=2)
+        attempts = []
+
+        def always_429():
+            attempts.append(1)
+            raise QuotaError("quota")
+
+        with pytest.raises(QuotaError):
+            limiter.call("m", always_429)
+        assert len(attempts) == 3  # first try + two budgeted retries
+
+    def test_async_retry_honours_retry_delay(self, monkeypatch):
+        limiter = RateLimiter(rpm=6000, burst=10, backoff_base_s=0.001)
+        sleeps = []
+
+        async def fake_sleep(delay):
+            sleeps.append(delay)
+
+        monkeypatch.setattr(rate_limit.asyncio, "sleep", fake_sleep)
+        error = QuotaError("quota")
+        error.details = {"error": {"details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "7s"}]}}
+        calls = []
+
+        async def flaky():
+            calls.append(1)
+            if len(calls) == 1:
+                raise error
+            return "ok"
+
+        assert asyncio.run(limiter.call_async("m", flaky)) == "ok"
+        assert max(sleeps) >= 7
+
+    def test_backoff_has_jitter_and_cap(self):
+        limiter = RateLimiter(backoff_base_s=1.0, backoff_max_s=4.0)
+        delays = {round(limiter.backoff_delay(10), 3) for _ in range(20)}
+        assert len(delays) > 1
+        assert max(delays) <= 4.0
+
+
+class TestErrorClassification:
+    def test_is_retryable(self):
+        assert is_retryable(QuotaError())
+        assert is_retryable(Exception("429 RESOURCE_EXHAUSTED"))
+        assert not is_retryable(Exception("API key not valid"))
+
+    def test_retry_after_from_header(self):
+        error = QuotaError()
+        error.response = SimpleNamespace(headers={"Retry-After": "12"})
+        assert retry_after_from_error(error) == 12
@@ -0,0 +1,55 @@
+"""
+Test suite for the risk map API's metrics and health probes (backend/risk_map/app.py).
+"""
+
+import sys
+import os
+import asyncio
+import importlib.util
+
+import pytest
+from fastapi.testclient import TestClient
+
+RISK_MAP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend", "risk_map")
+
+
+@pytest.fixture(scope="module")
+def risk_map_app():
+    # Loaded like the backend image does: risk_map/ on the path, modules imported top-level
+    sys.path.insert(0, RISK_MAP_DIR)
+    try:
+        spec = importlib.util.spec_from_file_location("risk_map_app", os.path.join(RISK_MAP_DIR, "app.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(RISK_MAP_DIR)
+    return module
+
+
+class TestRiskMapMetrics:
+    def test_requests_are_counted(self, risk_map_app):
+        client = TestClient(risk_map_app.app)
+        client.get("/health")
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert 'http_requests_total{app="risk_map",method="GET",route="/health",status="200"}' in response.text
+        assert "event_loop_lag_seconds" in response.text
+
+
+class TestRiskMapReadiness:
+    def test_ready_once_warmup_has_run(self, risk_map_app, monkeypatch):
+        warmup = risk_map_app.Warmup(enabled=True, only="")
+        warmup.add("services", lambda: None)
+        monkeypatch.setattr(risk_map_app, "warmup", warmup)
+        client = TestClient(risk_map_app.app)
+
+        assert client.get("/health/live").json() == {"status": "alive"}
+        assert client.get("/health/ready").status_code == 503
+
+        asyncio.run(warmup.run())
+        response = client.get("/health/ready")
+
+        assert response.status_code == 200
+        assert response.json()["steps"][0]["status"] == "ok"
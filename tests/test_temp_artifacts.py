@@ -0,0 +1,49 @@
+"""
+Test suite for the legacy temp directory cleanup (engine/temp_artifacts.py).
+"""
+
+import sys
+import os
+import time
+
+import pytest
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine.temp_artifacts import TempArtifactSweeper
+
+
+@pytest.fixture
+def sweeper(tmp_path):
+    return TempArtifactSweeper(ttl_s=60, legacy_dirs=[tmp_path])
+
+
+class TestTempArtifactSweeper:
+    def test_legacy_dir_sweep(self, sweeper, tmp_path):
+        old_file = tmp_path / "abc_input.png"
+        new_file = tmp_path / "def_input.png"
+        old_file.write_bytes(b"old")
+        new_file.write_bytes(b"new")
+        os.utime(old_file, (time.time() - 120, time.time() - 120))
+
+        assert sweeper.sweep_legacy_dirs() == 1
+        assert not old_file.exists() and new_file.exists()
+
+        usage = sweeper.usage()
+        assert (usage["files"], usage["bytes"], usage["removed_total"]) == (1, 3, 1)
+
+    def test_background_cleanup_thread(self, sweeper):
+        sweeper.gc_interval_s = 0.01
+        sweeper.start()
+        try:
+            assert sweeper._gc_thread.is_alive()
+        finally:
+            sweeper.stop()
+        assert sweeper._gc_thread is None
+
+    def test_disabled_without_legacy_dirs(self):
+        sweeper = TempArtifactSweeper(legacy_dirs=[])
+        sweeper.start()
+        assert sweeper._gc_thread is None
+        assert sweeper.usage()["sweep_enabled"] is False
@@ -0,0 +1,65 @@
+"""
+Test suite for the Gemini upload encoder (engine/upload_encoder.py).
+"""
+
+import sys
+import os
+import io
+
+import numpy as np
+from PIL import Image
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine.upload_encoder import encode_for_upload
+
+
+def noisy_image(size, seed=0) -> Image.Image:
+    """Photo-like worst case for JPEG: every pixel different."""
+    rng = np.random.default_rng(seed)
+    return Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8), 'RGB')
+
+
+class TestUploadEncoder:
+    def test_small_image_is_sent_as_is(self):
+        upload = encode_for_upload(Image.new('RGB', (400, 300), color=(180, 140, 120)), quality=92)
+
+        settings = upload.settings
+        assert (settings.width, settings.height, settings.quality) == (400, 300, 92)
+        assert settings.budget_met and settings.bytes == len(upload.data)
+        assert Image.open(io.BytesIO(upload.data)).format == "JPEG"
+
+    def test_pixel_budget_keeps_aspect_ratio(self):
+        upload = encode_for_upload(Image.new('RGB', (4000, 3000)), max_pixels=1_000_000)
+
+        settings = upload.settings
+        assert settings.width * settings.height <= 1_000_000
+        assert abs(settings.width / settings.height - 4 / 3) < 0.01
+        assert settings.source_width == 4000 and settings.scale < 0.3
+
+    def test_quality_is_lowered_before_resolution(self):
+        image = noisy_image((300, 300))
+        full = encode_for_upload(image, max_bytes=10**7, quality=92)
+
+        upload = encode_for_upload(image, max_bytes=int(full.settings.bytes * 0.7), quality=92, min_quality=50)
+
+        assert upload.settings.budget_met
+        assert upload.settings.width == 300
+        assert 50 <= upload.settings.quality < 92
+
+    def test_resolution_shrinks_when_quality_is_not_enough(self):
+        upload = encode_for_upload(noisy_image((1200, 900)), max_bytes=300_000, min_quality=80)
+
+        settings = upload.settings
+        assert settings.budget_met
+        assert settings.width < 1200 and settings.quality >= 80
+
+    def test_face_is_not_shrunk_below_minimum(self):
+        upload = encode_for_upload(noisy_image((1200, 900)), face_px=600, max_bytes=20_000,
+                                   min_quality=80, min_face_px=400)
+
+        settings = upload.settings
+        assert settings.face_px >= 399
+        assert not settings.budget_met
+        assert settings.as_dict()["scale"] == round(settings.width / 1200, 4)
@@ -0,0 +1,64 @@
+"""
+Test suite for image I/O utilities.
+Tests encoded-image passthrough and single re-encoding.
+"""
+
+import base64
+import io
+import sys
+import os
+
+import pytest
+from PIL import Image
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine.utils import EncodedImage, load_encoded_image, load_image
+
+
+def encode(image: Image.Image, format: str) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=format)
+    return buffer.getvalue()
+
+
+class TestEncodedImage:
+    """Test suite for EncodedImage."""
+
+    @pytest.fixture
+    def png_bytes(self):
+        return encode(Image.new('RGB', (32, 24), color=(1, 2, 3)), 'PNG')
+
+    def test_matching_format_is_passed_through(self, png_bytes):
+        """Stored PNG bytes are returned as-is without decoding."""
+        encoded = EncodedImage(data=png_bytes, mime_type='image/png')
+        assert encoded.encode('PNG') is png_bytes
+        assert encoded._image is None
+
+    def test_size_reads_header_only(self, png_bytes):
+        """The size is available without decoding the pixels."""
+        encoded = EncodedImage(data=png_bytes, mime_type='image/png')
+        assert encoded.size == (32, 24)
+        assert encoded._image is None
+
+    def test_other_format_is_encoded_once(self, png_bytes):
+        """A different output format is encoded on first use and then cached."""
+        encoded = EncodedImage(data=png_bytes, mime_type='image/png')
+        first = encoded.encode('JPEG', quality=80)
+        assert first.startswith(b'\xff\xd8\xff')
+        assert encoded.encode('JPEG', quality=80) is first
+
+    def test_upload_needing_conversion_is_re_encoded(self):
+        """Uploads whose pixels were normalized are not echoed back unchanged."""
+        rgba_png = encode(Image.new('RGBA', (8, 8), color=(1, 2, 3, 128)), 'PNG')
+        encoded = EncodedImage.from_upload(rgba_png)
+        assert encoded.image.mode == 'RGB'
+        assert encoded.encode('PNG') != rgba_png
+
+    def test_load_encoded_image_matches_load_image(self, png_bytes):
+        """Base64 input decodes to the same pixels as load_image."""
+        base64_str = 'data:image/png;base64,' + base64.b64encode(png_bytes).decode('utf-8')
+        encoded = load_encoded_image(base64_str)
+        assert encoded.data == png_bytes
+        assert encoded.image.tobytes() == load_image(base64_str).tobytes()
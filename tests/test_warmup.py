@@ -0,0 +1,79 @@
+"""
+Test suite for the startup warm-up (api/warmup.py).
+"""
+
+import sys
+import os
+import asyncio
+
+import pytest
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.warmup import Warmup, WarmupSkipped, OK, FAILED, SKIPPED
+
+
+def run(warmup):
+    asyncio.run(warmup.run())
+
+
+class TestWarmup:
+    def test_runs_sync_and_async_steps_in_order(self):
+        order = []
+
+        async def gemini():
+            order.append("gemini")
+
+        warmup = Warmup(enabled=True)
+        warmup.add("segmentation", lambda: order.append("segmentation"))
+        warmup.add("gemini", gemini)
+        assert not warmup.ready
+
+        run(warmup)
+
+        assert order == ["segmentation", "gemini"]
+        assert warmup.ready
+        assert [step.status for step in warmup.steps] == [OK, OK]
+
+    def test_failures_and_skips_are_reported_but_do_not_block_readiness(self):
+        def broken():
+            raise RuntimeError("no FaceMesh")
+
+        def no_key():
+            raise WarmupSkipped("GOOGLE_API_KEY not set")
+
+        warmup = Warmup(enabled=True)
+        warmup.add("segmentation", broken)
+        warmup.add("gemini", no_key)
+        run(warmup)
+
+        status = warmup.status()
+        assert status["ready"]
+        assert status["steps"][0]["status"] == FAILED
+        assert "no FaceMesh" in status["steps"][0]["error"]
+        assert status["steps"][1]["status"] == SKIPPED
+        assert status["steps"][1]["error"] == "GOOGLE_API_KEY not set"
+
+    def test_step_timeout(self):
+        async def hangs():
+            await asyncio.sleep(10)
+
+        warmup = Warmup(enabled=True, step_timeout_s=0.01)
+        warmup.add("gemini", hangs)
+        run(warmup)
+        assert warmup.steps[0].status == FAILED
+
+    def test_only_selected_steps_run(self):
+        calls = []
+        warmup = Warmup(enabled=True, only="prompts")
+        warmup.add("segmentation", lambda: calls.append("segmentation"))
+        warmup.add("prompts", lambda: calls.append("prompts"))
+        run(warmup)
+        assert calls == ["prompts"]
+        assert warmup.steps[0].status == SKIPPED
+
+    def test_disabled_is_ready_immediately(self):
+        warmup = Warmup(enabled=False)
+        warmup.add("segmentation", lambda: None)
+        assert warmup.ready
@@ -0,0 +1,220 @@
+"""
+Test suite for the Gemini worker pool (engine/worker_pool.py, engine/worker_protocol.py).
+Workers are small stand-in scripts speaking the same protocol, so no Gemini access is needed.
+"""
+
+import sys
+import os
+import io
+import asyncio
+
+import pytest
+from PIL import Image
+
+# Add parent directory to path for imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import edit_gemini, rate_limit
+from engine.worker_pool import GeminiWorkerPool, WorkerDiedError
+from engine.worker_protocol import encode_frame, read_frame, ProtocolError
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FAKE_WORKER = f"""
+import os, sys, time
+sys.path.insert(0, {ROOT_DIR!r})
+from engine.worker_protocol import read_frame, write_frame
+
+responses = sys.stdout.buffer
+write_frame(responses, {{"type": "ready", "pid": os.getpid()}})
+while True:
+    try:
+        header, blobs = read_frame(sys.stdin.buffer)
+    except EOFError:
+        break
+    if header["type"] == "shutdown":
+        break
+    if header["type"] == "ping":
+        write_frame(responses, {{"type": "pong"}})
+        continue
+    if header["area"] == "crash":
+        os._exit(3)
+    if header["area"] == "hang":
+        time.sleep(60)
+    if header["area"] == "overload":
+        write_frame(responses, {{"type": "error", "error": "503 UNAVAILABLE: busy", "error_type": "overload", "stderr": ""}})
+        continue
+    if header["area"] == "env":
+        write_frame(responses, {{"type": "result", "rate_processes": os.environ.get("GEMINI_RATE_PROCESSES")}})
+        continue
+    if header["area"] == "broken":
+        write_frame(responses, {{"type": "error", "error": "bad prompt", "error_type": "other", "stderr": ""}})
+        continue
+    # Echo the input image back
+    write_frame(responses, {{"type": "result", "model": "fake", "pid": os.getpid(), "stderr": ""}}, blobs[:1])
+"""
+
+
+@pytest.fixture
+def worker_command(tmp_path):
+    script = tmp_path / "fake_worker.py"
+    script.write_text(FAKE_WORKER)
+    return [sys.executable, str(script)]
+
+
+def job(area="lips", volume_ml=1.0):
+    return {"type": "job", "area": area, "volume_ml": volume_ml}
+
+
+class TestProtocol:
+    def test_round_trip(self):
+        stream = io.BytesIO(encode_frame({"type": "job", "area": "lips"}, [b"image", b""]))
+        header, blobs = read_frame(stream)
+        assert header["area"] == "lips"
+        assert blobs == [b"image", b""]
+
+    def test_truncated_frame(self):
+        stream = io.BytesIO(encode_frame({"type": "job"}, [b"image"])[:-2])
+        with pytest.raises(EOFError):
+            read_frame(stream)
+
+    def test_invalid_header(self):
+        stream = io.BytesIO(b"\x00\x00\x00\x03abc")
+        with pytest.raises(ProtocolError):
+            read_frame(stream)
+
+
+class TestWorkerErrorType:
+    def test_overload_of_any_model_is_reported(self):
+        import gemini_worker
+
+        failed = gemini_worker.AllModelsFailed([RuntimeError("503 UNAVAILABLE: model overloaded"),
+                                                RuntimeError("404 NOT_FOUND: model retired")])
+
+        assert gemini_worker.error_type(failed) == "overload"
+        assert gemini_worker.error_type(gemini_worker.AllModelsFailed([])) == "other"
+        assert gemini_worker.error_type(ValueError("Unsupported area")) == "other"
+
+
+class TestWorkerPool:
+    def test_jobs_reuse_workers(self, worker_command):
+        async def scenario():
+            pool = GeminiWorkerPool(size=2, command=worker_command)
+            try:
+                results = await asyncio.gather(*(pool.submit(job(), [b"img%d" % i]) for i in range(6)))
+                assert [blobs[0] for _, blobs in results] == [b"img%d" % i for i in range(6)]
+                assert len({header["pid"] for header, _ in results}) == 2
+                assert sum(pool.stats()["jobs_done"]) == 6
+            finally:
+                await pool.stop()
+
+        asyncio.run(scenario())
+
+    def test_recycles_after_max_jobs(self, worker_command):
+        async def scenario():
+            pool = GeminiWorkerPool(size=1, max_jobs=2, command=worker_command)
+            try:
+                pids = [(await pool.submit(job(), [b"x"]))[0]["pid"] for _ in range(4)]
+                assert pids[0] == pids[1] != pids[2] == pids[3]
+                assert pool.recycled >= 1
+            finally:
+                await pool.stop()
+
+        asyncio.run(scenario())
+
+    def test_crashed_worker_is_replaced(self, worker_command):
+        async def scenario():
+            pool = GeminiWorkerPool(size=1, command=worker_command)
+            try:
+                with pytest.raises(WorkerDiedError):
+                    await pool.submit(job("crash"), [b"x"])
+                header, blobs = await pool.submit(job(), [b"again"])
+                assert blobs == [b"again"]
+            finally:
+                await pool.stop()
+
+        asyncio.run(scenario())
+
+    def test_timeout_kills_worker(self, worker_command):
+        async def scenario():
+            pool = GeminiWorkerPool(size=1, command=worker_command, timeout_s=0.5)
+            try:
+                with pytest.raises(asyncio.TimeoutError):
+                    await pool.submit(job("hang"), [b"x"])
+                header, _ = await pool.submit(job(), [b"x"])
+                assert header["type"] == "result"
+            finally:
+                await pool.stop()
+
+        asyncio.run(scenario())
+
+    def test_health_check_replaces_dead_idle_worker(self, worker_command):
+        async def scenario():
+            pool = GeminiWorkerPool(size=1, command=worker_command)
+            try:
+                await pool.start()
+                dead = pool.workers[0]
+                dead.kill()
+                await dead.process.wait()
+                await pool.check_health()
+                assert pool.workers[0] is not dead and pool.workers[0].alive
+            finally:
+                await pool.stop()
+
+        asyncio.run(scenario())
+
+    def test_running_pool_splits_the_quota(self, worker_command, monkeypatch):
+        """The API process and the spawned workers each take 1 / (1 + size) of the quota."""
+        monkeypatch.setattr(rate_limit, "_limiter", None)
+        monkeypatch.setattr(rate_limit, "_processes", None)
+        monkeypatch.setattr(rate_limit, "GEMINI_RATE_PROCESSES", 1)
+
+        async def scenario():
+            pool = GeminiWorkerPool(size=2, command=worker_command)
+            try:
+                header, _ = await pool.submit(job("env"))
+                assert header["rate_processes"] == "3"
+                assert rate_limit.get_rate_limiter().rpm == pytest.approx(rate_limit.GEMINI_RPM / 3)
+            finally:
+                await pool.stop()
+            assert rate_limit.get_rate_limiter().rpm == pytest.approx(rate_limit.GEMINI_RPM)
+
+        asyncio.run(scenario())
+
+
+class TestGenerateGeminiSimulation:
+    @pytest.fixture
+    def fake_pool(self, worker_command, monkeypatch):
+        pool = GeminiWorkerPool(size=1, command=worker_command)
+        monkeypatch.setattr(edit_gemini, "worker_pool", pool)
+        monkeypatch.setattr(edit_gemini, "worker_breaker", edit_gemini.get_circuit_breaker("test_worker"))
+        return pool
+
+    def test_result_image_from_worker(self, fake_pool):
+        async def scenario():
+            try:
+                return await edit_gemini.generate_gemini_simulation(Image.new("RGB", (32, 24), (10, 20, 30)), 2.0, "lips")
+            finally:
+                await fake_pool.stop()
+
+        result = asyncio.run(scenario())
+        assert result.size == (32, 24)
+        assert result.getpixel((0, 0)) == (10, 20, 30)
+
+    @pytest.mark.parametrize("area,message,overloaded", [
+        ("overload", "SERVER_OVERLOAD: 503 UNAVAILABLE: busy", True),
+        ("broken", "Gemini Worker Error: bad prompt", False),
+    ])
+    def test_error_type_feeds_the_breaker(self, fake_pool, monkeypatch, area, message, overloaded):
+        outcomes = []
+        monkeypatch.setattr(edit_gemini.worker_breaker, "record", lambda failed, latency_s=0.0: outcomes.append(failed))
+
+        async def scenario():
+            try:
+                await edit_gemini.generate_gemini_simulation(Image.new("RGB", (8, 8)), 2.0, area)
+            finally:
+                await fake_pool.stop()
+
+        with pytest.raises(RuntimeError, match=message):
+            asyncio.run(scenario())
+        assert outcomes == [overloaded]